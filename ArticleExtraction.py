@@ -1,41 +1,289 @@
-import pandas as pd
 import re
-from collections import defaultdict
-from urllib.parse import urljoin
+import asyncio
+import os
+import random
+import threading
+from collections import OrderedDict, defaultdict
+from functools import lru_cache
+from urllib.parse import parse_qs, urljoin, urlparse
 from urllib.robotparser import RobotFileParser
 import requests
-from bs4 import BeautifulSoup
+from requests.adapters import HTTPAdapter
+from bs4 import BeautifulSoup, SoupStrainer
 import time
+from metrics import count, span
+from sqlite_store import connect
+
+HEADERS = {"User-Agent": "Mozilla/5.0 (compatible; SafeScraper/1.0)"}
+POOL_SIZE = 32
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+# Default spacing in seconds between two requests to the same host, unless robots.txt asks for more
+MIN_INTERVAL = 0.5
+VALIDATOR_PATH = "output/http_cache.sqlite"
+EXPORT_EXTENSIONS = {
+    "text/csv": ".csv",
+    "application/vnd.ms-excel": ".xls",
+    "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet": ".xlsx",
+}
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def get_session():
+    """Return the shared requests session so every fetch reuses one keep-alive connection pool."""
+    global _session
+    with _session_lock:
+        if _session is None:
+            session = requests.Session()
+            session.headers.update(HEADERS)
+            adapter = HTTPAdapter(pool_connections=POOL_SIZE, pool_maxsize=POOL_SIZE)
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            _session = session
+    return _session
+
+
+class RobotsCache:
+    """Per-host robots.txt policies shared by all scraping entry points.
+
+    Policies expire after `ttl` seconds and the least recently used host is evicted
+    once more than `max_hosts` are cached. Failed robots.txt fetches are cached for
+    `error_ttl` seconds and deny scraping, as the uncached check did.
+    """
+
+    def __init__(self, ttl=3600, max_hosts=256, error_ttl=60):
+        self.ttl = ttl
+        self.max_hosts = max_hosts
+        self.error_ttl = error_ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._policies = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _fetch(self, robots_url):
+        rp = RobotFileParser()
+        rp.set_url(robots_url)
+        try:
+            response = get_session().get(robots_url, timeout=10)
+        except requests.RequestException:
+            return None
+        if response.status_code in (401, 403):
+            rp.disallow_all = True
+        elif 400 <= response.status_code < 500:
+            rp.allow_all = True
+        elif response.status_code >= 500:
+            return None
+        else:
+            rp.parse(response.text.splitlines())
+        return rp
+
+    def policy(self, url):
+        """Return the cached RobotFileParser for the host of `url` (None if robots.txt could not be read)."""
+        robots_url = urljoin(url, "/robots.txt")
+        now = time.monotonic()
+        with self._lock:
+            entry = self._policies.get(robots_url)
+            if entry is not None and entry[0] > now:
+                self._policies.move_to_end(robots_url)
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+
+        rp = self._fetch(robots_url)
+        expires = now + (self.ttl if rp is not None else self.error_ttl)
+        with self._lock:
+            self._policies[robots_url] = (expires, rp)
+            self._policies.move_to_end(robots_url)
+            while len(self._policies) > self.max_hosts:
+                self._policies.popitem(last=False)
+                self.evictions += 1
+        return rp
+
+    def can_fetch(self, url, user_agent="*"):
+        rp = self.policy(url)
+        return rp is not None and rp.can_fetch(user_agent, url)
+
+    def crawl_delay(self, url, user_agent="*"):
+        """Return the host's Crawl-delay in seconds, or 0 when none is declared."""
+        rp = self.policy(url)
+        if rp is None:
+            return 0.0
+        return float(rp.crawl_delay(user_agent) or 0)
+
+    def clear(self):
+        with self._lock:
+            self._policies.clear()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hosts": len(self._policies),
+            }
+
+
+robots_cache = RobotsCache()
+
 
 def can_scrape(url):
     """Check robots.txt to see if scraping is allowed."""
-    robots_url = urljoin(url, "/robots.txt")
-    rp = RobotFileParser()
-    rp.set_url(robots_url)
-    try:
-        rp.read()
-        return rp.can_fetch("*", url)
-    except:
-        return False
+    return robots_cache.can_fetch(url)
 
-def scrape_post_urls(url):
-    """Scrape and return all <a> tags from the div with id 'consnav' EXCEPT those inside spans,
-    and download the XLS file from the sidebar if available, from the given URL if allowed.
+
+def robots_cache_stats():
+    """Return hit/miss counters of the shared robots.txt cache."""
+    return robots_cache.stats()
+
+
+class ValidatorStore:
+    """SQLite store of the HTTP validators (ETag / Last-Modified) of fetched URLs.
+
+    Pages are stored with their last body, so a 304 Not Modified answer to a
+    conditional GET can be served from here; downloads are stored with the path of
+    the file they were saved to.
     """
-    if not can_scrape(url):
-        print("Scraping is not allowed by robots.txt")
-        return []
 
-    headers = {"User-Agent": "Mozilla/5.0 (compatible; SafeScraper/1.0)"}
+    def __init__(self, path=VALIDATOR_PATH):
+        self.path = path
+        self.not_modified = 0
+        self.fetched = 0
+        self._lock = threading.Lock()
+        self._conn = connect(path)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS validators ("
+            "url TEXT PRIMARY KEY, etag TEXT, last_modified TEXT, body BLOB, path TEXT, fetched REAL)"
+        )
+        self._conn.commit()
+
+    def get(self, url):
+        """Return {etag, last_modified, body, path} for `url`, or None if it was never stored."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT etag, last_modified, body, path FROM validators WHERE url = ?", (url,)
+            ).fetchone()
+        if row is None:
+            return None
+        return dict(zip(("etag", "last_modified", "body", "path"), row))
+
+    def put(self, url, response, body=None, path=None):
+        """Store the validators of `response`; responses without any are not stored."""
+        etag = response.headers.get("ETag")
+        last_modified = response.headers.get("Last-Modified")
+        if not etag and not last_modified:
+            return
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO validators (url, etag, last_modified, body, path, fetched) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (url, etag, last_modified, body, path, time.time()),
+            )
+            self._conn.commit()
+
+    def record(self, not_modified):
+        with self._lock:
+            if not_modified:
+                self.not_modified += 1
+            else:
+                self.fetched += 1
+
+    def stats(self):
+        with self._lock:
+            return {"not_modified": self.not_modified, "fetched": self.fetched}
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM validators")
+            self._conn.commit()
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
 
+
+_validators = None
+_validators_path = VALIDATOR_PATH
+_validators_lock = threading.Lock()
+
+
+def configure_validator_store(path=VALIDATOR_PATH):
+    """Use the validator store at `path` for conditional GETs; None disables them."""
+    global _validators, _validators_path
+    with _validators_lock:
+        if _validators is not None:
+            _validators.close()
+        _validators = None
+        _validators_path = path
+
+
+def get_validator_store():
+    """Return the shared validator store, opening it on first use (None when disabled)."""
+    global _validators
+    with _validators_lock:
+        if _validators is None and _validators_path:
+            _validators = ValidatorStore(_validators_path)
+        return _validators
+
+
+def _conditional_headers(cached):
+    headers = {}
+    if cached:
+        if cached["etag"]:
+            headers["If-None-Match"] = cached["etag"]
+        if cached["last_modified"]:
+            headers["If-Modified-Since"] = cached["last_modified"]
+    return headers
+
+
+def _send(url):
+    """GET `url`, conditionally when a stored body can stand in for a 304; returns (response, stored entry)."""
+    store = get_validator_store()
+    cached = store.get(url) if store is not None else None
+    if cached is not None and cached["body"] is None:
+        cached = None
+    response = get_session().get(url, headers=_conditional_headers(cached), timeout=10)
+    return response, cached
+
+
+def _page_text(url, response, cached):
+    """Text of a page fetched with _send: the stored body on 304 Not Modified, otherwise the
+    response's, whose validators are then stored. Raises HTTPError for error statuses."""
+    store = get_validator_store()
+    if response.status_code == 304 and cached is not None:
+        store.record(not_modified=True)
+        count("not_modified")
+        return cached["body"].decode("utf-8")
+    response.raise_for_status()
+    count("bytes", len(response.content))
+    if store is not None:
+        store.record(not_modified=False)
+        store.put(url, response, body=response.text.encode("utf-8"))
+    return response.text
+
+
+def fetch_page(url):
+    """Return the text of `url`, using a conditional GET when it was fetched before."""
+    response, cached = _send(url)
+    return _page_text(url, response, cached)
+
+
+@lru_cache(maxsize=None)
+def html_parser():
+    """lxml when it is installed (several times faster), the pure-Python parser otherwise."""
     try:
-        response = requests.get(url, headers=headers, timeout=10)
-        response.raise_for_status()
-    except requests.RequestException as e:
-        print(f"Request failed: {e}")
-        return []
+        import lxml  # noqa: F401
+    except ImportError:
+        return "html.parser"
+    return "lxml"
+
 
-    soup = BeautifulSoup(response.text, "html.parser")
+def parse_post_urls(html):
+    """Return the consnav links (except those inside spans) found in a consultation page."""
+    # Only the consnav subtree is built; the rest of the page is skipped by the tokenizer
+    soup = BeautifulSoup(html, html_parser(), parse_only=SoupStrainer("div", id="consnav"))
     post_contents = []
 
     consnav_div = soup.find("div", id="consnav")
@@ -48,55 +296,13 @@ def scrape_post_urls(url):
     else:
         print("Div with id='consnav' not found on the page.")
 
-    # Download XLS file from sidebar (comments)
-    # sidebar_div = soup.find("div", id="sidebar")
-    # if sidebar_div:
-    #     sidespot_divs = sidebar_div.find_all("div", class_="sidespot")
-    #     for sidespot_div in sidespot_divs:
-    #         export_span = sidespot_div.find("span", class_="export")
-    #         if export_span:
-    #             link_tag = export_span.find("a", href=True)
-    #             if link_tag:
-    #                 xls_link = link_tag["href"]
-    #                 filename_to_save = "comments.xls"
-    #                 try:
-    #                     response = requests.get(xls_link, stream=True)
-    #                     response.raise_for_status()
-    #
-    #                     with open(filename_to_save, "wb") as f:
-    #                         for chunk in response.iter_content(chunk_size=8192):
-    #                             f.write(chunk)
-    #
-    #                     print(f"XLS file downloaded successfully and saved as {filename_to_save}")
-    #                     return post_contents
-    #                 except requests.RequestException as e:
-    #                     print(f"Failed to download XLS file: {e}")
-    #             else:
-    #                 print("XLS download link not found in export span.")
-    #             break
-    #     else:
-    #         print("Span with class='export' not found in any sidespot div.")
-    # else:
-    #     print("Div with id='sidebar' not found on the page.")
-
     return post_contents
 
-def scrape_post_content(url):
-    """Scrape and return content from <div>.post_content and <h3> from <div>.post clearfix."""
-    if not can_scrape(url):
-        print("Scraping is not allowed by robots.txt")
-        return [], []
 
-    headers = {"User-Agent": "Mozilla/5.0 (compatible; SafeScraper/1.0)"}
-
-    try:
-        response = requests.get(url, headers=headers, timeout=10)
-        response.raise_for_status()
-    except requests.RequestException as e:
-        print(f"Request failed: {e}")
-        return [], []
-
-    soup = BeautifulSoup(response.text, "html.parser")
+def parse_post_content(html):
+    """Return the <div>.post_content texts and the <h3> titles from <div>.post clearfix."""
+    soup = BeautifulSoup(html, html_parser(),
+                         parse_only=SoupStrainer("div", class_=["post_content", "post clearfix"]))
 
     post_contents = [div.get_text() for div in soup.find_all("div", class_="post_content")]
 
@@ -109,3 +315,287 @@ def scrape_post_content(url):
 
     return post_contents, post_titles
 
+
+def parse_comments_export_url(html, page_url):
+    """Return the comments export link of the sidebar (div#sidebar > div.sidespot > span.export), or None."""
+    soup = BeautifulSoup(html, html_parser(), parse_only=SoupStrainer("div", id="sidebar"))
+    sidebar_div = soup.find("div", id="sidebar")
+    if not sidebar_div:
+        print("Div with id='sidebar' not found on the page.")
+        return None
+    for sidespot_div in sidebar_div.find_all("div", class_="sidespot"):
+        export_span = sidespot_div.find("span", class_="export")
+        if export_span:
+            link_tag = export_span.find("a", href=True)
+            if not link_tag:
+                print("XLS download link not found in export span.")
+                return None
+            return urljoin(page_url, link_tag["href"])
+    print("Span with class='export' not found in any sidespot div.")
+    return None
+
+
+def download_comments(export_url, directory, basename="comments"):
+    """Download a comments export into `directory`, unless the copy saved there before is unchanged.
+
+    The request is conditional on the validators stored at the last download, so an
+    unchanged export costs a 304 instead of the whole file. The extension follows the
+    response's Content-Type (.xls when unknown). Returns the file path, or None on failure.
+    """
+    store = get_validator_store()
+    cached = store.get(export_url) if store is not None else None
+    # Only a copy already in `directory` can stand in for the download
+    if cached is not None and not (cached["path"] and os.path.exists(cached["path"])
+                                   and os.path.dirname(os.path.abspath(cached["path"])) == os.path.abspath(directory)):
+        cached = None
+
+    part_path = None
+    try:
+        response = get_session().get(export_url, headers=_conditional_headers(cached), stream=True, timeout=60)
+        if response.status_code == 304 and cached is not None:
+            response.close()
+            store.record(not_modified=True)
+            count("not_modified")
+            return cached["path"]
+        response.raise_for_status()
+
+        content_type = response.headers.get("Content-Type", "").split(";")[0].strip().lower()
+        extension = os.path.splitext(urlparse(export_url).path)[1].lower()
+        extension = EXPORT_EXTENSIONS.get(content_type) or (extension if extension in (".csv", ".xls", ".xlsx") else ".xls")
+        path = os.path.join(directory, basename + extension)
+        os.makedirs(directory, exist_ok=True)
+        # Written next to the target and renamed, so an interrupted download never replaces a good file
+        part_path = path + ".part"
+        with open(part_path, "wb") as f:
+            for chunk in response.iter_content(chunk_size=8192):
+                f.write(chunk)
+                count("bytes", len(chunk))
+        os.replace(part_path, path)
+    except requests.RequestException as e:
+        print(f"Failed to download XLS file: {e}")
+        return None
+    finally:
+        if part_path is not None and os.path.exists(part_path):
+            os.remove(part_path)
+
+    if store is not None:
+        store.record(not_modified=False)
+        store.put(export_url, response, path=path)
+    print(f"XLS file downloaded successfully and saved as {path}")
+    return path
+
+
+def scrape_post_urls(url, comments_dir=None):
+    """Scrape and return all <a> tags from the div with id 'consnav' EXCEPT those inside spans,
+    and download the XLS file from the sidebar into `comments_dir` if one is given, from the given URL if allowed.
+    """
+    if not can_scrape(url):
+        print("Scraping is not allowed by robots.txt")
+        return []
+
+    try:
+        html = fetch_page(url)
+    except requests.RequestException as e:
+        print(f"Request failed: {e}")
+        return []
+
+    post_contents = parse_post_urls(html)
+
+    # Download XLS file from sidebar (comments)
+    if comments_dir is not None:
+        export_url = parse_comments_export_url(html, url)
+        if export_url:
+            download_comments(export_url, comments_dir)
+
+    return post_contents
+
+
+def scrape_comments_export(url, directory):
+    """Download the comments export of the consultation at `url` into `directory`; returns its path or None."""
+    if not can_scrape(url):
+        print("Scraping is not allowed by robots.txt")
+        return None
+    try:
+        html = fetch_page(url)
+    except requests.RequestException as e:
+        print(f"Request failed: {e}")
+        return None
+    export_url = parse_comments_export_url(html, url)
+    return download_comments(export_url, directory) if export_url else None
+
+
+def parse_consultation_urls(html, index_url):
+    """Return the consultation links (<ministry path>?p=<id>) of a ministry index page, in page order,
+    and the link to the next index page if there is one."""
+    soup = BeautifulSoup(html, html_parser(), parse_only=SoupStrainer("a"))
+    index = urlparse(index_url)
+    urls = []
+    for a_tag in soup.find_all("a", href=True):
+        link = urlparse(urljoin(index_url, a_tag["href"]))
+        query = parse_qs(link.query)
+        if (link.netloc == index.netloc and link.path.rstrip("/") == index.path.rstrip("/")
+                and list(query) == ["p"] and query["p"][0].isdigit()):
+            url = f"{link.scheme}://{link.netloc}{link.path}?p={query['p'][0]}"
+            if url not in urls:
+                urls.append(url)
+
+    next_tag = (soup.find("a", rel="next", href=True)
+                or soup.find("a", class_=re.compile(r"\bnext|nextpostslink"), href=True))
+    next_url = urljoin(index_url, next_tag["href"]) if next_tag else None
+    return urls, next_url
+
+
+def scrape_ministry_index(url, max_pages=100):
+    """Return every consultation URL listed on a ministry's index (e.g. https://www.opengov.gr/ypepth/),
+    following its pagination for at most `max_pages` pages."""
+    urls = []
+    seen_pages = set()
+    while url and url not in seen_pages and len(seen_pages) < max_pages:
+        seen_pages.add(url)
+        if not can_scrape(url):
+            print(f"Scraping is not allowed by robots.txt: {url}")
+            break
+        try:
+            response = get_session().get(url, timeout=10)
+            response.raise_for_status()
+        except requests.RequestException as e:
+            print(f"Request failed: {e}")
+            break
+        page_urls, url = parse_consultation_urls(response.text, response.url)
+        urls.extend(page_url for page_url in page_urls if page_url not in urls)
+    return urls
+
+
+def scrape_post_content(url):
+    """Scrape and return content from <div>.post_content and <h3> from <div>.post clearfix."""
+    with span("scrape", url=url):
+        if not can_scrape(url):
+            print("Scraping is not allowed by robots.txt")
+            return [], []
+
+        try:
+            html = fetch_page(url)
+        except requests.RequestException as e:
+            print(f"Request failed: {e}")
+            return [], []
+
+        return parse_post_content(html)
+
+
+class HostRateLimiter:
+    """Spaces out requests to the same host by at least `min_interval` seconds (MIN_INTERVAL
+    by default), or by the host's robots.txt Crawl-delay when that is longer."""
+
+    def __init__(self, min_interval=None):
+        self.min_interval = MIN_INTERVAL if min_interval is None else min_interval
+        self._locks = defaultdict(asyncio.Lock)
+        self._next_slot = defaultdict(float)
+
+    async def wait(self, url):
+        host = urlparse(url).netloc
+        # A robots.txt miss is a blocking fetch, so it runs in a thread and outside the host lock
+        crawl_delay = await asyncio.to_thread(robots_cache.crawl_delay, url)
+        async with self._locks[host]:
+            now = time.monotonic()
+            delay = self._next_slot[host] - now
+            if delay > 0:
+                await asyncio.sleep(delay)
+            interval = max(self.min_interval, crawl_delay)
+            self._next_slot[host] = max(now, self._next_slot[host]) + interval
+
+
+async def fetch_with_retries(url, limiter, retries=3, backoff=0.5):
+    """Fetch `url` (conditionally, see fetch_page) on the shared session, retrying transient failures with jittered exponential backoff.
+
+    Only RETRY_STATUSES, connection errors and timeouts are retried; other error statuses
+    (e.g. 404) raise HTTPError on the first attempt.
+    """
+    for attempt in range(retries + 1):
+        await limiter.wait(url)
+        try:
+            response, cached = await asyncio.to_thread(_send, url)
+        except (requests.ConnectionError, requests.Timeout) as e:
+            error = e
+            retry_after = None
+        else:
+            if response.status_code not in RETRY_STATUSES:
+                return _page_text(url, response, cached)
+            error = requests.HTTPError(f"{response.status_code} for url: {url}", response=response)
+            retry_after = response.headers.get("Retry-After")
+        if attempt == retries:
+            raise error
+        delay = backoff * (2 ** attempt) + random.uniform(0, backoff)
+        if retry_after and retry_after.isdigit():
+            delay = max(delay, float(retry_after))
+        count("retries")
+        await asyncio.sleep(delay)
+
+
+async def _scrape_links(links, max_concurrency, min_interval, retries, backoff):
+    """Yield (position, post_contents, post_titles) for each link as soon as its page is parsed."""
+    semaphore = asyncio.Semaphore(max_concurrency)
+    limiter = HostRateLimiter(min_interval)
+
+    async def scrape(position, link):
+        async with semaphore:
+            # Each task runs in its own context, so concurrent fetches get separate spans
+            with span("scrape", url=link):
+                if not await asyncio.to_thread(can_scrape, link):
+                    print(f"Scraping is not allowed by robots.txt: {link}")
+                    return position, [], []
+                try:
+                    html = await fetch_with_retries(link, limiter, retries, backoff)
+                except requests.RequestException as e:
+                    print(f"Request failed: {e}")
+                    return position, [], []
+                post_contents, post_titles = parse_post_content(html)
+                return position, post_contents, post_titles
+
+    tasks = [asyncio.create_task(scrape(position, link)) for position, link in enumerate(links)]
+    try:
+        for task in asyncio.as_completed(tasks):
+            yield await task
+    finally:
+        for task in tasks:
+            task.cancel()
+
+
+async def scrape_consultation(url, max_concurrency=8, min_interval=None, retries=3, backoff=0.5):
+    """Scrape every article of the consultation at `url` concurrently.
+
+    Yields (title, content) tuples as each article page completes, so the order follows
+    network completion rather than the consnav order.
+    """
+    post_urls = await asyncio.to_thread(scrape_post_urls, url)
+    links = [link for content in post_urls for link in content['links']]
+
+    async for _, post_contents, post_titles in _scrape_links(links, max_concurrency, min_interval, retries, backoff):
+        if post_titles and post_contents:
+            yield post_titles[0], post_contents[0]
+
+
+def scrape_consultation_posts(url, max_concurrency=8, min_interval=None, retries=3, backoff=0.5, on_post=None):
+    """Blocking wrapper around the concurrent crawler that returns posts in consnav order.
+
+    `on_post(post)` is called with each post, in consnav order, as soon as it and every
+    post before it are parsed, so the caller can start on the first articles while the
+    rest are still being fetched. Exceptions it raises stop the crawl.
+    """
+    post_urls = scrape_post_urls(url)
+    links = [link for content in post_urls for link in content['links']]
+
+    async def collect():
+        posts = [None] * len(links)
+        emitted = 0
+        async for position, post_contents, post_titles in _scrape_links(links, max_concurrency, min_interval, retries, backoff):
+            print(links[position])
+            posts[position] = {
+                "Title": post_titles,
+                "Content": post_contents
+            }
+            while on_post is not None and emitted < len(posts) and posts[emitted] is not None:
+                on_post(posts[emitted])
+                emitted += 1
+        return posts
+
+    return asyncio.run(collect())
@@ -0,0 +1,155 @@
+import multiprocessing
+import os
+import re
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from urllib.parse import parse_qs, urlparse
+
+BATCH_OUTPUT_DIR = "output/consultations"
+# Max age of the shared LLM cache entries; older ones are evicted and recomputed
+CACHE_MAX_AGE = 30 * 24 * 3600
+
+
+def job_name(url):
+    """Directory name for a consultation, e.g. ypepth_6501 for https://www.opengov.gr/ypepth/?p=6501."""
+    parsed = urlparse(url)
+    ministry = parsed.path.strip("/").replace("/", "_") or parsed.netloc
+    consultation = parse_qs(parsed.query).get("p", [""])[0]
+    return re.sub(r"[^\w.-]+", "_", f"{ministry}_{consultation}" if consultation else ministry)
+
+
+def comments_for(url, pattern):
+    """Fill the comments path `pattern` ({ministry}, {p} and {name} placeholders) for a consultation URL."""
+    parsed = urlparse(url)
+    return pattern.format(ministry=parsed.path.strip("/").replace("/", "_"),
+                          p=parse_qs(parsed.query).get("p", [""])[0], name=job_name(url))
+
+
+def read_jobs(path):
+    """Read a jobs file: one `URL [COMMENTS_PATH]` per line, with # comments and blank lines ignored."""
+    jobs = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            line = line.split("#", 1)[0].strip()
+            if line:
+                url, _, comments = line.partition(" ")
+                jobs.append({"url": url, "comments": comments.strip() or None})
+    return jobs
+
+
+def ministry_jobs(index_url, comments_pattern=None, max_pages=100):
+    """One job per consultation listed on a ministry index page."""
+    from ArticleExtraction import scrape_ministry_index
+
+    return [{"url": url, "comments": comments_for(url, comments_pattern) if comments_pattern else None}
+            for url in scrape_ministry_index(index_url, max_pages)]
+
+
+def _init_worker(shared_limiters, cache_path, cache_only=False):
+    from llm_cache import configure_cache
+    from rate_limit import use_shared_limiters
+
+    # Every worker reads and writes the same SQLite LLM cache and draws from the same rate budgets
+    configure_cache(path=cache_path, max_age=CACHE_MAX_AGE, cache_only=cache_only)
+    use_shared_limiters(shared_limiters)
+
+
+def scrape_job(job, output_root=BATCH_OUTPUT_DIR, rescrape=False, min_interval=None):
+    """Only crawl one consultation into the checkpoints of its directory, without any model calls."""
+    from checkpoints import CheckpointStore
+    from pipeline import scrape_stage
+
+    output_dir = os.path.join(output_root, job_name(job["url"]))
+    summary = {"url": job["url"], "output_dir": output_dir, "pid": os.getpid()}
+    start = time.perf_counter()
+    os.makedirs(output_dir, exist_ok=True)
+    store = CheckpointStore(os.path.join(output_dir, "checkpoints.sqlite"))
+    try:
+        summary["articles"] = len(scrape_stage(store, job["url"], rescrape, min_interval))
+    except Exception as e:
+        summary["error"] = f"{type(e).__name__}: {e}"
+    finally:
+        store.close()
+    summary["seconds"] = round(time.perf_counter() - start, 3)
+    return summary
+
+
+def run_job(job, output_root=BATCH_OUTPUT_DIR, rescrape=False, graph_db_path=None, dead_letter_path=None,
+            scrape_only=False, min_interval=None):
+    """Run the pipeline, or only the crawl with `scrape_only`, for one consultation; returns a summary dict."""
+    if scrape_only:
+        return scrape_job(job, output_root, rescrape, min_interval)
+
+    from checkpoints import CheckpointStore
+    from graph_db import GraphDB
+    from metrics import configure_metrics
+    from pipeline import run
+    from rate_limit import DeadLetterQueue
+
+    output_dir = os.path.join(output_root, job_name(job["url"]))
+    summary = {"url": job["url"], "output_dir": output_dir, "pid": os.getpid()}
+    comments = job.get("comments")
+    if not comments or not os.path.exists(comments):
+        from ArticleExtraction import scrape_comments_export
+
+        # Fall back to the export linked from the consultation's sidebar; unchanged exports are not re-downloaded
+        comments = scrape_comments_export(job["url"], output_dir) or comments
+    if not comments or not os.path.exists(comments):
+        summary["error"] = f"no comments export for {job['url']} ({comments})"
+        return summary
+
+    start = time.perf_counter()
+    os.makedirs(output_dir, exist_ok=True)
+    configure_metrics(os.path.join(output_dir, "metrics.jsonl"))
+    store = CheckpointStore(os.path.join(output_dir, "checkpoints.sqlite"))
+    graph_db = GraphDB(graph_db_path) if graph_db_path else GraphDB()
+    dead_letters = DeadLetterQueue(dead_letter_path) if dead_letter_path else DeadLetterQueue()
+    try:
+        graph = run(job["url"], comments, store=store, rescrape=rescrape, graph_db=graph_db,
+                    dead_letters=dead_letters, output_dir=output_dir, min_interval=min_interval)
+        summary.update(nodes=len(graph), edges=len(graph.edges), dead_letters=len(dead_letters.items(job["url"])))
+    except Exception as e:
+        summary["error"] = f"{type(e).__name__}: {e}"
+    finally:
+        store.close()
+        graph_db.close()
+        dead_letters.close()
+        configure_metrics(None)
+    summary["seconds"] = round(time.perf_counter() - start, 3)
+    return summary
+
+
+def run_batch(jobs, workers=None, output_root=BATCH_OUTPUT_DIR, rescrape=False, cache_path=None,
+              graph_db_path=None, dead_letter_path=None, scrape_only=False, cache_only=False, min_interval=None):
+    """Run many consultations on a pool of `workers` processes, yielding each job's summary as it finishes."""
+    from graph_db import GRAPH_DB_PATH
+    from llm_cache import CACHE_PATH
+    from rate_limit import DEAD_LETTER_PATH, start_shared_limiters
+
+    workers = workers or os.cpu_count() or 1
+    # Absolute paths, so every worker opens the same files
+    cache_path = os.path.abspath(cache_path or CACHE_PATH)
+    graph_db_path = os.path.abspath(graph_db_path or GRAPH_DB_PATH)
+    dead_letter_path = os.path.abspath(dead_letter_path or DEAD_LETTER_PATH)
+    output_root = os.path.abspath(output_root)
+    if os.path.dirname(cache_path):
+        os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+
+    if workers == 1 or len(jobs) == 1:
+        _init_worker(None, cache_path, cache_only)
+        for job in jobs:
+            yield run_job(job, output_root, rescrape, graph_db_path, dead_letter_path, scrape_only, min_interval)
+        return
+
+    manager, shared_limiters = start_shared_limiters()
+    try:
+        # Spawned workers start clean instead of inheriting open SQLite connections and threads
+        with ProcessPoolExecutor(max_workers=min(workers, len(jobs)), mp_context=multiprocessing.get_context("spawn"),
+                                 initializer=_init_worker, initargs=(shared_limiters, cache_path, cache_only)) as executor:
+            futures = [executor.submit(run_job, job, output_root, rescrape, graph_db_path, dead_letter_path, scrape_only,
+                                       min_interval)
+                       for job in jobs]
+            for future in as_completed(futures):
+                yield future.result()
+    finally:
+        manager.shutdown()
@@ -0,0 +1,129 @@
+import io
+import json
+import random
+import re
+import threading
+import time
+
+ISSUES = ["Θέμα 1", "Θέμα 2"]
+
+
+class FakeBedrockClient:
+    """Stand-in for a boto3 bedrock-runtime client that answers invoke_model locally.
+
+    Relevance prompts get an integer score (or a JSON batch of scores), and
+    LLMGraphTransformer tool calls get a small canned graph: an Article with two
+    Issues, or one Position with a supporting argument per comment in the text.
+    Each call sleeps `latency` seconds and fails with a ThrottlingException with
+    probability `throttle_rate`. Graphs for more than `max_output_comments` comments
+    are cut off: an empty tool call with stop_reason max_tokens. With `positions` unset,
+    the comments take no position and their graphs only hold the Issue. With
+    `garbled_scores`, relevance replies hold no score, with `empty_scores` they have no
+    content at all, and with `truncated_issues` the Issue graphs are cut off like
+    oversized comment graphs.
+    """
+
+    def __init__(self, latency=0.05, throttle_rate=0.0, seed=0, max_output_comments=None, positions=True,
+                 garbled_scores=False, empty_scores=False, truncated_issues=False):
+        self.latency = latency
+        self.throttle_rate = throttle_rate
+        self.max_output_comments = max_output_comments
+        self.positions = positions
+        self.garbled_scores = garbled_scores
+        self.empty_scores = empty_scores
+        self.truncated_issues = truncated_issues
+        self.calls = 0
+        self.throttled = 0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def invoke_model(self, modelId, body, **kwargs):
+        request = json.loads(body)
+        with self._lock:
+            self.calls += 1
+            throttled = self._random.random() < self.throttle_rate
+            if throttled:
+                self.throttled += 1
+        time.sleep(self.latency)
+        if throttled:
+            from botocore.exceptions import ClientError
+
+            raise ClientError({"Error": {"Code": "ThrottlingException", "Message": "Rate exceeded"}}, "InvokeModel")
+
+        stop_reason = "tool_use" if request.get("tools") else "end_turn"
+        if request.get("tools"):
+            content = [self._graph_tool_use(request)]
+            comments = len(re.findall(r"Σχολιο \d+", self._text(request)))
+            if ((self.max_output_comments is not None and comments > self.max_output_comments)
+                    or (self.truncated_issues and "Issue List" not in json.dumps(request, ensure_ascii=False))):
+                content[0]["input"] = {}
+                stop_reason = "max_tokens"
+        elif self.empty_scores:
+            content = []
+        else:
+            content = [{"type": "text", "text": self._scores(request)}]
+
+        input_tokens = len(body) // 4
+        response = {
+            "id": f"msg_fake_{self.calls}",
+            "type": "message",
+            "role": "assistant",
+            "model": modelId,
+            "content": content,
+            "stop_reason": stop_reason,
+            "usage": {"input_tokens": input_tokens, "output_tokens": 20},
+        }
+        return {
+            "body": io.BytesIO(json.dumps(response, ensure_ascii=False).encode("utf-8")),
+            "ResponseMetadata": {"HTTPHeaders": {
+                "x-amzn-bedrock-input-token-count": str(input_tokens),
+                "x-amzn-bedrock-output-token-count": "20",
+            }},
+        }
+
+    @staticmethod
+    def _text(request):
+        parts = []
+        for message in request.get("messages", []):
+            content = message["content"]
+            if isinstance(content, str):
+                parts.append(content)
+            else:
+                parts.extend(block.get("text", "") for block in content)
+        return "\n".join(parts)
+
+    def _scores(self, request):
+        if self.garbled_scores:
+            return "Δεν μπορώ να βαθμολογήσω."
+        messages = request.get("messages", [])
+        prefill = ""
+        if messages and messages[-1]["role"] == "assistant":
+            prefill = self._text({"messages": [messages[-1]]})
+        if prefill.startswith("{"):
+            ids = re.findall(r'<comment id="(\d+)">', self._text(request))
+            scores = ", ".join(f'{{"id": {comment_id}, "score": {40 + int(comment_id) * 7 % 60}}}' for comment_id in ids)
+            return scores + "]}"
+        return "65"
+
+    def _graph_tool_use(self, request):
+        tool = request["tools"][0]
+        text = self._text(request)
+        if "Issue List" not in json.dumps(request, ensure_ascii=False):
+            nodes = [{"id": "Άρθρο", "type": "Article"}] + [{"id": issue, "type": "Issue"} for issue in ISSUES]
+            relationships = [{"source_node_id": "Άρθρο", "source_node_type": "Article", "target_node_id": issue,
+                              "target_node_type": "Issue", "type": "HAS"} for issue in ISSUES]
+        else:
+            nodes = [{"id": ISSUES[0], "type": "Issue"}]
+            relationships = []
+            for comment_id in re.findall(r"Σχολιο (\d+)", text) if self.positions else []:
+                position = f"Θέση σχολίου {comment_id}"
+                argument = f"Επιχείρημα σχολίου {comment_id}"
+                properties = [{"key": "comment_ids", "value": comment_id}]
+                nodes.append({"id": position, "type": "Position", "properties": properties})
+                nodes.append({"id": argument, "type": "Supported_Arguments", "properties": properties})
+                relationships.append({"source_node_id": ISSUES[0], "source_node_type": "Issue", "target_node_id": position,
+                                      "target_node_type": "Position", "type": "HAS_POSITION"})
+                relationships.append({"source_node_id": position, "source_node_type": "Position", "target_node_id": argument,
+                                      "target_node_type": "Supported_Arguments", "type": "SUPPORTED_BECAUSE"})
+        return {"type": "tool_use", "id": f"toolu_fake_{self.calls}", "name": tool["name"],
+                "input": {"nodes": nodes, "relationships": relationships}}
@@ -0,0 +1,160 @@
+import csv
+import hashlib
+import io
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+WORDS = ["κυβερνοασφάλεια", "αρχή", "δημόσιο", "υπηρεσία", "προσωπικό", "δεδομένα", "εποπτεία", "διαδικασία",
+         "πρόσβαση", "πολίτες", "υπουργείο", "ελέγχου", "συστήματα", "πληροφοριών", "ευθύνη", "κανονισμός"]
+FILLER = ["συμφωνώ", "διαφωνώ", "πιστεύω", "ότι", "πρέπει", "να", "είναι", "πιο", "σαφές", "και", "με", "για"]
+
+
+def article_title(number):
+    return f"Άρθρο {number} - Ρυθμίσεις για {WORDS[number % len(WORDS)]}"
+
+
+def article_text(number):
+    rng = random.Random(number)
+    return " ".join(rng.choice(WORDS) for _ in range(120))
+
+
+def comment_text(article, number):
+    """Synthetic comments: mostly on-topic, with short, duplicate, off-topic and borderline ones mixed in."""
+    rng = random.Random(article * 100003 + number)
+    kind = number % 10
+    if kind == 0:
+        return "Ok"
+    if kind == 1 and number > 1:
+        return comment_text(article, number - 1)
+    if kind == 2:
+        return " ".join(rng.choice(FILLER) for _ in range(25))
+    if kind in (3, 4):
+        # Loosely on-topic: left to the model by the prefilter
+        return " ".join(rng.choice(FILLER) for _ in range(30)) + " " + " ".join(rng.sample(WORDS, 3))
+    return " ".join(rng.choice(WORDS + FILLER) for _ in range(40))
+
+
+def _write_comments(f, articles, comments_per_article):
+    writer = csv.writer(f)
+    writer.writerow(["Άρθρο", "Σχόλιο"])
+    for article in range(1, articles + 1):
+        for number in range(1, comments_per_article + 1):
+            writer.writerow([article_title(article), comment_text(article, number)])
+
+
+def write_comments_csv(path, articles, comments_per_article):
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        _write_comments(f, articles, comments_per_article)
+    return path
+
+
+def comments_csv(articles, comments_per_article):
+    f = io.StringIO(newline="")
+    _write_comments(f, articles, comments_per_article)
+    return f.getvalue()
+
+
+class OpenGovFixture:
+    """Local HTTP server that mimics the opengov.gr pages the scraper reads.
+
+    /consultation is the ministry index listing `consultations` consultations,
+    /consultation?p=N lists the articles in a div#consnav, each /consultation?p=N&a=M
+    is an article page with div.post clearfix > h3 and div.post_content, and
+    /robots.txt serves `robots_txt` (allowing everything by default). Consultation pages link /export?p=N, a CSV of
+    `comments_per_article` comments per article, from a div#sidebar. Responses carry
+    an ETag and If-None-Match is answered with 304. Every response is delayed by
+    `latency` seconds.
+    """
+
+    def __init__(self, articles=10, latency=0.0, consultations=1, comments_per_article=5,
+                 robots_txt="User-agent: *\nAllow: /\n"):
+        self.articles = articles
+        self.robots_txt = robots_txt
+        self.consultations = consultations
+        self.comments_per_article = comments_per_article
+        self.latency = latency
+        self.requests = 0
+        self.not_modified = 0
+        fixture = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                fixture.requests += 1
+                time.sleep(fixture.latency)
+                status, body = fixture.page(self.path)
+                data = body.encode("utf-8")
+                etag = '"' + hashlib.sha1(data).hexdigest() + '"'
+                if status == 200 and self.headers.get("If-None-Match") == etag:
+                    fixture.not_modified += 1
+                    self.send_response(304)
+                    self.send_header("ETag", etag)
+                    self.end_headers()
+                    return
+                if status != 200:
+                    content_type = "text/plain"
+                elif urlparse(self.path).path == "/export":
+                    content_type = "text/csv; charset=utf-8"
+                else:
+                    content_type = "text/html; charset=utf-8"
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(data)))
+                if status == 200:
+                    self.send_header("ETag", etag)
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.base_url = f"http://127.0.0.1:{self.server.server_address[1]}"
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    @property
+    def index_url(self):
+        return f"{self.base_url}/consultation"
+
+    @property
+    def consultation_url(self):
+        return self.consultation_urls[0]
+
+    @property
+    def consultation_urls(self):
+        return [f"{self.index_url}?p={number}" for number in range(1, self.consultations + 1)]
+
+    def page(self, path):
+        url = urlparse(path)
+        if url.path == "/robots.txt":
+            return 200, self.robots_txt
+        if url.path == "/export":
+            return 200, comments_csv(self.articles, self.comments_per_article)
+        if url.path != "/consultation":
+            return 404, "Not found"
+        query = parse_qs(url.query)
+        if "p" not in query:
+            links = "".join(f'<li><a href="{consultation_url}">Διαβούλευση {number}</a></li>'
+                            for number, consultation_url in enumerate(self.consultation_urls, start=1))
+            return 200, f'<html><body><ul class="consultations">{links}</ul></body></html>'
+        consultation_url = f"{self.index_url}?p={query['p'][0]}"
+        if "a" not in query:
+            links = "".join(f'<li><a href="{consultation_url}&a={number}">{article_title(number)}</a></li>'
+                            for number in range(1, self.articles + 1))
+            return 200, (f'<html><body><div id="consnav"><ul>{links}'
+                         f'<li><span><a href="{consultation_url}">Όλα</a></span></li></ul></div>'
+                         f'<div id="sidebar"><div class="sidespot"><span class="export">'
+                         f'<a href="/export?p={query["p"][0]}">Σχόλια</a></span></div></div></body></html>')
+        number = int(query["a"][0])
+        return 200, (f'<html><body><div class="post clearfix"><h3>{article_title(number)}</h3>'
+                     f'<div class="post_content"><p>{article_text(number)}</p></div></div></body></html>')
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
@@ -0,0 +1,52 @@
+"""Measure the import time of the repo's modules in fresh interpreters.
+
+Usage: python benchmarks/imports.py [--repeat 3]
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+MODULES = ("main", "batch", "pipeline", "ArticleExtraction", "issue", "langwithpydantic",
+           "relevance.relevance_claude", "render", "comments", "graph_db")
+# Dependencies that should only be loaded by the stages that need them
+HEAVY = ("pandas", "numpy", "bs4", "requests", "boto3", "botocore", "langchain", "langchain_core", "langchain_aws",
+         "langchain_experimental", "langchain_community", "pyvis", "pyarrow", "openpyxl", "xlrd")
+
+PROBE = """
+import json, sys, time
+start = time.perf_counter()
+import {module}
+seconds = time.perf_counter() - start
+print(json.dumps({{"seconds": seconds, "heavy": [name for name in {heavy!r} if name in sys.modules]}}))
+"""
+
+
+def import_time(module, repeat=3):
+    """Best-of-`repeat` seconds to import `module` in a new interpreter, and the heavy dependencies it loaded."""
+    best = None
+    for _ in range(repeat):
+        output = subprocess.run([sys.executable, "-c", PROBE.format(module=module, heavy=HEAVY)], cwd=ROOT,
+                                capture_output=True, text=True, check=True).stdout
+        result = json.loads(output.strip().splitlines()[-1])
+        if best is None or result["seconds"] < best["seconds"]:
+            best = result
+    return {"module": module, "seconds": round(best["seconds"], 4), "heavy": best["heavy"]}
+
+
+def import_times(modules=MODULES, repeat=3):
+    return [import_time(module, repeat) for module in modules]
+
+
+def print_table(results):
+    for result in results:
+        print(f"{result['module']:>28} {result['seconds']:8.3f}s  {', '.join(result['heavy']) or '-'}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=3)
+    print_table(import_times(repeat=parser.parse_args().repeat))
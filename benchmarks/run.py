@@ -0,0 +1,165 @@
+"""Time every stage of the pipeline offline, against a fake Bedrock and a local OpenGov fixture.
+
+Usage: python benchmarks/run.py [--sizes 5x20,20x50] [--latency 0.05] [--http-latency 0.01]
+                                [--throttle-rate 0] [--output bench.json]
+
+Each size is ARTICLESxCOMMENTS_PER_ARTICLE. Every size runs in a fresh temporary
+directory (empty LLM cache and checkpoints), so all model calls are made. The stages
+are timed one after the other, then the whole consultation is run again on the stage
+pipeline (pipeline.run) with a fresh cache; `total` and `pipelined` compare the two.
+The import time of the entry points is measured first (see imports.py).
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+# ChatBedrock wants a region and credentials even when its client is replaced
+os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+os.environ.setdefault("AWS_ACCESS_KEY_ID", "benchmark")
+os.environ.setdefault("AWS_SECRET_ACCESS_KEY", "benchmark")
+
+STAGES = ("scrape", "join", "relevance", "issues", "positions", "merge", "render")
+
+
+def parse_sizes(text):
+    return [tuple(int(part) for part in size.split("x")) for size in text.split(",")]
+
+
+@contextmanager
+def timed(timings, stage):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings[stage] += time.perf_counter() - start
+
+
+def run_size(articles, comments_per_article, latency, http_latency, throttle_rate):
+    """Run the pipeline stages for one synthetic consultation and return the seconds spent per stage."""
+    import credentials
+    import models
+    from ArticleExtraction import configure_validator_store
+    import pipeline
+    from checkpoints import CheckpointStore
+    from graph_db import GraphDB
+    from rate_limit import DeadLetterQueue
+    from fake_bedrock import FakeBedrockClient
+    from fake_opengov import OpenGovFixture, write_comments_csv
+    from llm_cache import configure_cache
+
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as workdir:
+        os.chdir(workdir)
+        os.makedirs("output")
+        client = FakeBedrockClient(latency=latency, throttle_rate=throttle_rate)
+        models.refresh()
+        credentials.set_bedrock_client(client)
+        configure_cache(path=os.path.join(workdir, "llm_cache.sqlite"))
+        configure_validator_store(os.path.join(workdir, "http_cache.sqlite"))
+        store = CheckpointStore(os.path.join(workdir, "checkpoints.sqlite"))
+        fixture = OpenGovFixture(articles, latency=http_latency).start()
+        comments_path = write_comments_csv(os.path.join(workdir, "comments.csv"), articles, comments_per_article)
+
+        timings = defaultdict(float)
+        total_start = time.perf_counter()
+        try:
+            with timed(timings, "scrape"):
+                posts = pipeline.scrape_stage(store, fixture.consultation_url, rescrape=True, min_interval=0.0)
+            with timed(timings, "join"):
+                article_comment = pipeline.join_stage(store, posts, comments_path)
+
+            for index, article in enumerate(article_comment, start=1):
+                article_with_title = article['Title'] + '\n' + article['Content']
+                title = article['Title']
+                with timed(timings, "issues"):
+                    issue_nodes = pipeline.issues_stage(store, title, article_with_title)
+                with timed(timings, "relevance"):
+                    comments = pipeline.relevance_stage(store, title, article_with_title, article['Comments'])
+                if not comments:
+                    continue
+                with timed(timings, "positions"):
+                    results = pipeline.positions_stage(store, title, issue_nodes, comments)
+                with timed(timings, "merge"):
+                    merged_graph = pipeline.merge_stage(store, title, issue_nodes, results)
+                with timed(timings, "render"):
+                    pipeline.render_stage(store, title, merged_graph, index)
+            total = time.perf_counter() - total_start
+            model_calls = client.calls
+
+            # The same consultation end to end on the stage pipeline, with an empty cache again
+            configure_cache(path=os.path.join(workdir, "llm_cache_pipelined.sqlite"))
+            configure_validator_store(os.path.join(workdir, "http_cache_pipelined.sqlite"))
+            pipelined_store = CheckpointStore(os.path.join(workdir, "checkpoints_pipelined.sqlite"))
+            graph_db = GraphDB(os.path.join(workdir, "graph.sqlite"))
+            dead_letters = DeadLetterQueue(os.path.join(workdir, "dead_letters.sqlite"))
+            start = time.perf_counter()
+            try:
+                pipeline.run(fixture.consultation_url, comments_path, store=pipelined_store, rescrape=True,
+                             graph_db=graph_db, dead_letters=dead_letters, output_dir="output/pipelined",
+                             min_interval=0.0)
+            finally:
+                pipelined = time.perf_counter() - start
+                pipelined_store.close()
+                graph_db.close()
+                dead_letters.close()
+        finally:
+            fixture.stop()
+            store.close()
+            configure_cache()
+            configure_validator_store()
+            os.chdir(cwd)
+
+        result = {stage: round(timings[stage], 4) for stage in STAGES}
+        result.update({
+            "articles": articles,
+            "comments_per_article": comments_per_article,
+            "total": round(total, 4),
+            "pipelined": round(pipelined, 4),
+            "model_calls": model_calls,
+            "throttled": client.throttled,
+            "http_requests": fixture.requests,
+        })
+        return result
+
+
+def print_table(results):
+    columns = ("size",) + STAGES + ("total", "pipelined", "model_calls")
+    print(" ".join(f"{column:>11}" for column in columns))
+    for result in results:
+        size = f"{result['articles']}x{result['comments_per_article']}"
+        row = [size] + [f"{result[column]:.3f}" for column in STAGES + ("total", "pipelined")] + [str(result["model_calls"])]
+        print(" ".join(f"{cell:>11}" for cell in row))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", default="5x20,20x50", help="comma separated ARTICLESxCOMMENTS sizes")
+    parser.add_argument("--latency", type=float, default=0.05, help="seconds per fake model call")
+    parser.add_argument("--http-latency", type=float, default=0.01, help="seconds per fixture HTTP response")
+    parser.add_argument("--throttle-rate", type=float, default=0.0, help="share of model calls that are throttled")
+    parser.add_argument("--output", help="also write the results as JSON to this file")
+    args = parser.parse_args(argv)
+
+    from imports import import_times, print_table as print_imports
+
+    imports = import_times()
+    print_imports(imports)
+    results = [run_size(articles, comments, args.latency, args.http_latency, args.throttle_rate)
+               for articles, comments in parse_sizes(args.sizes)]
+    print_table(results)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"imports": imports, "stages": results}, f, indent=2)
+    return imports, results
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+import hashlib
+import json
+import pickle
+import threading
+import time
+from sqlite_store import connect
+
+CHECKPOINT_PATH = "output/checkpoints.sqlite"
+
+
+def fingerprint(*parts):
+    """Stable hash of a stage's inputs; a checkpoint is reused only while it is unchanged."""
+    payload = json.dumps(parts, ensure_ascii=False, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class CheckpointStore:
+    """SQLite store of per-stage, per-item pipeline outputs.
+
+    Each row holds the output of one stage for one item (an article, a comment, ...)
+    together with the fingerprint of the inputs it was computed from, so a rerun can
+    skip every item whose inputs did not change.
+    """
+
+    def __init__(self, path=CHECKPOINT_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = connect(path)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS checkpoints ("
+            "stage TEXT, item TEXT, fingerprint TEXT, value BLOB, updated REAL, "
+            "PRIMARY KEY (stage, item))"
+        )
+        self._conn.commit()
+
+    def get(self, stage, item, input_fingerprint=None):
+        """Return (found, value); with a fingerprint, a checkpoint of different inputs counts as missing."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT fingerprint, value FROM checkpoints WHERE stage = ? AND item = ?", (stage, item)
+            ).fetchone()
+        if row is None or (input_fingerprint is not None and row[0] != input_fingerprint):
+            return False, None
+        return True, pickle.loads(row[1])
+
+    def put(self, stage, item, input_fingerprint, value):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO checkpoints (stage, item, fingerprint, value, updated) VALUES (?, ?, ?, ?, ?)",
+                (stage, item, input_fingerprint, pickle.dumps(value), time.time()),
+            )
+            self._conn.commit()
+
+    def run(self, stage, item, inputs, compute, cacheable=None):
+        """Return the checkpointed output of `stage` for `item`, running `compute()` if its inputs changed.
+
+        With `cacheable`, a computed output is only checkpointed when `cacheable(output)` is true.
+        """
+        input_fingerprint = fingerprint(stage, inputs)
+        found, value = self.get(stage, item, input_fingerprint)
+        if found:
+            return value
+        value = compute()
+        if cacheable is None or cacheable(value):
+            self.put(stage, item, input_fingerprint, value)
+        return value
+
+    def items(self, stage):
+        with self._lock:
+            return [row[0] for row in self._conn.execute("SELECT item FROM checkpoints WHERE stage = ?", (stage,))]
+
+    def clear(self, stage=None):
+        with self._lock:
+            if stage is None:
+                self._conn.execute("DELETE FROM checkpoints")
+            else:
+                self._conn.execute("DELETE FROM checkpoints WHERE stage = ?", (stage,))
+            self._conn.commit()
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
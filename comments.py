@@ -0,0 +1,196 @@
+import csv
+import hashlib
+import os
+import re
+from collections import defaultdict
+
+TITLE_SEPARATOR = re.compile(r"\s*[-–]\s*")
+CACHE_DIR = "output/cache"
+BATCH_ROWS = 10000
+
+
+def normalize_title(title):
+    """Normalize an article title so the scraped and the exported spelling compare equal."""
+    return TITLE_SEPARATOR.sub(" ", title)
+
+
+class CommentIndex:
+    """Comments of an export grouped by normalized article title as the rows are read.
+
+    Only the comments are kept per article, with the first spelling of its title. With
+    `keys`, the comments of titles outside it are only counted, so the index holds no
+    more than the comments of the articles that will be joined.
+    """
+
+    def __init__(self, keys=None):
+        self.keys = keys
+        self.comments = defaultdict(list)
+        self.titles = {}
+        self.counts = defaultdict(int)
+
+    def add(self, title, comment):
+        key = normalize_title(title) if isinstance(title, str) else None
+        self.titles.setdefault(key, title)
+        self.counts[key] += 1
+        if self.keys is None or key in self.keys:
+            self.comments[key].append(comment)
+
+    def get(self, key, default=None):
+        return self.comments.get(key, default)
+
+
+def index_comments(rows, keys=None):
+    """Index the (article_title, comment) rows of a comments export by normalized article title
+    (see CommentIndex), one row at a time."""
+    index = CommentIndex(keys)
+    for row in rows:
+        index.add(row[0], row[1])
+    return index
+
+
+def join_post(post, index):
+    """Return the {"Title", "Content", "Comments"} dict of one scraped post, or None if it has no title or content."""
+    if not post or not post['Title'] or not post['Content']:
+        print(f"Skipping article without title or content: {post}")
+        return None
+    key = normalize_title(post['Title'][0])
+    return {
+        "Title": post['Title'][0],
+        "Content": post['Content'][0],
+        "Comments": list(index.get(key, []))
+    }
+
+
+def unmatched_comments(index, article_comment):
+    """Return {title: number of comments} for the titles of `index` that did not match any of the joined articles."""
+    matched = {normalize_title(article['Title']) for article in article_comment}
+    return {index.titles[key]: count for key, count in index.counts.items() if key not in matched}
+
+
+def join_comments(posts, rows):
+    """Attach the exported comments to the scraped articles in a single pass.
+
+    `posts` are the scraped {"Title": [...], "Content": [...]} dicts and `rows` the
+    (article_title, comment) rows of the comments export. Returns the list of
+    {"Title", "Content", "Comments"} dicts, in post order, and the comments that did not
+    match any article, as {title: number of comments}. Only the comments of the posts'
+    titles are kept while the rows are read.
+    """
+    keys = {normalize_title(post['Title'][0]) for post in posts if post and post['Title']}
+    index = index_comments(rows, keys)
+    article_comment = [article for article in (join_post(post, index) for post in posts) if article is not None]
+    return article_comment, unmatched_comments(index, article_comment)
+
+
+def _iter_csv(path):
+    with open(path, newline="", encoding="utf-8-sig") as f:
+        reader = csv.reader(f)
+        next(reader, None)
+        for row in reader:
+            if len(row) >= 2:
+                yield row[0], row[1]
+
+
+def _iter_xlsx(path):
+    from openpyxl import load_workbook
+
+    workbook = load_workbook(path, read_only=True, data_only=True)
+    try:
+        for row in workbook.worksheets[0].iter_rows(min_row=2, max_col=2, values_only=True):
+            yield row[0], row[1]
+    finally:
+        workbook.close()
+
+
+def _iter_xls(path):
+    import xlrd
+
+    workbook = xlrd.open_workbook(path, on_demand=True)
+    try:
+        sheet = workbook.sheet_by_index(0)
+        for idx in range(1, sheet.nrows):
+            row = sheet.row_values(idx, 0, 2)
+            yield row[0], row[1]
+    finally:
+        workbook.release_resources()
+
+
+def iter_source_rows(path):
+    """Yield (article_title, comment) rows lazily from an XLS, XLSX or CSV comments export."""
+    extension = os.path.splitext(path)[1].lower()
+    if extension == ".csv":
+        return _iter_csv(path)
+    if extension == ".xlsx":
+        return _iter_xlsx(path)
+    if extension == ".xls":
+        return _iter_xls(path)
+    raise ValueError(f"Unsupported comments export: {path}")
+
+
+def _cache_path(path, cache_dir):
+    stat = os.stat(path)
+    fingerprint = f"{os.path.abspath(path)}:{stat.st_size}:{stat.st_mtime_ns}"
+    digest = hashlib.sha256(fingerprint.encode("utf-8")).hexdigest()[:16]
+    return os.path.join(cache_dir, f"{os.path.splitext(os.path.basename(path))[0]}-{digest}.parquet")
+
+
+def _iter_parquet(cache_path):
+    import pyarrow.parquet as pq
+
+    parquet_file = pq.ParquetFile(cache_path, memory_map=True)
+    for batch in parquet_file.iter_batches(batch_size=BATCH_ROWS, columns=["article", "comment"]):
+        yield from zip(batch.column(0).to_pylist(), batch.column(1).to_pylist())
+
+
+def _iter_and_convert(path, cache_path):
+    """Stream the source rows while writing them to a Parquet file batch by batch."""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = pa.schema([("article", pa.string()), ("comment", pa.string())])
+
+    def write(batch):
+        writer.write_table(pa.table({"article": [row[0] for row in batch], "comment": [row[1] for row in batch]}, schema=schema))
+
+    tmp_path = cache_path + ".tmp"
+    writer = pq.ParquetWriter(tmp_path, schema)
+    batch = []
+    try:
+        for title, comment in iter_source_rows(path):
+            row = (None if title is None else str(title), None if comment is None else str(comment))
+            batch.append(row)
+            if len(batch) >= BATCH_ROWS:
+                write(batch)
+                batch = []
+            yield row
+        if batch:
+            write(batch)
+        writer.close()
+        os.replace(tmp_path, cache_path)
+    except BaseException:
+        writer.close()
+        os.remove(tmp_path)
+        raise
+
+
+def iter_comment_rows(path, cache_dir=CACHE_DIR):
+    """Yield (article_title, comment) rows of a comments export without loading it whole.
+
+    The first run converts the export to a Parquet file in `cache_dir` while streaming it;
+    later runs read that memory-mapped file in batches instead of parsing the spreadsheet.
+    The cache is keyed by the export's path, size and mtime. Without pyarrow the export
+    is streamed directly every time.
+    """
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        yield from iter_source_rows(path)
+        return
+
+    cache_path = _cache_path(path, cache_dir)
+    if os.path.exists(cache_path):
+        yield from _iter_parquet(cache_path)
+        return
+
+    os.makedirs(cache_dir, exist_ok=True)
+    yield from _iter_and_convert(path, cache_path)
@@ -1,3 +1,5 @@
+import threading
+
 AWS_CREDENTIALS ={
     'aws_access_key_id':'',
     'aws_secret_access_key':'',
@@ -5,13 +7,36 @@ AWS_CREDENTIALS ={
     'region_name':'us-east-1'
 }
 
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def _config_key(config):
+    if config is None:
+        return None
+    return repr(sorted(config._user_provided_options.items()))
+
+
 def get_bedrock_client(config=None):
     """
     Returns a configured boto3 bedrock-runtime client using the stored credentials.
 
+    Clients are created on first use and shared by the whole process (boto3 clients
+    are thread-safe), one per distinct config.
+
     Returns:
         boto3.client: Configured bedrock-runtime client
     """
+    key = _config_key(config)
+    with _clients_lock:
+        client = _clients.get(key)
+        if client is None:
+            client = _create_bedrock_client(config)
+            _clients[key] = client
+    return client
+
+
+def _create_bedrock_client(config=None):
     import boto3
     from botocore.config import Config
 
@@ -19,15 +44,41 @@ def get_bedrock_client(config=None):
         config = Config(
             read_timeout=180,
             connect_timeout=60,
+            # Throttled and transient failures are retried by rate_limit.RetryScheduler,
+            # which also slows the shared rate budget down; botocore only retries once
             retries={
-                'max_attempts': 3,
-                'mode': 'adaptive'
+                'max_attempts': 2,
+                'mode': 'standard'
             }
         )
 
     return boto3.client('bedrock-runtime', config=config, **AWS_CREDENTIALS)
 
-    return boto3.client('bedrock-runtime', **AWS_CREDENTIALS)
+
+def set_bedrock_client(client, config=None):
+    """
+    Installs `client` as the shared client for `config`, e.g. a local stand-in for benchmarks.
+
+    Args:
+        client: Object with the bedrock-runtime invoke_model interface
+        config (botocore.config.Config): The config the client is registered under
+    """
+    with _clients_lock:
+        _clients[_config_key(config)] = client
+
+
+def refresh_bedrock_client(credentials=None):
+    """
+    Drops the shared clients so the next call builds new ones, e.g. after the session token expired.
+
+    Args:
+        credentials (dict): Optional new values for AWS_CREDENTIALS
+    """
+    with _clients_lock:
+        if credentials:
+            AWS_CREDENTIALS.update(credentials)
+        _clients.clear()
+
 
 def get_credentials():
     """
@@ -0,0 +1,231 @@
+import json
+import threading
+import time
+from xml.sax.saxutils import escape
+from graph_store import SUPPORT_TYPES, normalize_label
+from sqlite_store import connect
+
+GRAPH_DB_PATH = "output/graph.sqlite"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS nodes (
+    id INTEGER PRIMARY KEY,
+    label TEXT NOT NULL,
+    norm TEXT NOT NULL UNIQUE,
+    type TEXT,
+    properties TEXT
+);
+CREATE INDEX IF NOT EXISTS nodes_type ON nodes(type);
+CREATE TABLE IF NOT EXISTS edges (
+    source INTEGER NOT NULL,
+    target INTEGER NOT NULL,
+    type TEXT NOT NULL,
+    properties TEXT NOT NULL,
+    consultation TEXT NOT NULL DEFAULT '',
+    article TEXT NOT NULL,
+    UNIQUE (source, target, type, properties, consultation, article)
+);
+CREATE INDEX IF NOT EXISTS edges_source ON edges(source, type);
+CREATE INDEX IF NOT EXISTS edges_target ON edges(target, type);
+CREATE INDEX IF NOT EXISTS edges_article ON edges(consultation, article);
+CREATE TABLE IF NOT EXISTS articles (
+    article TEXT NOT NULL,
+    consultation TEXT NOT NULL DEFAULT '',
+    written REAL,
+    PRIMARY KEY (consultation, article)
+);
+CREATE TABLE IF NOT EXISTS support (
+    node INTEGER NOT NULL,
+    consultation TEXT NOT NULL,
+    article TEXT NOT NULL,
+    support INTEGER NOT NULL,
+    PRIMARY KEY (consultation, article, node)
+);
+"""
+
+
+class GraphDB:
+    """Consultation-wide Article -> Issue -> Position -> Argument graph stored in SQLite.
+
+    Nodes are stored once (keyed by their normalized label) and edges as integer
+    node references tagged with the consultation and article they came from, with
+    indexes on both edge ends so cross-article queries need no re-extraction.
+    Writes are per article: writing an article again replaces only its own edges, and
+    articles are keyed by (consultation, title), so equally named articles of different
+    consultations never overwrite each other. Position and Argument nodes add up the
+    "support" of every article they appear in; the part an article added is taken back
+    when it is written again.
+    """
+
+    def __init__(self, path=GRAPH_DB_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = connect(path)
+        self._conn.executescript(SCHEMA)
+        self._conn.commit()
+
+    def _node_id(self, label, node_type=None, properties=None, support=0):
+        """Id of the node stored under the normalized `label`, inserted if missing; `support` is added to its own."""
+        norm = normalize_label(label)
+        if support:
+            properties = {**(properties or {}), "support": support}
+            self._conn.execute(
+                "INSERT INTO nodes (label, norm, type, properties) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT(norm) DO UPDATE SET properties = json_set(COALESCE(properties, '{}'), '$.support', "
+                "COALESCE(json_extract(properties, '$.support'), 0) + ?)",
+                (label, norm, node_type, json.dumps(properties, ensure_ascii=False), support),
+            )
+        row = self._conn.execute("SELECT id FROM nodes WHERE norm = ?", (norm,)).fetchone()
+        if row is not None:
+            return row[0]
+        cursor = self._conn.execute(
+            "INSERT INTO nodes (label, norm, type, properties) VALUES (?, ?, ?, ?)",
+            (label, norm, node_type, json.dumps(properties or {}, ensure_ascii=False)),
+        )
+        return cursor.lastrowid
+
+    def _take_back_support(self, consultation, article):
+        """Subtract the support an earlier write of the article added to its nodes."""
+        self._conn.execute(
+            "UPDATE nodes SET properties = json_set(properties, '$.support', json_extract(properties, '$.support') - "
+            "(SELECT s.support FROM support s WHERE s.node = nodes.id AND s.consultation = ? AND s.article = ?)) "
+            "WHERE id IN (SELECT node FROM support WHERE consultation = ? AND article = ?)",
+            (consultation, article, consultation, article),
+        )
+        self._conn.execute("DELETE FROM support WHERE consultation = ? AND article = ?", (consultation, article))
+
+    def write_article(self, consultation, article, merged_graph):
+        """Store one article's merged graph (merge_graph_documents format), replacing its previous edges."""
+        consultation = consultation or ""
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM edges WHERE consultation = ? AND article = ?", (consultation, article))
+            self._take_back_support(consultation, article)
+            for node in merged_graph['nodes']:
+                support = (node.properties or {}).get("support", 1) if node.type in SUPPORT_TYPES else 0
+                node_id = self._node_id(node.id, node.type, node.properties, support)
+                if support:
+                    self._conn.execute(
+                        "INSERT INTO support (node, consultation, article, support) VALUES (?, ?, ?, ?) "
+                        "ON CONFLICT DO UPDATE SET support = support + excluded.support",
+                        (node_id, consultation, article, support),
+                    )
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO edges (source, target, type, properties, consultation, article) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                [(self._node_id(rel['source_id']), self._node_id(rel['target_id']), rel['type'],
+                  json.dumps(rel['properties'] or {}, ensure_ascii=False, sort_keys=True), consultation, article)
+                 for rel in merged_graph['relationships']],
+            )
+            self._conn.execute(
+                "INSERT OR REPLACE INTO articles (article, consultation, written) VALUES (?, ?, ?)",
+                (article, consultation, time.time()),
+            )
+
+    def articles(self, consultation=None):
+        with self._lock:
+            if consultation is None:
+                rows = self._conn.execute("SELECT article FROM articles ORDER BY written")
+            else:
+                rows = self._conn.execute("SELECT article FROM articles WHERE consultation = ? ORDER BY written",
+                                          (consultation,))
+            return [row[0] for row in rows]
+
+    def targets(self, label, rel_type, consultation=None):
+        """Labels of the nodes that `label` points to through `rel_type` edges, across all articles."""
+        query = ("SELECT DISTINCT t.label FROM nodes s "
+                 "JOIN edges e ON e.source = s.id JOIN nodes t ON t.id = e.target "
+                 "WHERE s.norm = ? AND UPPER(e.type) = UPPER(?)")
+        params = [normalize_label(label), rel_type]
+        if consultation is not None:
+            query += " AND e.consultation = ?"
+            params.append(consultation)
+        with self._lock:
+            return [row[0] for row in self._conn.execute(query, params)]
+
+    def positions_on_issue(self, issue, consultation=None):
+        return self.targets(issue, "HAS_POSITION", consultation)
+
+    def arguments_for_position(self, position, consultation=None):
+        return {
+            "supported": self.targets(position, "SUPPORTED_BECAUSE", consultation),
+            "objected": self.targets(position, "IS_NOT_SUPPORTED_BECAUSE", consultation),
+        }
+
+    def issues_of_article(self, article, consultation=None):
+        """Issue labels of an article; titles repeat across consultations, so pass its `consultation`."""
+        query = ("SELECT DISTINCT t.label FROM edges e JOIN nodes t ON t.id = e.target "
+                 "WHERE e.article = ? AND t.type = 'Issue'")
+        params = [article]
+        if consultation is not None:
+            query += " AND e.consultation = ?"
+            params.append(consultation)
+        with self._lock:
+            return [row[0] for row in self._conn.execute(query, params)]
+
+    def _iter_nodes(self):
+        return self._conn.execute("SELECT id, label, type, properties FROM nodes ORDER BY id")
+
+    def _iter_edges(self):
+        return self._conn.execute(
+            "SELECT source, target, type, properties, consultation, article FROM edges ORDER BY rowid")
+
+    def export_jsonl(self, path):
+        """Write one JSON object per line: all nodes first, then all edges."""
+        with self._lock, open(path, "w", encoding="utf-8") as f:
+            for node_id, label, node_type, properties in self._iter_nodes():
+                f.write(json.dumps({"kind": "node", "id": node_id, "label": label, "type": node_type,
+                                    "properties": json.loads(properties or "{}")}, ensure_ascii=False) + "\n")
+            for source, target, rel_type, properties, consultation, article in self._iter_edges():
+                f.write(json.dumps({"kind": "edge", "source": source, "target": target, "type": rel_type,
+                                    "properties": json.loads(properties), "consultation": consultation,
+                                    "article": article}, ensure_ascii=False) + "\n")
+
+    def import_jsonl(self, path):
+        """Load a file written by export_jsonl (from this or another database); node support adds to the stored one."""
+        labels = {}
+        edges = []
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                record = json.loads(line)
+                if record["kind"] == "node":
+                    labels[record["id"]] = (record["label"], record["type"], record["properties"])
+                else:
+                    edges.append(record)
+        now = time.time()
+        with self._lock, self._conn:
+            ids = {old_id: self._node_id(label, node_type, properties,
+                                         properties.get("support", 1) if node_type in SUPPORT_TYPES else 0)
+                   for old_id, (label, node_type, properties) in labels.items()}
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO edges (source, target, type, properties, consultation, article) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                [(ids[edge["source"]], ids[edge["target"]], edge["type"],
+                  json.dumps(edge["properties"] or {}, ensure_ascii=False, sort_keys=True),
+                  edge["consultation"] or "", edge["article"]) for edge in edges],
+            )
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO articles (article, consultation, written) VALUES (?, ?, ?)",
+                {(edge["article"], edge["consultation"] or "", now) for edge in edges},
+            )
+
+    def export_graphml(self, path):
+        """Write the whole graph as GraphML (readable by Gephi, yEd, networkx, igraph)."""
+        with self._lock, open(path, "w", encoding="utf-8") as f:
+            f.write('<?xml version="1.0" encoding="UTF-8"?>\n'
+                    '<graphml xmlns="http://graphml.graphdrawing.org/xmlns">\n'
+                    '  <key id="label" for="node" attr.name="label" attr.type="string"/>\n'
+                    '  <key id="type" for="node" attr.name="type" attr.type="string"/>\n'
+                    '  <key id="rel" for="edge" attr.name="type" attr.type="string"/>\n'
+                    '  <key id="article" for="edge" attr.name="article" attr.type="string"/>\n'
+                    '  <graph edgedefault="directed">\n')
+            for node_id, label, node_type, _ in self._iter_nodes():
+                f.write(f'    <node id="n{node_id}"><data key="label">{escape(label)}</data>'
+                        f'<data key="type">{escape(node_type or "")}</data></node>\n')
+            for source, target, rel_type, _, _, article in self._iter_edges():
+                f.write(f'    <edge source="n{source}" target="n{target}"><data key="rel">{escape(rel_type)}</data>'
+                        f'<data key="article">{escape(article)}</data></edge>\n')
+            f.write('  </graph>\n</graphml>\n')
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,251 @@
+import difflib
+import json
+import re
+import unicodedata
+from collections import defaultdict, namedtuple
+
+GraphNode = namedtuple("GraphNode", ["id", "type", "properties"])
+
+WHITESPACE = re.compile(r"\s+")
+EDGE_PUNCTUATION = " .,;:!·;«»\"'()-–"
+# Node types whose "support" property counts the extracted nodes they stand for
+SUPPORT_TYPES = ("Position", "Supported_arguments", "Object_arguments")
+
+
+def normalize_label(label):
+    """Case-, accent- and whitespace-insensitive form of a node label."""
+    text = unicodedata.normalize("NFD", str(label).casefold())
+    text = "".join(ch for ch in text if not unicodedata.combining(ch))
+    return WHITESPACE.sub(" ", text).strip(EDGE_PUNCTUATION)
+
+
+def _freeze(value):
+    """Hashable form of a property value: lists become tuples and dicts tuples of sorted items.
+    Leaves that still cannot be hashed fall back to their JSON text."""
+    if isinstance(value, dict):
+        return tuple(sorted(((key, _freeze(item)) for key, item in value.items()), key=lambda pair: str(pair[0])))
+    if isinstance(value, (list, tuple)):
+        return tuple(_freeze(item) for item in value)
+    try:
+        hash(value)
+    except TypeError:
+        return json.dumps(value, sort_keys=True, ensure_ascii=False, default=str)
+    return value
+
+
+def _properties_key(properties):
+    """Hashable key of an edge's properties; values may be lists or dicts, as the model returns them."""
+    if not properties:
+        return ()
+    return _freeze(properties)
+
+
+class GraphStore:
+    """In-memory graph with interned node ids and adjacency indexes.
+
+    Nodes are interned to integers on first sight, keyed by their id (or by the
+    normalized id when `normalize` is set, so labels differing only in case, accents,
+    spacing or trailing punctuation become one node; the first spelling seen is kept).
+    Position and Argument nodes count in their "support" property how many extracted
+    nodes were folded into them (absent when 1): normalized duplicates, the same node
+    added from other graphs, and fuzzy or semantic merges all add to it. Edges are
+    keyed by (source, target, type, properties) integer tuples, so adding a duplicate
+    is a single set lookup. Graphs can be added incrementally, article by article, and
+    the store exported in the merge_graph_documents format at any time.
+    """
+
+    def __init__(self, normalize=False):
+        self.normalize = normalize
+        self._node_index = {}
+        self.node_ids = []
+        self.node_types = []
+        self.node_properties = []
+        self._type_index = {}
+        self.edge_types = []
+        self.edges = {}
+        self.out_edges = defaultdict(set)
+        self.in_edges = defaultdict(set)
+        # Merged-away node -> the node that replaced it
+        self._aliases = {}
+
+    def __len__(self):
+        return len(self.node_ids) - len(self._aliases)
+
+    def _node_key(self, node_id):
+        return normalize_label(node_id) if self.normalize else node_id
+
+    def _resolve(self, idx):
+        while idx in self._aliases:
+            idx = self._aliases[idx]
+        return idx
+
+    def _edge_type(self, rel_type):
+        idx = self._type_index.get(rel_type)
+        if idx is None:
+            idx = self._type_index[rel_type] = len(self.edge_types)
+            self.edge_types.append(rel_type)
+        return idx
+
+    def node_index(self, node_id):
+        """Return the integer id of a node, or None if it is not in the store."""
+        idx = self._node_index.get(self._node_key(node_id))
+        return None if idx is None else self._resolve(idx)
+
+    def _add_support(self, idx, support):
+        if self.node_types[idx] in SUPPORT_TYPES:
+            self.node_properties[idx]["support"] = self.node_properties[idx].get("support", 1) + support
+
+    def add_node(self, node_id, node_type=None, properties=None, count=False):
+        """Add a node and return its integer id.
+
+        With `count`, the node is an occurrence of its own (not just a relationship end),
+        so a node already in the store gains its support.
+        """
+        key = self._node_key(node_id)
+        idx = self._node_index.get(key)
+        if idx is not None:
+            idx = self._resolve(idx)
+            if count:
+                self._add_support(idx, (properties or {}).get("support", 1))
+            return idx
+        idx = self._node_index[key] = len(self.node_ids)
+        self.node_ids.append(node_id)
+        self.node_types.append(node_type)
+        self.node_properties.append(dict(properties) if properties else {})
+        return idx
+
+    def add_edge(self, source, target, rel_type, properties=None):
+        """Add an edge between two node indexes; returns False if it was already present."""
+        key = (source, target, self._edge_type(rel_type), _properties_key(properties))
+        if key in self.edges:
+            return False
+        self.edges[key] = dict(properties) if properties else {}
+        self.out_edges[source].add(key)
+        self.in_edges[target].add(key)
+        return True
+
+    def add_graph_document(self, doc):
+        for node in doc.nodes:
+            self.add_node(node.id, node.type, node.properties, count=True)
+        for rel in doc.relationships:
+            source = self.add_node(rel.source.id, rel.source.type, rel.source.properties)
+            target = self.add_node(rel.target.id, rel.target.type, rel.target.properties)
+            self.add_edge(source, target, rel.type, rel.properties)
+
+    def add_graph_documents(self, docs):
+        for doc in docs:
+            self.add_graph_document(doc)
+
+    def add_merged_graph(self, merged_graph):
+        """Add a graph in the merge_graph_documents format (e.g. from another store or article)."""
+        for node in merged_graph['nodes']:
+            self.add_node(node.id, node.type, node.properties, count=True)
+        for rel in merged_graph['relationships']:
+            source = self.add_node(rel['source_id'])
+            target = self.add_node(rel['target_id'])
+            self.add_edge(source, target, rel['type'], rel['properties'])
+
+    def merge_nodes(self, keep, drop):
+        """Fold node `drop` into node `keep`, rewiring its edges and dropping duplicates.
+        `keep` gains the support of `drop`."""
+        keep, drop = self._resolve(keep), self._resolve(drop)
+        if keep == drop:
+            return
+        self._aliases[drop] = keep
+        self._add_support(keep, self.node_properties[drop].get("support", 1))
+        for key in list(self.out_edges.pop(drop, ())) + list(self.in_edges.pop(drop, ())):
+            properties = self.edges.pop(key, None)
+            if properties is None:
+                continue
+            source, target, type_idx, properties_key = key
+            self.out_edges[source].discard(key)
+            self.in_edges[target].discard(key)
+            source = keep if source == drop else source
+            target = keep if target == drop else target
+            new_key = (source, target, type_idx, properties_key)
+            if new_key not in self.edges:
+                self.edges[new_key] = properties
+                self.out_edges[source].add(new_key)
+                self.in_edges[target].add(new_key)
+
+    def fuzzy_merge(self, threshold=0.9, node_types=("Position", "Supported_arguments", "Object_arguments")):
+        """Merge nodes of the same type whose normalized labels have a difflib ratio >= `threshold`.
+
+        Candidates are only compared within buckets of the same type and first normalized
+        word, which keeps the pass far from quadratic on large graphs.
+        """
+        buckets = defaultdict(list)
+        for idx in self.live_nodes():
+            if self.node_types[idx] in node_types:
+                label = normalize_label(self.node_ids[idx])
+                buckets[(self.node_types[idx], label.split(" ", 1)[0])].append((idx, label))
+
+        merged = 0
+        for candidates in buckets.values():
+            canonical = []
+            for idx, label in candidates:
+                for keep, keep_label in canonical:
+                    matcher = difflib.SequenceMatcher(None, keep_label, label)
+                    if matcher.real_quick_ratio() >= threshold and matcher.ratio() >= threshold:
+                        self.merge_nodes(keep, idx)
+                        merged += 1
+                        break
+                else:
+                    canonical.append((idx, label))
+        return merged
+
+    def semantic_merge(self, threshold=0.8, node_types=("Position", "Supported_arguments", "Object_arguments")):
+        """Cluster the nodes of the same type that say the same thing and fold each cluster into one node.
+
+        Labels are compared by the cosine similarity of their character n-gram TF-IDF
+        vectors (see similarity.LabelIndex), with approximate nearest-neighbour candidates
+        instead of all pairs, so it scales to hundreds of thousands of nodes. Nodes are
+        clustered when linked by similarities >= `threshold`, and each cluster is folded
+        into its most central node, whose "support" property counts the nodes it now stands
+        for. Returns the number of merged nodes.
+        """
+        from similarity import cluster_labels
+
+        nodes = [idx for idx in self.live_nodes() if self.node_types[idx] in node_types]
+        if len(nodes) < 2:
+            return 0
+        clusters, canonical, _ = cluster_labels(
+            [self.node_ids[idx] for idx in nodes], [self.node_types[idx] for idx in nodes],
+            [self.node_properties[idx].get("support", 1) for idx in nodes], threshold)
+
+        merged = 0
+        for position, cluster in enumerate(clusters):
+            keep = nodes[canonical[cluster]]
+            if keep != nodes[position]:
+                self.merge_nodes(keep, nodes[position])
+                merged += 1
+        return merged
+
+    def live_nodes(self):
+        return [idx for idx in range(len(self.node_ids)) if idx not in self._aliases]
+
+    def neighbors(self, node_id, rel_type=None):
+        """Ids of the nodes `node_id` points to, optionally only through `rel_type` edges."""
+        idx = self.node_index(node_id)
+        if idx is None:
+            return []
+        if rel_type is not None and rel_type not in self._type_index:
+            return []
+        type_idx = self._type_index.get(rel_type)
+        return [self.node_ids[key[1]] for key in self.out_edges.get(idx, ())
+                if rel_type is None or key[2] == type_idx]
+
+    def to_dict(self):
+        """Export in the merge_graph_documents format ({'nodes': [...], 'relationships': [...]})."""
+        nodes = [GraphNode(self.node_ids[idx], self.node_types[idx], self.node_properties[idx])
+                 for idx in self.live_nodes()]
+        relationships = [{
+            'source_id': self.node_ids[source],
+            'target_id': self.node_ids[target],
+            'type': self.edge_types[type_idx],
+            'properties': properties
+        } for (source, target, type_idx, _), properties in self.edges.items()]
+        return {
+            'nodes': nodes,
+            'relationships': relationships
+        }
@@ -1,25 +1,56 @@
 import re
-from langchain_aws import ChatBedrock
-from langchain_experimental.graph_transformers import LLMGraphTransformer
-from langchain.docstore.document import Document
-from credentials import get_bedrock_client
-from pyvis.network import Network
+from models import TRANSFORMER_PROMPT_TOKENS, get_graph_transformer
+from llm_cache import get_cache
+from metrics import span, usage_callback
+from rate_limit import ModelCallFailed, call_model, settle_tokens
+from relevance.relevance_claude import estimate_tokens
+
+standard_model_id = "anthropic.claude-3-5-sonnet-20240620-v1:0"
+
+# Bump when the instructions below change so cached graphs are not reused
+# (v2: empty graphs of replies cut off at MAX_TOKENS were cached under v1)
+PROMPT_VERSION = "issue-v2"
+
+# The issue list of one article is a short graph; leave headroom without reserving the model maximum
+MAX_TOKENS = 2048
 
 
 def issue_extraction(article):
+    """Return the Article -> Issue graph documents of an article.
+
+    LLMGraphTransformer turns a reply cut off at MAX_TOKENS into an empty graph, so a
+    truncated reply, or one without any Issue, is not cached and raises ModelCallFailed;
+    the article is then dead-lettered instead of extracting positions against no Issues.
+    """
+    callback = usage_callback("issues")
 
-    bedrock_runtime = get_bedrock_client()
+    def complete(graph_documents):
+        return "max_tokens" not in callback.stop_reasons and _count_issues(graph_documents) > 0
 
-    standard_model_id = "anthropic.claude-3-5-sonnet-20240620-v1:0"
-    llm = ChatBedrock(
-        client=bedrock_runtime,
-        model_id=standard_model_id,
-        model_kwargs={"temperature": 0, "max_tokens": 131072},
-    )
+    with span("issues", chars=len(article)) as issues_span:
+        graph_documents = get_cache().cached(standard_model_id, PROMPT_VERSION, {"article": article},
+                                             lambda: _extract_issues(article, callback), cacheable=complete)
+        issues_span.set(issues=_count_issues(graph_documents))
+        if not complete(graph_documents):
+            reason = f"exceeded {MAX_TOKENS} tokens" if "max_tokens" in callback.stop_reasons else "has no Issue"
+            raise ModelCallFailed(f"issues reply {reason}", "issues", standard_model_id)
+
+    print(graph_documents)
+
+    return graph_documents
+
+
+def _count_issues(graph_documents):
+    return sum(node.type == "Issue" for doc in graph_documents for node in doc.nodes)
+
+
+def _extract_issues(article, callback):
+    from langchain.docstore.document import Document
 
     # Option 1
-    transformer = LLMGraphTransformer(
-        llm=llm,
+    transformer = get_graph_transformer(
+        standard_model_id,
+        {"temperature": 0, "max_tokens": MAX_TOKENS},
         allowed_nodes=["Article", "Issue"],
         allowed_relationships=["has"],
         additional_instructions=f'''
@@ -46,8 +77,8 @@ def issue_extraction(article):
     """
 
     documents = [Document(page_content=text)]
-    graph_documents = transformer.convert_to_graph_documents(documents)
-
-    print(graph_documents)
-
-    return graph_documents
\ No newline at end of file
+    reserved = TRANSFORMER_PROMPT_TOKENS + estimate_tokens(text) + MAX_TOKENS
+    graph_documents = call_model(standard_model_id, transformer.convert_to_graph_documents, documents,
+                                 {"callbacks": [callback]}, tokens=reserved, stage="issues")
+    settle_tokens(standard_model_id, reserved, callback.tokens)
+    return graph_documents
@@ -1,72 +1,88 @@
+import os
 import re
-from langchain_aws import ChatBedrock
-from langchain_experimental.graph_transformers import LLMGraphTransformer
-from langchain.docstore.document import Document
-from credentials import get_bedrock_client
-from pyvis.network import Network
-import json
-
-def merge_graph_documents(issue_docs, graph_docs):
+from models import TRANSFORMER_PROMPT_TOKENS, get_graph_transformer
+from graph_store import GraphStore
+from llm_cache import get_cache
+from metrics import bind_span, span, usage_callback
+from relevance.relevance_claude import estimate_tokens
+from render import render_static
+from concurrent.futures import ThreadPoolExecutor
+from rate_limit import ModelCallFailed, call_model, settle_tokens
+
+standard_model_id = "anthropic.claude-3-5-sonnet-20240620-v1:0"
+
+# Bump when the instructions below change so cached graphs are not reused
+PROMPT_VERSION = "position-v2"
+
+# Output budget per chunk of comments (a few Position/Argument nodes per comment)
+MAX_TOKENS = 8192
+# Expected graph output of one comment: every Greek label appears in the node list and again
+# in each of its relationships, so it grows with the comment's length
+OUTPUT_TOKENS_PER_COMMENT = 300
+# Share of MAX_TOKENS a chunk's expected output may use, leaving room for wordier replies
+OUTPUT_BUDGET = MAX_TOKENS * 3 // 4
+
+
+def merge_graph_documents(issue_docs, graph_docs, normalize=False, fuzzy_threshold=None, semantic_threshold=None):
     """
     Merge multiple graph documents into a single graph document by deduplicating
     nodes and relationships.
-    """
-    merged_nodes = {}
-    merged_relationships = set()
-
-    def add_node(node):
-        if node.id not in merged_nodes:
-            merged_nodes[node.id] = node
 
-    def add_relationship(rel):
-        key = (rel.source.id, rel.target.id, rel.type)
-        merged_relationships.add((key, json.dumps(rel.properties, ensure_ascii=False)))
+    With `normalize`, node ids differing only in case, accents or spacing are merged;
+    with `fuzzy_threshold`, near-identical Position/Argument labels are merged as well;
+    with `semantic_threshold`, paraphrased ones are clustered into canonical nodes
+    (see GraphStore.semantic_merge).
+    """
+    store = GraphStore(normalize=normalize)
 
     # Add all nodes and relationships from issue_docs (e.g. Article -> Issue)
-    for doc in issue_docs:
-        for node in doc.nodes:
-            add_node(node)
-        for rel in doc.relationships:
-            add_relationship(rel)
+    store.add_graph_documents(issue_docs)
 
     # Add all nodes and relationships from graph_docs (e.g. Issue -> Position -> Arguments)
-    for doc in graph_docs:
-        for node in doc.nodes:
-            add_node(node)
-        for rel in doc.relationships:
-            add_relationship(rel)
-
-    # Convert to list
-    merged_node_list = list(merged_nodes.values())
-    merged_rel_list = []
-    for (src_tgt_type, props_json) in merged_relationships:
-        src_id, tgt_id, rel_type = src_tgt_type
-        props = json.loads(props_json)
-        merged_rel_list.append({
-            'source_id': src_id,
-            'target_id': tgt_id,
-            'type': rel_type,
-            'properties': props
-        })
-
-    merge_graph = {
-        'nodes': merged_node_list,
-        'relationships': merged_rel_list
-    }
+    store.add_graph_documents(graph_docs)
+
+    if fuzzy_threshold is not None:
+        store.fuzzy_merge(fuzzy_threshold)
+
+    if semantic_threshold is not None:
+        store.semantic_merge(semantic_threshold)
+
+    return store.to_dict()
+
+
+def position_argument_extraction(issue_nodes, comments, index, max_workers=8, serial=False):
+    """Extract Issue -> Position -> Arguments graphs from the comments and render them.
+
+    Comments are sent to the model from a pool of `max_workers` threads; pass
+    serial=True to process them one by one in the calling thread for debugging.
+    """
+    results = extract_positions(issue_nodes, comments, max_workers, serial)
+
+    with open("output/response.txt", "w", encoding="utf-8") as f:
+        f.write(comment_summary(comments, results))
+
+    all_graph_docs = [graph_document for graph_documents in results for graph_document in graph_documents]
+    merged_graph = merge_graph_documents(issue_nodes, all_graph_docs)
+    print("Merged Graph", merged_graph)
 
-    return merge_graph
+    render_graph(merged_graph, index)
 
 
-def position_argument_extraction(issue_nodes, comments, index):
-    # It's recommended to specify the region, otherwise it will be inferred from your environment
-    bedrock_runtime = get_bedrock_client()
+def extract_positions(issue_nodes, comments, max_workers=8, serial=False, chunk_token_budget=6000, max_chunk_comments=20):
+    """Return the list of graph documents extracted from each comment, in comment order.
 
-    standard_model_id = "anthropic.claude-3-5-sonnet-20240620-v1:0"
-    llm = ChatBedrock(
-        client=bedrock_runtime,
-        model_id=standard_model_id,
-        model_kwargs={"temperature": 0, "max_tokens": 131072},
-    )
+    All comments are processed. They are sent in chunks of up to `max_chunk_comments`
+    comments, `chunk_token_budget` estimated input tokens and OUTPUT_BUDGET expected
+    output tokens, and the extracted nodes are mapped back to their comments through
+    the comment_ids node property.
+
+    A chunk whose reply was cut off at MAX_TOKENS or has nodes without comment_ids is
+    split in two and retried, down to single comments; such replies are never cached.
+    A reply without any Position is a valid answer (the comments take no position) and
+    is cached like any other. A single comment whose reply is still cut off raises
+    ModelCallFailed, so its article is dead-lettered instead of losing the comment.
+    """
+    from langchain.docstore.document import Document
 
     issues = []
     for doc in issue_nodes:
@@ -75,11 +91,7 @@ def position_argument_extraction(issue_nodes, comments, index):
                 issues.append(node.id)
 
     # Option 1
-    transformer = LLMGraphTransformer(
-        llm=llm,
-        allowed_nodes=["Issue", "Position", "Supported_Arguments", "Object_Arguments"],
-        allowed_relationships=["has_position", "supported_because", "is_not_supported_because"],
-        additional_instructions=f'''
+    instructions = f'''
         Issue List:
         {issues}
         
@@ -103,22 +115,144 @@ def position_argument_extraction(issue_nodes, comments, index):
         1. All extracted text must be written in Greek.
         2. An issue can have a lot of positions.
         3. A Position could have a lot of arguments. But also none.
-        4. If the type of node is Issue then the name/id of the node should be exactly as it is inside the Issue List'''
-    )
-
-    all_graph_docs = []
-    temp_parts = []
-
-    for idx, comment in enumerate(comments[:30]):
-        text = f"""
+        4. If the type of node is Issue then the name/id of the node should be exactly as it is inside the Issue List
+        5. The text contains several comments, each starting with "Σχολιο <number>". Set the comment_ids property of every node to the numbers of the comments it was extracted from, separated by commas'''
+
+    def get_transformer():
+        # Shared across calls and created on first use, so fully cached runs never build a client
+        return get_graph_transformer(
+            standard_model_id,
+            {"temperature": 0, "max_tokens": MAX_TOKENS},
+            allowed_nodes=["Issue", "Position", "Supported_Arguments", "Object_Arguments"],
+            allowed_relationships=["has_position", "supported_because", "is_not_supported_because"],
+            node_properties=["comment_ids"],
+            additional_instructions=instructions,
+        )
+
+    chunks = chunk_comments(comments, chunk_token_budget, max_chunk_comments)
+
+    def extract(chunk):
+        text = "\n".join(f"""
         Σχολιο {idx + 1}
-        {comment}"""
-        print(idx + 1, '/', len(comments))
+        {comments[idx]}""" for idx in chunk)
+        print(chunk[-1] + 1, '/', len(comments))
 
         documents = [Document(page_content=text)]
-        graph_documents = transformer.convert_to_graph_documents(documents)
-        all_graph_docs.extend(graph_documents)
+        reserved = TRANSFORMER_PROMPT_TOKENS + estimate_tokens(instructions + text) + MAX_TOKENS
+        callback = usage_callback("positions")
+
+        def invoke():
+            graph_documents = call_model(standard_model_id, get_transformer().convert_to_graph_documents,
+                                         documents, {"callbacks": [callback]}, tokens=reserved, stage="positions")
+            settle_tokens(standard_model_id, reserved, callback.tokens)
+            return graph_documents
+
+        def complete(graph_documents):
+            return ("max_tokens" not in callback.stop_reasons
+                    and not split_by_comment(graph_documents, comments, chunk)[1])
+
+        # LLMGraphTransformer turns a reply cut off mid tool call into an empty graph, so it is not cached
+        graph_documents = get_cache().cached(standard_model_id, PROMPT_VERSION, {"issues": issues, "text": text},
+                                             invoke, cacheable=complete)
+        truncated = "max_tokens" in callback.stop_reasons
+        per_comment, unassigned = split_by_comment(graph_documents, comments, chunk)
+        if len(chunk) > 1 and (truncated or unassigned):
+            reason = "reply cut off at max_tokens" if truncated else f"{unassigned} nodes without comment_ids"
+            print(f"Splitting comments {chunk[0] + 1}-{chunk[-1] + 1} and retrying: {reason}")
+            half = len(chunk) // 2
+            return extract(chunk[:half]) + extract(chunk[half:])
+        if truncated:
+            raise ModelCallFailed(f"positions reply for comment {chunk[0] + 1} exceeded {MAX_TOKENS} tokens",
+                                  "positions", standard_model_id)
+        return per_comment
+
+    with span("positions", comments=len(comments), chunks=len(chunks)):
+        if serial or max_workers <= 1:
+            chunk_results = [extract(chunk) for chunk in chunks]
+        else:
+            # map() keeps results in chunk order; the pool size caps in-flight requests
+            with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                chunk_results = list(executor.map(bind_span(extract), chunks))
+
+    return [graph_documents for per_comment in chunk_results for graph_documents in per_comment]
+
+
+def chunk_comments(comments, token_budget=6000, max_comments=20, output_budget=OUTPUT_BUDGET):
+    """Group consecutive comment indexes into chunks of at most `token_budget` estimated input tokens
+    and `output_budget` expected output tokens."""
+    chunks = []
+    chunk = []
+    chunk_tokens = 0
+    chunk_output = 0
+    for idx, comment in enumerate(comments):
+        comment_tokens = estimate_tokens(str(comment)) + 10
+        comment_output = OUTPUT_TOKENS_PER_COMMENT + comment_tokens // 2
+        if chunk and (chunk_tokens + comment_tokens > token_budget or len(chunk) >= max_comments
+                      or chunk_output + comment_output > output_budget):
+            chunks.append(chunk)
+            chunk = []
+            chunk_tokens = 0
+            chunk_output = 0
+        chunk.append(idx)
+        chunk_tokens += comment_tokens
+        chunk_output += comment_output
+    if chunk:
+        chunks.append(chunk)
+    return chunks
+
+
+def split_by_comment(graph_documents, comments, chunk):
+    """Split the graph extracted from a chunk into one graph document per comment of the chunk.
+
+    Nodes are assigned through their comment_ids property; nodes without usable ids are
+    assigned to every comment of the chunk. Issue nodes are shared, so a relationship
+    belongs to the comments of its non-Issue end. Returns the per-comment graph documents
+    and the number of non-Issue nodes without usable ids.
+    """
+    from langchain.docstore.document import Document
+    from langchain_community.graphs.graph_document import GraphDocument
+
+    chunk_ids = [idx + 1 for idx in chunk]
+    nodes = {comment_id: {} for comment_id in chunk_ids}
+    relationships = {comment_id: [] for comment_id in chunk_ids}
+
+    unassigned = 0
+    for doc in graph_documents:
+        owners = {}
+        for node in doc.nodes:
+            ids = [int(value) for value in re.findall(r"\d+", str(node.properties.get("comment_ids", "")))]
+            owners[node.id] = [comment_id for comment_id in ids if comment_id in nodes] or chunk_ids
+            if node.type != "Issue" and len(chunk_ids) > 1 and owners[node.id] is chunk_ids:
+                unassigned += 1
+            if node.type != "Issue":
+                for comment_id in owners[node.id]:
+                    nodes[comment_id].setdefault(node.id, node)
+
+        for rel in doc.relationships:
+            if rel.source.type == "Issue":
+                rel_owners = owners.get(rel.target.id, chunk_ids)
+            else:
+                rel_owners = owners.get(rel.source.id, chunk_ids)
+            for comment_id in rel_owners:
+                relationships[comment_id].append(rel)
+                nodes[comment_id].setdefault(rel.source.id, rel.source)
+                nodes[comment_id].setdefault(rel.target.id, rel.target)
+
+    return [
+        [GraphDocument(
+            nodes=list(nodes[comment_id].values()),
+            relationships=relationships[comment_id],
+            source=Document(page_content=str(comments[comment_id - 1]), metadata={"comment_id": comment_id}),
+        )]
+        for comment_id in chunk_ids
+    ], unassigned
+
+
+def comment_summary(comments, results):
+    """Format the positions and arguments extracted from each comment as plain text."""
+    temp_parts = []
 
+    for comment, graph_documents in zip(comments, results):
         comment_section = [f"Comment: {comment}"]
 
         for graph_document in graph_documents:
@@ -153,14 +287,26 @@ def position_argument_extraction(issue_nodes, comments, index):
             comment_section.append("-" * 50)
             temp_parts.append("\n".join(comment_section))
 
-        temp = "\n".join(temp_parts)
+    return "\n".join(temp_parts)
 
-    with open("output/response.txt", "w", encoding="utf-8") as f:
-        f.write(temp)
 
-    merged_graph = merge_graph_documents(issue_nodes, all_graph_docs)
-    all_graph_docs =[merged_graph]
-    print("Merged Graph", merged_graph)
+def render_graph(merged_graph, index, mode="static", output_dir="output"):
+    """Write the merged graph of an article to {output_dir}/article{index}.html.
+
+    The default "static" mode precomputes the layout and inlines its assets (see
+    render.render_static); "physics" keeps the browser-side force layout.
+    """
+    with span("render", mode=mode, nodes=len(merged_graph['nodes']), edges=len(merged_graph['relationships'])):
+        if mode == "static":
+            render_static(merged_graph, os.path.join(output_dir, f"article{index}.html"))
+        else:
+            _render_physics(merged_graph, os.path.join(output_dir, f"article{index}.html"))
+
+
+def _render_physics(merged_graph, path):
+    from pyvis.network import Network
+
+    all_graph_docs = [merged_graph]
 
     net = Network(notebook=True, cdn_resources="remote", directed=True, height='100vh')
     net.force_atlas_2based()
@@ -216,4 +362,4 @@ def position_argument_extraction(issue_nodes, comments, index):
     """)
 
     # Show
-    net.show(f"output/article{index}.html")
+    net.show(path)
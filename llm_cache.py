@@ -0,0 +1,154 @@
+import hashlib
+import json
+import pickle
+import threading
+import time
+from metrics import count
+from sqlite_store import connect
+
+CACHE_PATH = "output/llm_cache.sqlite"
+
+
+class CacheMiss(KeyError):
+    """Raised in cache-only mode when a response is not cached."""
+
+
+class LLMCache:
+    """Content-addressed, SQLite-backed store for LLM responses.
+
+    Entries are keyed by a hash of (model id, prompt template version, inputs), so
+    changing any of them produces a new key. Entries older than `max_age` seconds are
+    dropped, and the least recently used ones are evicted as soon as a write takes the
+    cache over `max_entries` rows or `max_bytes` of values. With `cache_only` set, misses
+    raise CacheMiss instead of calling the model.
+    """
+
+    def __init__(self, path=CACHE_PATH, max_age=None, max_entries=None, max_bytes=None, cache_only=False):
+        self.path = path
+        self.max_age = max_age
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.cache_only = cache_only
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+        self._conn = connect(path)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS entries ("
+            "key TEXT PRIMARY KEY, value BLOB, size INTEGER, created REAL, accessed REAL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS entries_accessed ON entries(accessed)")
+        self._conn.commit()
+        self.evict()
+
+    @staticmethod
+    def key(model_id, prompt_version, inputs):
+        payload = json.dumps([model_id, prompt_version, inputs], ensure_ascii=False, sort_keys=True, default=str)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, key):
+        """Return (found, value) for `key`."""
+        with self._lock:
+            row = self._conn.execute("SELECT value, created FROM entries WHERE key = ?", (key,)).fetchone()
+            if row is None or (self.max_age is not None and row[1] < time.time() - self.max_age):
+                self.misses += 1
+                count("cache_misses")
+                return False, None
+            self._conn.execute("UPDATE entries SET accessed = ? WHERE key = ?", (time.time(), key))
+            self._conn.commit()
+            self.hits += 1
+        count("cache_hits")
+        return True, pickle.loads(row[0])
+
+    def set(self, key, value):
+        blob = pickle.dumps(value)
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO entries (key, value, size, created, accessed) VALUES (?, ?, ?, ?, ?)",
+                (key, blob, len(blob), now, now),
+            )
+            self._conn.commit()
+            over = self._over_limits()
+        if over:
+            self.evict()
+
+    def _over_limits(self):
+        if self.max_entries is None and self.max_bytes is None:
+            return False
+        entries, size = self._conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries").fetchone()
+        return ((self.max_entries is not None and entries > self.max_entries)
+                or (self.max_bytes is not None and size > self.max_bytes))
+
+    def cached(self, model_id, prompt_version, inputs, compute, cacheable=None):
+        """Return the cached response for these inputs, calling `compute()` and storing its result on a miss.
+
+        With `cacheable`, a computed result is only stored when `cacheable(result)` is true.
+        """
+        key = self.key(model_id, prompt_version, inputs)
+        found, value = self.get(key)
+        if found:
+            return value
+        if self.cache_only:
+            raise CacheMiss(f"No cached response for {prompt_version} ({key[:12]})")
+        value = compute()
+        if cacheable is None or cacheable(value):
+            self.set(key, value)
+        return value
+
+    def evict(self):
+        """Apply the age and size limits."""
+        with self._lock:
+            if self.max_age is not None:
+                self._conn.execute("DELETE FROM entries WHERE created < ?", (time.time() - self.max_age,))
+            if self.max_entries is not None:
+                self._conn.execute(
+                    "DELETE FROM entries WHERE key IN ("
+                    "SELECT key FROM entries ORDER BY accessed DESC LIMIT -1 OFFSET ?)",
+                    (self.max_entries,),
+                )
+            if self.max_bytes is not None:
+                total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+                if total > self.max_bytes:
+                    rows = self._conn.execute("SELECT key, size FROM entries ORDER BY accessed").fetchall()
+                    stale = []
+                    for key, size in rows:
+                        if total <= self.max_bytes:
+                            break
+                        stale.append((key,))
+                        total -= size
+                    self._conn.executemany("DELETE FROM entries WHERE key = ?", stale)
+            self._conn.commit()
+
+    def stats(self):
+        with self._lock:
+            entries, size = self._conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries").fetchone()
+            return {"hits": self.hits, "misses": self.misses, "entries": entries, "bytes": size}
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def configure_cache(**kwargs):
+    """Replace the process-wide cache, e.g. configure_cache(cache_only=True, max_age=30 * 86400)."""
+    global _cache
+    with _cache_lock:
+        if _cache is not None:
+            _cache.close()
+        _cache = LLMCache(**kwargs)
+    return _cache
+
+
+def get_cache():
+    """Return the process-wide LLM response cache, opening it with the defaults on first use."""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = LLMCache()
+    return _cache
@@ -1,77 +1,86 @@
-from ArticleExtraction import scrape_post_urls, scrape_post_content
-import pandas as pd
-import re
-from relevance.relevance_claude import relevance_claude
-# from llmgraph import llmgraph
-from langwithpydantic import position_argument_extraction
-from issue import issue_extraction
-
-url = "https://www.opengov.gr/ypepth/?p=6501"
-post_contents = scrape_post_urls(url)
-if post_contents:
-    for i, content in enumerate(post_contents, 1):
-        if 'links' in content:
-            print(f"Links from consnav (set {i}): {content['links']}\n")
-
-content_posts = []
-title_posts = []
-posts = []
-for i, content in enumerate(post_contents):
-    for link in content['links']:
-        url = f'{link}'
-        print(link)
-        post_content, post_title = scrape_post_content(url)
-
-        dict = {
-            "Title": post_title,
-            "Content": post_content
-        }
-
-        posts.append(dict)
-
-# print(f'Scrapted Content posts: {posts}')
-
-
-dataframe1 = pd.read_excel('data/ypepth_comments_104.xls')
-
-comments_per_article = dataframe1.values.tolist()
-article_comment = []
-
-for post in posts:
-    comments = []
-    comment_from_article = re.sub(r"\s*[-–]\s*", " ", post['Title'][0])
-    for comment in comments_per_article:
-        comment_from_excel = re.sub(r"\s*[-–]\s*", " ", comment[0])
-        if comment_from_excel == comment_from_article:
-            # print(f'comments for article {comment_from_excel} and {comment_from_article}')
-            comments.append(comment[1])
-    dict = {
-        "Title": post['Title'][0],
-        "Content": post['Content'][0],
-        "Comments": comments
-    }
-
-    article_comment.append(dict)
-
-index = 0
-for article in article_comment:
-    index += 1
-    article_with_title = article['Title'] + '\n' + article['Content']
-
-    issue_nodes = issue_extraction(article_with_title)
-
-    comments = article['Comments']
-    print(f'Comments1: {comments}')
-    print(f'Length1: {len(comments)}')
-    for comment in comments[:30]:
-        response = relevance_claude(article_with_title, comment)
-
-        score = int(response)
-        if score < 50:
-            comments.remove(comment)
-    print(f'Comments2: {comments}')
-    print(f'Length2: {len(comments)}')
-
-    if len(comments) > 0:
-        position_argument_extraction(issue_nodes, comments, index)
-
+"""Extract the Article -> Issue -> Position -> Argument graphs of OpenGov consultations.
+
+    python main.py                                    # the default consultation below
+    python main.py URL --comments data/comments.xls   # one consultation
+    python main.py --jobs jobs.txt --workers 8        # one `URL [COMMENTS_PATH]` per line
+    python main.py --jobs jobs.txt --scrape-only      # only crawl, no model calls
+    python main.py --jobs jobs.txt --cache-only       # replay cached model responses, no Bedrock calls
+    python main.py --ministry https://www.opengov.gr/ypepth/ --comments-pattern "data/{ministry}_{p}.xls"
+
+Each consultation is written to its own directory under output/consultations; the
+LLM cache (output/llm_cache.sqlite), the graph database and the Bedrock rate budgets
+are shared by all worker processes. Every stage's timings, token counts, retries and
+cache hits are appended to metrics.jsonl in the consultation's directory. Consultations
+without a comments file get the export linked from their page, saved in that directory.
+"""
+import argparse
+import sys
+from batch import BATCH_OUTPUT_DIR, comments_for, ministry_jobs, read_jobs, run_batch
+from rate_limit import configure_limits
+
+DEFAULT_URL = "https://www.opengov.gr/ypepth/?p=6501"
+DEFAULT_COMMENTS = 'data/ypepth_comments_104.xls'
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("urls", nargs="*", help="consultation URLs")
+    parser.add_argument("--comments", help="comments export of the consultation, when a single URL is given")
+    parser.add_argument("--comments-pattern",
+                        help="comments export path of each consultation, with {ministry}, {p} and {name} placeholders")
+    parser.add_argument("--jobs", help="file with one `URL [COMMENTS_PATH]` per line")
+    parser.add_argument("--ministry", action="append", default=[],
+                        help="ministry index URL; every consultation it lists is processed")
+    parser.add_argument("--workers", type=int, help="worker processes (default: one per CPU)")
+    parser.add_argument("--output-dir", default=BATCH_OUTPUT_DIR, help="root of the per-consultation output directories")
+    parser.add_argument("--rescrape", action="store_true", help="re-crawl consultations that were already scraped")
+    parser.add_argument("--scrape-only", action="store_true", help="only crawl the consultations, without model calls")
+    parser.add_argument("--cache-only", action="store_true",
+                        help="replay model responses from the LLM cache without calling Bedrock; a miss fails the consultation")
+    parser.add_argument("--min-interval", type=float,
+                        help="seconds between two requests of a worker to the same host "
+                             "(default: ArticleExtraction.MIN_INTERVAL, or the robots.txt Crawl-delay when longer)")
+    parser.add_argument("--limit", action="append", default=[], metavar="MODEL_ID=RPM,TPM",
+                        help="requests and tokens per minute budget of a model, shared by all workers")
+    return parser.parse_args(argv)
+
+
+def collect_jobs(args):
+    jobs = [{"url": url, "comments": args.comments if len(args.urls) == 1 else None} for url in args.urls]
+    if args.jobs:
+        jobs += read_jobs(args.jobs)
+    for index_url in args.ministry:
+        jobs += ministry_jobs(index_url, args.comments_pattern)
+    if not jobs and not args.jobs and not args.ministry:
+        jobs = [{"url": DEFAULT_URL, "comments": DEFAULT_COMMENTS}]
+    for job in jobs:
+        if not job["comments"] and args.comments_pattern:
+            job["comments"] = comments_for(job["url"], args.comments_pattern)
+    return jobs
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    for limit in args.limit:
+        model_id, _, budget = limit.rpartition("=")
+        rpm, _, tpm = budget.partition(",")
+        configure_limits(model_id, int(rpm), int(tpm) if tpm else None)
+
+    jobs = collect_jobs(args)
+    print(f"{len(jobs)} consultations")
+    failed = 0
+    for summary in run_batch(jobs, args.workers, args.output_dir, args.rescrape, scrape_only=args.scrape_only,
+                             cache_only=args.cache_only, min_interval=args.min_interval):
+        if "error" in summary:
+            failed += 1
+            print(f"FAILED {summary['url']}: {summary['error']}")
+        elif args.scrape_only:
+            print(f"Scraped {summary['url']} in {summary['seconds']}s: {summary['articles']} articles")
+        else:
+            print(f"Done {summary['url']} in {summary['seconds']}s: {summary['nodes']} nodes, "
+                  f"{summary['dead_letters']} dead-lettered articles -> {summary['output_dir']}")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
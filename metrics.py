@@ -0,0 +1,304 @@
+import contextvars
+import itertools
+import json
+import os
+import threading
+import time
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+
+USAGE_FIELDS = ("input_tokens", "output_tokens", "cache_read_input_tokens", "cache_creation_input_tokens")
+SPAN_COUNTERS = USAGE_FIELDS + ("bytes", "retries", "cache_hits", "cache_misses", "not_modified")
+
+METRICS_PATH = "output/metrics.jsonl"
+
+# USD per million tokens (Claude 3.5 Sonnet on Bedrock, on-demand)
+PRICES = {
+    "input_tokens": 3.0,
+    "output_tokens": 15.0,
+    "cache_read_input_tokens": 0.3,
+    "cache_creation_input_tokens": 3.75,
+}
+
+_usage = defaultdict(Counter)
+_lock = threading.Lock()
+
+_current_span = contextvars.ContextVar("current_span", default=None)
+_span_ids = itertools.count(1)
+# Per span name: number of spans, seconds and own counters, for the Prometheus exposition
+_span_totals = defaultdict(Counter)
+_sink = None
+
+
+def cost(counters):
+    """Estimated USD cost of the token counts in `counters`."""
+    return sum(PRICES[field] * counters.get(field, 0) for field in PRICES) / 1e6
+
+
+def record_usage(stage, usage):
+    """Add the token usage of one model call (Anthropic `usage` dict) to the stage's totals and the current span."""
+    with _lock:
+        totals = _usage[stage]
+        totals["calls"] += 1
+        for field in USAGE_FIELDS:
+            totals[field] += usage.get(field) or 0
+    for field in USAGE_FIELDS:
+        count(field, usage.get(field) or 0)
+
+
+def reset_usage():
+    """Start a new usage report, e.g. for the next consultation of a worker process."""
+    with _lock:
+        _usage.clear()
+
+
+def usage_report():
+    """Return {stage: {calls, input_tokens, output_tokens, ...}} since the last reset_usage()."""
+    with _lock:
+        return {stage: dict(totals) for stage, totals in _usage.items()}
+
+
+def print_usage_report():
+    for stage, totals in usage_report().items():
+        print(f"{stage}: {totals['calls']} calls, {totals['input_tokens']} input tokens, "
+              f"{totals['output_tokens']} output tokens, {totals['cache_read_input_tokens']} cached input tokens, "
+              f"${cost(totals):.4f}")
+
+
+def usage_callback(stage):
+    """LangChain callback handler that records the token usage of ChatBedrock calls under `stage`.
+
+    The stop reason of every call it sees is kept in its `stop_reasons` list, so callers
+    can tell a reply cut off at max_tokens from a complete one, and its input plus
+    output tokens are added up in `tokens`, to settle the call's rate-limit reservation.
+    """
+    from langchain_core.callbacks import BaseCallbackHandler
+
+    class UsageCallback(BaseCallbackHandler):
+        def __init__(self):
+            self.stop_reasons = []
+            self.tokens = 0
+
+        def _record(self, usage):
+            record_usage(stage, usage)
+            self.tokens += (usage.get("input_tokens") or 0) + (usage.get("output_tokens") or 0)
+
+        def on_llm_end(self, response, **kwargs):
+            self.stop_reasons.append((response.llm_output or {}).get("stop_reason"))
+            for generations in response.generations:
+                for generation in generations:
+                    message = getattr(generation, "message", None)
+                    usage_metadata = getattr(message, "usage_metadata", None)
+                    if usage_metadata:
+                        details = usage_metadata.get("input_token_details") or {}
+                        self._record({
+                            "input_tokens": usage_metadata.get("input_tokens"),
+                            "output_tokens": usage_metadata.get("output_tokens"),
+                            "cache_read_input_tokens": details.get("cache_read"),
+                            "cache_creation_input_tokens": details.get("cache_creation"),
+                        })
+                        return
+            usage = (response.llm_output or {}).get("usage") or {}
+            self._record({
+                "input_tokens": usage.get("prompt_tokens"),
+                "output_tokens": usage.get("completion_tokens"),
+            })
+
+    return UsageCallback()
+
+
+class Span:
+    """One timed unit of work (a page fetch, a model call, a pipeline stage).
+
+    Counters recorded while the span is current (tokens, bytes, retries, cache hits)
+    are its own; when it ends they are rolled up, with those of its finished child
+    spans, into its parent, so an article or consultation span carries the totals
+    of everything below it.
+    """
+
+    def __init__(self, name, attributes, parent):
+        self.id = next(_span_ids)
+        self.name = name
+        self.attributes = attributes
+        self.parent = parent
+        self.own = Counter()
+        self.totals = Counter()
+        self.start = time.time()
+        self._lock = threading.Lock()
+
+    def count(self, field, value=1):
+        with self._lock:
+            self.own[field] += value
+            self.totals[field] += value
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+    def _add_child(self, totals):
+        with self._lock:
+            self.totals.update(totals)
+
+
+def current_span():
+    return _current_span.get()
+
+
+def count(field, value=1):
+    """Add `value` to a counter of the current span; a no-op outside spans."""
+    span_ = _current_span.get()
+    if span_ is not None and value:
+        span_.count(field, value)
+
+
+@contextmanager
+def span(name, **attributes):
+    """Time the enclosed block as a span named `name` and write it to the metrics sink when it ends."""
+    current = Span(name, attributes, _current_span.get())
+    token = _current_span.set(current)
+    start = time.perf_counter()
+    error = None
+    try:
+        yield current
+    except BaseException as e:
+        error = type(e).__name__
+        raise
+    finally:
+        _current_span.reset(token)
+        _finish(current, time.perf_counter() - start, error)
+
+
+def bind_span(func):
+    """Wrap `func` so it records into the caller's current span when run on a worker thread."""
+    parent = _current_span.get()
+
+    def wrapper(*args, **kwargs):
+        token = _current_span.set(parent)
+        try:
+            return func(*args, **kwargs)
+        finally:
+            _current_span.reset(token)
+
+    return wrapper
+
+
+def open_span(name, **attributes):
+    """Start a span that is not tied to a `with` block, e.g. one that follows an item through
+    the threads of a pipeline. It is a child of the current span; end it with close_span."""
+    current = Span(name, attributes, _current_span.get())
+    current.started = time.perf_counter()
+    return current
+
+
+def close_span(current, error=None):
+    """End a span started with open_span; `error` is the name of the exception it failed with."""
+    _finish(current, time.perf_counter() - current.started, error)
+
+
+@contextmanager
+def use_span(current):
+    """Make `current` (see open_span) the current span within the block, on any thread."""
+    token = _current_span.set(current)
+    try:
+        yield current
+    finally:
+        _current_span.reset(token)
+
+
+def _finish(current, duration, error):
+    if current.parent is not None:
+        current.parent._add_child(current.totals)
+    with _lock:
+        totals = _span_totals[current.name]
+        totals["spans"] += 1
+        totals["errors"] += error is not None
+        totals["seconds"] += duration
+        totals.update(current.own)
+        sink = _sink
+    if sink is None:
+        return
+    record = {
+        "span": current.name,
+        "id": current.id,
+        "parent": current.parent.id if current.parent else None,
+        "start": round(current.start, 6),
+        "duration": round(duration, 6),
+        "attributes": current.attributes,
+        "counters": dict(current.totals),
+        "cost_usd": round(cost(current.totals), 6),
+        "error": error,
+    }
+    line = json.dumps(record, ensure_ascii=False, default=str) + "\n"
+    with _lock:
+        sink.write(line)
+        sink.flush()
+
+
+def configure_metrics(path=METRICS_PATH, prometheus_port=None):
+    """Append every finished span to the JSONL file at `path` (None disables it), and
+    optionally serve the aggregated metrics in the Prometheus text format on `prometheus_port`."""
+    global _sink
+    with _lock:
+        if _sink is not None:
+            _sink.close()
+            _sink = None
+        if path:
+            if os.path.dirname(path):
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+            _sink = open(path, "a", encoding="utf-8")
+    if prometheus_port is not None:
+        return serve_prometheus(prometheus_port)
+
+
+def span_report():
+    """Return {span name: {spans, errors, seconds, input_tokens, bytes, ...}} for this process."""
+    with _lock:
+        return {name: dict(totals) for name, totals in _span_totals.items()}
+
+
+def prometheus_text():
+    """Aggregated span metrics in the Prometheus text exposition format."""
+    report = span_report()
+    metrics = [("pipeline_spans_total", "spans", "Finished spans"),
+               ("pipeline_span_errors_total", "errors", "Spans that ended with an exception"),
+               ("pipeline_span_seconds_total", "seconds", "Wall time spent in spans")]
+    metrics += [(f"pipeline_{field}_total", field, field.replace("_", " ").capitalize()) for field in SPAN_COUNTERS]
+    lines = []
+    for metric, field, description in metrics:
+        lines.append(f"# HELP {metric} {description}")
+        lines.append(f"# TYPE {metric} counter")
+        for name, totals in sorted(report.items()):
+            lines.append(f'{metric}{{span="{name}"}} {totals.get(field, 0)}')
+    lines.append("# HELP pipeline_cost_usd_total Estimated model cost")
+    lines.append("# TYPE pipeline_cost_usd_total counter")
+    for name, totals in sorted(report.items()):
+        lines.append(f'pipeline_cost_usd_total{{span="{name}"}} {cost(totals):.6f}')
+    return "\n".join(lines) + "\n"
+
+
+def write_prometheus(path):
+    """Write the metrics to `path`, e.g. for the node_exporter textfile collector."""
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(prometheus_text())
+    os.replace(tmp_path, path)
+
+
+def serve_prometheus(port, host="0.0.0.0"):
+    """Serve /metrics on a background thread; returns the HTTP server."""
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            body = prometheus_text().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
@@ -0,0 +1,70 @@
+import json
+import threading
+from collections import OrderedDict
+from credentials import get_bedrock_client, refresh_bedrock_client
+
+# Transformers are keyed by their instructions (which embed the article's issue list),
+# so only the most recent ones are kept
+MAX_TRANSFORMERS = 64
+
+# Rough size in tokens of LLMGraphTransformer's own prompt and tool schema,
+# added to the input's estimate when reserving a call against the tokens-per-minute budget
+TRANSFORMER_PROMPT_TOKENS = 2000
+
+_chat_models = {}
+_transformers = OrderedDict()
+_lock = threading.RLock()
+
+
+def _key(*parts):
+    return json.dumps(parts, ensure_ascii=False, sort_keys=True, default=str)
+
+
+def get_chat_model(model_id, model_kwargs=None):
+    """Return the shared ChatBedrock for this model id and model kwargs, creating it on first use."""
+    from langchain_aws import ChatBedrock
+
+    model_kwargs = model_kwargs or {}
+    key = _key(model_id, model_kwargs)
+    with _lock:
+        llm = _chat_models.get(key)
+        if llm is None:
+            llm = ChatBedrock(
+                client=get_bedrock_client(),
+                model_id=model_id,
+                model_kwargs=model_kwargs,
+            )
+            _chat_models[key] = llm
+    return llm
+
+
+def get_graph_transformer(model_id, model_kwargs, allowed_nodes, allowed_relationships, additional_instructions="",
+                          node_properties=False):
+    """Return a shared LLMGraphTransformer for this model and schema, creating it on first use."""
+    from langchain_experimental.graph_transformers import LLMGraphTransformer
+
+    key = _key(model_id, model_kwargs, allowed_nodes, allowed_relationships, additional_instructions, node_properties)
+    with _lock:
+        transformer = _transformers.get(key)
+        if transformer is None:
+            transformer = LLMGraphTransformer(
+                llm=get_chat_model(model_id, model_kwargs),
+                allowed_nodes=allowed_nodes,
+                allowed_relationships=allowed_relationships,
+                node_properties=node_properties,
+                additional_instructions=additional_instructions,
+            )
+            _transformers[key] = transformer
+            while len(_transformers) > MAX_TRANSFORMERS:
+                _transformers.popitem(last=False)
+        else:
+            _transformers.move_to_end(key)
+    return transformer
+
+
+def refresh(credentials=None):
+    """Drop every shared client, model and transformer, e.g. when the AWS session token expires."""
+    with _lock:
+        refresh_bedrock_client(credentials)
+        _chat_models.clear()
+        _transformers.clear()
@@ -0,0 +1,389 @@
+import os
+import queue
+import threading
+import issue
+import langwithpydantic
+from checkpoints import CheckpointStore, fingerprint
+from comments import index_comments, iter_comment_rows, join_comments, join_post, unmatched_comments
+from graph_db import GraphDB
+from graph_store import GraphStore
+from issue import issue_extraction
+from langwithpydantic import comment_summary, extract_positions, merge_graph_documents, render_graph
+from llm_cache import CacheMiss
+from metrics import bind_span, close_span, open_span, print_usage_report, reset_usage, span, use_span
+from rate_limit import DeadLetterQueue, is_fatal_error
+from render import render_static
+from relevance.prefilter import filter_relevant
+from relevance.relevance_claude import relevance_claude_batch
+
+RELEVANCE_THRESHOLD = 50
+# Overrides for relevance.prefilter.DEFAULT_CONFIG
+PREFILTER_CONFIG = {}
+# difflib ratio above which Position/Argument labels are merged; None only merges normalized duplicates
+FUZZY_MERGE_THRESHOLD = None
+# Character n-gram TF-IDF cosine above which paraphrased Position/Argument nodes are clustered,
+# per article and across the consultation (needs numpy and scipy); None disables it
+SEMANTIC_MERGE_THRESHOLD = None
+# The clustered graph of the whole consultation, rendered into the output directory
+CONSULTATION_HTML = "consultation.html"
+# Articles waiting between two pipelined stages; a full queue blocks the stage before it
+QUEUE_SIZE = 2
+
+
+def is_article_error(error):
+    """True for the errors that only fail one article: everything but credential and
+    configuration errors and cache misses in cache-only mode, which would fail every article."""
+    return not (isinstance(error, CacheMiss) or is_fatal_error(error))
+
+
+def _dead_letter(dead_letters, url, index, title, error, stage=None):
+    print(f"Skipping article {index}, added to the dead-letter queue: {error}")
+    dead_letters.put(url, title, getattr(error, "stage", None) or stage, error)
+
+
+def is_complete_crawl(posts):
+    """True when every article was read: a failed crawl returns no posts and a failed article
+    download a post with an empty Title or Content."""
+    return bool(posts) and all(post and post['Title'] and post['Content'] for post in posts)
+
+
+def scrape_stage(store, url, rescrape=False, min_interval=None):
+    """Scrape the consultation's articles, reusing a complete stored crawl unless `rescrape` is set."""
+    if not rescrape:
+        found, posts = store.get("scrape", url)
+        if found and is_complete_crawl(posts):
+            return posts
+    # requests and BeautifulSoup are only loaded when a consultation is actually crawled
+    from ArticleExtraction import scrape_consultation_posts
+
+    posts = scrape_consultation_posts(url, max_concurrency=8, min_interval=min_interval)
+    if is_complete_crawl(posts):
+        store.put("scrape", url, None, posts)
+    else:
+        print(f"Not checkpointing the incomplete crawl of {url}; it is crawled again on the next run")
+    return posts
+
+
+def _join_inputs(posts, comments_path):
+    stat = os.stat(comments_path)
+    return posts, os.path.abspath(comments_path), stat.st_size, stat.st_mtime_ns
+
+
+def _print_unmatched(unmatched):
+    if unmatched:
+        print(f'{sum(unmatched.values())} comments did not match any article: {sorted(str(title) for title in unmatched)}')
+
+
+def join_stage(store, posts, comments_path):
+    """Attach the exported comments to the scraped articles."""
+    def compute():
+        article_comment, unmatched = join_comments(posts, iter_comment_rows(comments_path))
+        _print_unmatched(unmatched)
+        return article_comment
+
+    return store.run("join", comments_path, _join_inputs(posts, comments_path), compute)
+
+
+def stream_articles_stage(store, url, comments_path, rescrape, emit, min_interval=None):
+    """Scrape and join the consultation's articles, passing each one to `emit` as soon as it is ready.
+
+    Articles are emitted in consnav order while the rest of the consultation is still
+    being crawled; stored pages are reused unless `rescrape` is set, as in scrape_stage.
+    The scrape and join checkpoints are written once the whole consultation is read,
+    and only for a complete crawl (see is_complete_crawl). Returns the joined articles.
+    """
+    if not rescrape:
+        found, posts = store.get("scrape", url)
+        if found and is_complete_crawl(posts):
+            article_comment = join_stage(store, posts, comments_path)
+            for article in article_comment:
+                emit(article)
+            return article_comment
+
+    from ArticleExtraction import scrape_consultation_posts
+
+    index = index_comments(iter_comment_rows(comments_path))
+    article_comment = []
+
+    def on_post(post):
+        article = join_post(post, index)
+        if article is not None:
+            article_comment.append(article)
+            emit(article)
+
+    posts = scrape_consultation_posts(url, max_concurrency=8, min_interval=min_interval, on_post=on_post)
+    _print_unmatched(unmatched_comments(index, article_comment))
+    if is_complete_crawl(posts):
+        store.put("scrape", url, None, posts)
+        store.put("join", comments_path, fingerprint("join", _join_inputs(posts, comments_path)), article_comment)
+    else:
+        print(f"Not checkpointing the incomplete crawl of {url}; it is crawled again on the next run")
+    return article_comment
+
+
+def relevance_stage(store, title, article_with_title, comments):
+    """Return the comments whose relevance score reaches RELEVANCE_THRESHOLD.
+
+    Empty, duplicate and clearly on/off-topic comments are decided locally; only the
+    rest are scored by the model. The result is not checkpointed while any score could
+    not be parsed, so those comments are scored again on the next run.
+    """
+    unscored = []
+
+    def score_comments(article, batch):
+        scores = relevance_claude_batch(article, batch)
+        unscored.extend(score for score in scores if score is None)
+        return scores
+
+    def compute():
+        return filter_relevant(article_with_title, comments, score_comments, RELEVANCE_THRESHOLD, PREFILTER_CONFIG)
+
+    return store.run("relevance", title, (article_with_title, comments, RELEVANCE_THRESHOLD, PREFILTER_CONFIG),
+                     compute, cacheable=lambda _: not unscored)
+
+
+def issues_stage(store, title, article_with_title):
+    # The prompt version and model settings are inputs too, so a prompt change recomputes the stage
+    model = (issue.standard_model_id, issue.PROMPT_VERSION, issue.MAX_TOKENS)
+    return store.run("issues", title, (article_with_title, model), lambda: issue_extraction(article_with_title))
+
+
+def positions_stage(store, title, issue_nodes, comments):
+    """Return the graph documents extracted from each relevant comment."""
+    model = (langwithpydantic.standard_model_id, langwithpydantic.PROMPT_VERSION, langwithpydantic.MAX_TOKENS)
+    return store.run("positions", title, (issue_nodes, comments, model),
+                     lambda: extract_positions(issue_nodes, comments))
+
+
+def merge_stage(store, title, issue_nodes, results):
+    all_graph_docs = [graph_document for graph_documents in results for graph_document in graph_documents]
+    return store.run("merge", title, (issue_nodes, results, FUZZY_MERGE_THRESHOLD, SEMANTIC_MERGE_THRESHOLD),
+                     lambda: merge_graph_documents(issue_nodes, all_graph_docs, normalize=True,
+                                                   fuzzy_threshold=FUZZY_MERGE_THRESHOLD,
+                                                   semantic_threshold=SEMANTIC_MERGE_THRESHOLD))
+
+
+def render_stage(store, title, merged_graph, index, output_dir="output"):
+    """Render the article's graph, unless the same graph was already rendered to the same file."""
+    path = os.path.join(output_dir, f"article{index}.html")
+    input_fingerprint = fingerprint("render", merged_graph, path)
+    found, _ = store.get("render", title, input_fingerprint)
+    if found and os.path.exists(path):
+        return path
+    render_graph(merged_graph, index, output_dir=output_dir)
+    store.put("render", title, input_fingerprint, path)
+    return path
+
+
+def article_stages(store, url, index, article, graph, graph_db, output_dir="output"):
+    """Run the per-article stages and add the article's merged graph to `graph` and `graph_db`."""
+    article_with_title = article['Title'] + '\n' + article['Content']
+
+    title = article['Title']
+    with span("article", title=title, index=index) as article_span:
+        issue_nodes = issues_stage(store, title, article_with_title)
+        comments = relevance_stage(store, title, article_with_title, article['Comments'])
+        article_span.set(comments=len(article['Comments']), relevant=len(comments))
+
+        if len(comments) > 0:
+            results = positions_stage(store, title, issue_nodes, comments)
+            with open(os.path.join(output_dir, f"response{index}.txt"), "w", encoding="utf-8") as f:
+                f.write(comment_summary(comments, results))
+
+            merged_graph = merge_stage(store, title, issue_nodes, results)
+            print("Merged Graph", merged_graph)
+            graph.add_merged_graph(merged_graph)
+            graph_db.write_article(url, title, merged_graph)
+            render_stage(store, title, merged_graph, index, output_dir)
+
+
+class _Stopped(Exception):
+    """Raised in a pipeline thread once another one has failed."""
+
+
+_DONE = object()
+
+
+def _put(items, item, stop):
+    while not stop.is_set():
+        try:
+            items.put(item, timeout=0.1)
+            return
+        except queue.Full:
+            pass
+    raise _Stopped()
+
+
+def _get(items, stop):
+    while not stop.is_set():
+        try:
+            return items.get(timeout=0.1)
+        except queue.Empty:
+            pass
+    raise _Stopped()
+
+
+def _pipeline_thread(name, target, stop, errors):
+    """Thread running `target()` in the caller's span; an exception stops every thread of the pipeline."""
+    def guarded():
+        try:
+            target()
+        except _Stopped:
+            pass
+        except BaseException as e:
+            errors.append(e)
+            stop.set()
+
+    return threading.Thread(target=bind_span(guarded), name=f"pipeline-{name}", daemon=True)
+
+
+def _consume(step, inbox, outbox, stop):
+    """Run `step` on every article of `inbox`, passing on to `outbox` those it did not finish."""
+    def loop():
+        while True:
+            item = _get(inbox, stop)
+            if item is _DONE:
+                break
+            if not step(item) and outbox is not None:
+                _put(outbox, item, stop)
+        if outbox is not None:
+            _put(outbox, _DONE, stop)
+
+    return loop
+
+
+def run_pipelined(store, url, comments_path, rescrape, graph, graph_db, dead_letters, output_dir="output",
+                  min_interval=None):
+    """Run the consultation's stages as a streaming pipeline, one thread per stage.
+
+    scrape+join -> issues+relevance -> positions+merge -> graph write+render, with at
+    most QUEUE_SIZE articles queued between two stages. Article N+1 is crawled and
+    scored while article N is being extracted and rendered, so a consultation takes
+    about as long as its slowest stage rather than the sum of all of them. Articles
+    still go through every stage in consnav order, and the outputs are the same as
+    those of the sequential loop in run. Returns the number of articles.
+    """
+    stop = threading.Event()
+    errors = []
+    inboxes = [queue.Queue(maxsize=QUEUE_SIZE) for _ in range(3)]
+    articles = []
+
+    def step(work):
+        """Run `work(item)` in the article's span; True once the article needs no further stage."""
+        def run_step(item):
+            with use_span(item["span"]):
+                try:
+                    finished = work(item)
+                except Exception as e:
+                    if not is_article_error(e):
+                        close_span(item["span"], type(e).__name__)
+                        raise
+                    _dead_letter(dead_letters, url, item["index"], item["title"], e, work.__name__)
+                    close_span(item["span"], type(e).__name__)
+                    return True
+                except BaseException as e:
+                    close_span(item["span"], type(e).__name__)
+                    raise
+            if finished:
+                close_span(item["span"])
+                dead_letters.remove(url, item["title"])
+            return finished
+        return run_step
+
+    def produce():
+        def emit(article):
+            articles.append(article)
+            article_with_title = article['Title'] + '\n' + article['Content']
+            item = {"index": len(articles), "title": article['Title'], "article": article,
+                    "article_with_title": article_with_title}
+            # The article span covers its whole time in the pipeline, queue waits included
+            item["span"] = open_span("article", title=item["title"], index=item["index"])
+            _put(inboxes[0], item, stop)
+
+        stream_articles_stage(store, url, comments_path, rescrape, emit, min_interval)
+        _put(inboxes[0], _DONE, stop)
+
+    def analyse(item):
+        title, article_with_title = item["title"], item["article_with_title"]
+        item["issue_nodes"] = issues_stage(store, title, article_with_title)
+        item["comments"] = relevance_stage(store, title, article_with_title, item["article"]['Comments'])
+        item["span"].set(comments=len(item["article"]['Comments']), relevant=len(item["comments"]))
+        return not item["comments"]
+
+    def extract(item):
+        results = positions_stage(store, item["title"], item["issue_nodes"], item["comments"])
+        with open(os.path.join(output_dir, f"response{item['index']}.txt"), "w", encoding="utf-8") as f:
+            f.write(comment_summary(item["comments"], results))
+        item["merged_graph"] = merge_stage(store, item["title"], item["issue_nodes"], results)
+        return False
+
+    def write(item):
+        merged_graph = item["merged_graph"]
+        print("Merged Graph", merged_graph)
+        graph.add_merged_graph(merged_graph)
+        graph_db.write_article(url, item["title"], merged_graph)
+        render_stage(store, item["title"], merged_graph, item["index"], output_dir)
+        return True
+
+    threads = [
+        _pipeline_thread("scrape", produce, stop, errors),
+        _pipeline_thread("analyse", _consume(step(analyse), inboxes[0], inboxes[1], stop), stop, errors),
+        _pipeline_thread("extract", _consume(step(extract), inboxes[1], inboxes[2], stop), stop, errors),
+        _pipeline_thread("write", _consume(step(write), inboxes[2], None, stop), stop, errors),
+    ]
+    for thread in threads:
+        thread.start()
+    try:
+        for thread in threads:
+            thread.join()
+    except BaseException:
+        stop.set()
+        raise
+    if errors:
+        raise errors[0]
+    return len(articles)
+
+
+def run(url, comments_path, store=None, rescrape=False, graph_db=None, dead_letters=None, output_dir="output",
+        pipelined=True, min_interval=None):
+    """Run every stage of one consultation, skipping the work whose inputs did not change, and return its GraphStore."""
+    os.makedirs(output_dir, exist_ok=True)
+    store = store or CheckpointStore()
+    graph_db = graph_db or GraphDB()
+    dead_letters = dead_letters or DeadLetterQueue()
+    # The usage report covers this consultation only, not the earlier ones of the same process
+    reset_usage()
+
+    with span("consultation", url=url) as consultation_span:
+        graph = GraphStore(normalize=True)
+
+        if pipelined:
+            consultation_span.set(articles=run_pipelined(store, url, comments_path, rescrape, graph, graph_db,
+                                                         dead_letters, output_dir, min_interval))
+        else:
+            posts = scrape_stage(store, url, rescrape, min_interval)
+            article_comment = join_stage(store, posts, comments_path)
+            consultation_span.set(articles=len(article_comment))
+
+            for index, article in enumerate(article_comment, start=1):
+                try:
+                    article_stages(store, url, index, article, graph, graph_db, output_dir)
+                except Exception as e:
+                    if not is_article_error(e):
+                        raise
+                    _dead_letter(dead_letters, url, index, article['Title'], e)
+                    continue
+                dead_letters.remove(url, article['Title'])
+
+        if SEMANTIC_MERGE_THRESHOLD is not None:
+            with span("cluster", nodes=len(graph)) as cluster_span:
+                cluster_span.set(merged=graph.semantic_merge(SEMANTIC_MERGE_THRESHOLD))
+                render_static(graph.to_dict(), os.path.join(output_dir, CONSULTATION_HTML))
+
+        failed = len(dead_letters.items(url))
+        consultation_span.set(dead_letters=failed)
+        if failed:
+            print(f"{failed} articles are in the dead-letter queue ({dead_letters.path})")
+
+    print_usage_report()
+    return graph
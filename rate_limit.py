@@ -0,0 +1,409 @@
+import random
+import threading
+import time
+from multiprocessing.managers import BaseManager
+from metrics import count
+from sqlite_store import connect
+
+# Requests and tokens per minute allowed per model id. Set them to the account's Bedrock
+# quotas with configure_limits(); models without an entry use DEFAULT_LIMITS.
+DEFAULT_LIMITS = {"rpm": 50, "tpm": 400000}
+MODEL_LIMITS = {}
+
+# After a throttle the rate is cut to this share, and recovers by RECOVERY per successful call
+BACKOFF_FACTOR = 0.5
+MIN_RATE_SHARE = 0.1
+RECOVERY = 0.02
+
+THROTTLING_CODES = ("ThrottlingException", "TooManyRequestsException", "ServiceUnavailableException", "ModelNotReadyException")
+TRANSIENT_CODES = ("ModelTimeoutException", "InternalServerException", "ReadTimeoutError", "EndpointConnectionError",
+                   "ConnectionClosedError")
+# Credential and configuration errors: every later call would fail the same way, so they stop the run
+FATAL_CODES = ("UnrecognizedClientException", "AccessDeniedException", "ExpiredTokenException",
+               "ExpiredToken", "InvalidSignatureException", "IncompleteSignature", "InvalidClientTokenId",
+               "MissingAuthenticationTokenException", "UnauthorizedException", "ResourceNotFoundException",
+               "NoCredentialsError", "PartialCredentialsError", "CredentialRetrievalError", "NoRegionError",
+               "ProfileNotFound")
+
+DEAD_LETTER_PATH = "output/dead_letters.sqlite"
+
+
+class ModelCallFailed(Exception):
+    """A model call that still failed after every retry."""
+
+    def __init__(self, message, stage=None, model_id=None):
+        super().__init__(message)
+        self.stage = stage
+        self.model_id = model_id
+
+
+def _error_code(error):
+    response = getattr(error, "response", None)
+    if isinstance(response, dict):
+        return response.get("Error", {}).get("Code")
+    return None
+
+
+def is_throttling_error(error):
+    """True for Bedrock throttling/capacity errors, also when LangChain wraps the ClientError."""
+    code = _error_code(error)
+    if code is not None:
+        return code in THROTTLING_CODES
+    return any(code in str(error) for code in THROTTLING_CODES)
+
+
+def is_retryable_error(error):
+    """True for throttling and for transient timeouts, connection and server errors."""
+    if is_throttling_error(error):
+        return True
+    code = _error_code(error)
+    if code is not None:
+        return code in TRANSIENT_CODES
+    return any(name in type(error).__name__ or name in str(error) for name in TRANSIENT_CODES)
+
+
+def is_fatal_error(error):
+    """True for credential and configuration errors (bad keys, no access to the model, no region)."""
+    code = _error_code(error)
+    if code is not None:
+        return code in FATAL_CODES
+    return any(name in type(error).__name__ or name in str(error) for name in FATAL_CODES)
+
+
+class TokenBucket:
+    """Thread-safe token bucket refilled at `rate_per_minute`, holding at most one minute of tokens.
+
+    reserve() takes the tokens at once and lets the bucket go into debt, returning how
+    long the caller has to wait for the debt to be paid back, so waiting callers are
+    served in arrival order; acquire() also does the waiting.
+    """
+
+    def __init__(self, rate_per_minute):
+        self.rate_per_minute = rate_per_minute
+        self.tokens = float(rate_per_minute)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.rate_per_minute, self.tokens + (now - self._updated) * self.rate_per_minute / 60)
+        self._updated = now
+
+    def set_rate(self, rate_per_minute):
+        with self._lock:
+            self._refill()
+            self.rate_per_minute = rate_per_minute
+
+    def reserve(self, amount=1):
+        """Take `amount` tokens and return the seconds to wait before using them."""
+        with self._lock:
+            self._refill()
+            # A single request larger than the bucket would otherwise never fit
+            self.tokens -= min(amount, self.rate_per_minute)
+            return max(0.0, -self.tokens * 60 / self.rate_per_minute)
+
+    def acquire(self, amount=1):
+        """Take `amount` tokens, sleeping while the bucket is in debt; returns the seconds waited."""
+        wait = self.reserve(amount)
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+
+    def refund(self, amount):
+        with self._lock:
+            self._refill()
+            self.tokens = min(self.rate_per_minute, self.tokens + amount)
+
+
+class ModelRateLimiter:
+    """Requests-per-minute and tokens-per-minute budgets of one model.
+
+    The budgets adapt to throttling: every throttled call cuts the effective rate to
+    BACKOFF_FACTOR of its value (down to MIN_RATE_SHARE of the configured one), and each
+    successful call moves it RECOVERY of the way back up.
+    """
+
+    def __init__(self, rpm, tpm):
+        self.rpm = rpm
+        self.tpm = tpm
+        self.share = 1.0
+        self.requests = TokenBucket(rpm)
+        self.tokens = TokenBucket(tpm)
+        self._lock = threading.Lock()
+
+    def reserve(self, tokens=1):
+        # Both debts are paid back at the same time, so the wait is the longer of the two
+        return max(self.requests.reserve(1), self.tokens.reserve(tokens))
+
+    def acquire(self, tokens=1):
+        wait = self.reserve(tokens)
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+
+    def settle(self, reserved, used):
+        """Give back the part of a reservation (input + max output tokens) that the call did not use."""
+        if reserved > used:
+            self.tokens.refund(reserved - used)
+
+    def _set_share(self, share):
+        self.share = share
+        self.requests.set_rate(self.rpm * share)
+        self.tokens.set_rate(self.tpm * share)
+
+    def configure(self, rpm=None, tpm=None):
+        with self._lock:
+            self.rpm = rpm or self.rpm
+            self.tpm = tpm or self.tpm
+            self._set_share(self.share)
+
+    def throttled(self):
+        with self._lock:
+            self._set_share(max(MIN_RATE_SHARE, self.share * BACKOFF_FACTOR))
+
+    def succeeded(self):
+        with self._lock:
+            if self.share < 1.0:
+                self._set_share(min(1.0, self.share + RECOVERY))
+
+
+class RetryScheduler:
+    """Runs model calls through a rate limiter and retries the retryable failures.
+
+    A throttled call pauses every caller sharing the scheduler before their next
+    request, slows the limiter down, and is itself retried with jittered exponential
+    backoff. Retryable errors that outlast `retries` attempts and other errors of the
+    request itself (e.g. ValidationException, an unparsable reply) are raised as
+    ModelCallFailed; credential and configuration errors (is_fatal_error) as they are.
+    A failed attempt used no tokens, so its reservation is refunded to the limiter.
+    """
+
+    def __init__(self, limiter=None, retries=6, base_delay=1.0, max_delay=60.0):
+        self.limiter = limiter
+        self.retries = retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self._resume_at = 0.0
+        self._lock = threading.Lock()
+
+    def call(self, func, *args, tokens=1, stage=None, model_id=None, **kwargs):
+        for attempt in range(self.retries + 1):
+            with self._lock:
+                wait = self._resume_at - time.monotonic()
+            if wait > 0:
+                time.sleep(wait)
+            if self.limiter is not None:
+                self.limiter.acquire(tokens)
+            try:
+                result = func(*args, **kwargs)
+            except Exception as e:
+                if self.limiter is not None:
+                    self.limiter.settle(tokens, 0)
+                if isinstance(e, ModelCallFailed) or is_fatal_error(e):
+                    raise
+                if not is_retryable_error(e):
+                    raise ModelCallFailed(f"{stage or 'model call'} failed: {e}", stage, model_id) from e
+                throttled = is_throttling_error(e)
+                if throttled and self.limiter is not None:
+                    self.limiter.throttled()
+                if attempt == self.retries:
+                    raise ModelCallFailed(f"{stage or 'model call'} failed after {attempt + 1} attempts: {e}",
+                                          stage, model_id) from e
+                delay = min(self.max_delay, self.base_delay * (2 ** attempt)) * random.uniform(0.5, 1.0)
+                print(f"{'Throttled by' if throttled else 'Transient error from'} Bedrock, backing off {delay:.1f}s")
+                count("retries")
+                if throttled:
+                    with self._lock:
+                        self._resume_at = max(self._resume_at, time.monotonic() + delay)
+                else:
+                    time.sleep(delay)
+                continue
+            if self.limiter is not None:
+                self.limiter.succeeded()
+            return result
+
+
+class SharedLimiters:
+    """The per-model limiters of a batch, served from a manager process (see start_shared_limiters)
+    so that every worker process draws from the same budgets."""
+
+    def __init__(self, limits=None, default=None):
+        self.limits = dict(limits or {})
+        self.default = dict(default or DEFAULT_LIMITS)
+        self._limiters = {}
+        self._lock = threading.Lock()
+
+    def _limiter(self, model_id):
+        with self._lock:
+            limiter = self._limiters.get(model_id)
+            if limiter is None:
+                limits = self.limits.get(model_id, self.default)
+                limiter = self._limiters[model_id] = ModelRateLimiter(limits["rpm"], limits["tpm"])
+        return limiter
+
+    def reserve(self, model_id, tokens=1):
+        return self._limiter(model_id).reserve(tokens)
+
+    def settle(self, model_id, reserved, used):
+        self._limiter(model_id).settle(reserved, used)
+
+    def configure(self, model_id, rpm=None, tpm=None):
+        self._limiter(model_id).configure(rpm, tpm)
+
+    def throttled(self, model_id):
+        self._limiter(model_id).throttled()
+
+    def succeeded(self, model_id):
+        self._limiter(model_id).succeeded()
+
+
+class RemoteLimiter:
+    """ModelRateLimiter interface over a SharedLimiters proxy; waits happen in the calling process."""
+
+    def __init__(self, shared, model_id):
+        self.shared = shared
+        self.model_id = model_id
+
+    def acquire(self, tokens=1):
+        wait = self.shared.reserve(self.model_id, tokens)
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+
+    def settle(self, reserved, used):
+        if reserved > used:
+            self.shared.settle(self.model_id, reserved, used)
+
+    def configure(self, rpm=None, tpm=None):
+        self.shared.configure(self.model_id, rpm, tpm)
+
+    def throttled(self):
+        self.shared.throttled(self.model_id)
+
+    def succeeded(self):
+        self.shared.succeeded(self.model_id)
+
+
+class RateLimitManager(BaseManager):
+    pass
+
+
+RateLimitManager.register("SharedLimiters", SharedLimiters)
+
+_schedulers = {}
+_schedulers_lock = threading.Lock()
+_shared = None
+
+
+def start_shared_limiters():
+    """Start a manager process holding the rate budgets of MODEL_LIMITS; returns (manager, proxy).
+
+    Pass the proxy to use_shared_limiters() in each worker process, and shut the
+    manager down once the workers are done.
+    """
+    manager = RateLimitManager()
+    manager.start()
+    return manager, manager.SharedLimiters(MODEL_LIMITS, DEFAULT_LIMITS)
+
+
+def use_shared_limiters(shared):
+    """Make this process draw from the shared budgets of a SharedLimiters proxy (None goes back to local ones)."""
+    global _shared
+    with _schedulers_lock:
+        _shared = shared
+        _schedulers.clear()
+
+
+def configure_limits(model_id, rpm=None, tpm=None):
+    """Set the requests/tokens per minute budget of `model_id`, also for calls already in flight."""
+    with _schedulers_lock:
+        limits = MODEL_LIMITS.setdefault(model_id, dict(DEFAULT_LIMITS))
+        limits.update({key: value for key, value in (("rpm", rpm), ("tpm", tpm)) if value})
+        scheduler = _schedulers.get(model_id)
+    if scheduler is not None:
+        scheduler.limiter.configure(**limits)
+
+
+def get_scheduler(model_id):
+    """Return the scheduler shared by every call to `model_id` in this process."""
+    with _schedulers_lock:
+        scheduler = _schedulers.get(model_id)
+        if scheduler is None:
+            if _shared is not None:
+                limiter = RemoteLimiter(_shared, model_id)
+            else:
+                limits = MODEL_LIMITS.get(model_id, DEFAULT_LIMITS)
+                limiter = ModelRateLimiter(limits["rpm"], limits["tpm"])
+            scheduler = _schedulers[model_id] = RetryScheduler(limiter)
+    return scheduler
+
+
+def call_model(model_id, func, *args, tokens=1, stage=None, **kwargs):
+    """Call `func(*args, **kwargs)` within `model_id`'s rate budget, retrying throttled and transient failures.
+
+    `tokens` is the call's reservation against the tokens-per-minute budget: its
+    estimated input tokens plus its max_tokens, as Bedrock counts them.
+    """
+    return get_scheduler(model_id).call(func, *args, tokens=tokens, stage=stage, model_id=model_id, **kwargs)
+
+
+def settle_tokens(model_id, reserved, used):
+    """Return the unused part of a call's token reservation once its actual usage is known."""
+    get_scheduler(model_id).limiter.settle(reserved, used)
+
+
+class DeadLetterQueue:
+    """SQLite record of the items whose model calls failed permanently.
+
+    The pipeline skips such an item and goes on; since its stage output was never
+    checkpointed, the next run retries it, and a successful retry removes the entry.
+    """
+
+    def __init__(self, path=DEAD_LETTER_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = connect(path)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS dead_letters ("
+            "consultation TEXT, item TEXT, stage TEXT, error TEXT, failures INTEGER, first_failed REAL, "
+            "last_failed REAL, PRIMARY KEY (consultation, item))"
+        )
+        self._conn.commit()
+
+    def put(self, consultation, item, stage, error):
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO dead_letters (consultation, item, stage, error, failures, first_failed, last_failed) "
+                "VALUES (?, ?, ?, ?, 1, ?, ?) ON CONFLICT (consultation, item) DO UPDATE SET "
+                "stage = excluded.stage, error = excluded.error, failures = failures + 1, "
+                "last_failed = excluded.last_failed",
+                (consultation, item, stage, str(error), now, now),
+            )
+            self._conn.commit()
+
+    def remove(self, consultation, item):
+        with self._lock:
+            self._conn.execute("DELETE FROM dead_letters WHERE consultation = ? AND item = ?", (consultation, item))
+            self._conn.commit()
+
+    def items(self, consultation=None):
+        """Return the dead letters as dicts, oldest first."""
+        query = "SELECT consultation, item, stage, error, failures, first_failed, last_failed FROM dead_letters"
+        params = ()
+        if consultation is not None:
+            query += " WHERE consultation = ?"
+            params = (consultation,)
+        with self._lock:
+            rows = self._conn.execute(query + " ORDER BY first_failed", params).fetchall()
+        fields = ("consultation", "item", "stage", "error", "failures", "first_failed", "last_failed")
+        return [dict(zip(fields, row)) for row in rows]
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM dead_letters")
+            self._conn.commit()
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,174 @@
+import hashlib
+import math
+import re
+import unicodedata
+from collections import Counter, defaultdict
+
+RELEVANT = "relevant"
+IRRELEVANT = "irrelevant"
+AMBIGUOUS = "ambiguous"
+
+DEFAULT_CONFIG = {
+    # Comments shorter than this (in characters, after trimming) are dropped
+    "min_chars": 15,
+    # Share of letters among the non-space characters; links, numbers and symbol spam fall below it
+    "min_letter_ratio": 0.5,
+    # Share of Greek letters among the letters; English comments stay ambiguous instead of being dropped
+    "min_greek_ratio": 0.0,
+    # TF-IDF cosine similarity to the article: below the first the comment is off-topic,
+    # at or above the second it is accepted without asking the model
+    "drop_similarity": 0.02,
+    "keep_similarity": 0.35,
+    # Maximum Hamming distance between SimHash fingerprints of near-duplicate comments
+    "max_hamming": 3,
+}
+
+WORD = re.compile(r"\w+")
+# Greek is heavily inflected; truncating words is a cheap stand-in for stemming
+STEM_LENGTH = 6
+
+
+def _normalize(text):
+    text = unicodedata.normalize("NFD", str(text).casefold())
+    return "".join(ch for ch in text if not unicodedata.combining(ch))
+
+
+def _terms(text):
+    return [word[:STEM_LENGTH] for word in WORD.findall(_normalize(text)) if len(word) > 2 and not word.isdigit()]
+
+
+def simhash(text, bits=64):
+    """64-bit SimHash over word trigrams (single words for very short texts)."""
+    words = WORD.findall(_normalize(text))
+    features = [" ".join(words[i:i + 3]) for i in range(max(1, len(words) - 2))] if len(words) >= 3 else words
+    weights = [0] * bits
+    for feature, count in Counter(features).items():
+        value = int.from_bytes(hashlib.blake2b(feature.encode("utf-8"), digest_size=8).digest(), "big")
+        for bit in range(bits):
+            weights[bit] += count if value >> bit & 1 else -count
+    return sum(1 << bit for bit in range(bits) if weights[bit] > 0)
+
+
+def find_duplicates(comments, max_hamming=3):
+    """Return, for each comment, the index of the earlier comment it (nearly) duplicates, or None.
+
+    Candidates are found through four 16-bit bands of the SimHash: two fingerprints within
+    3 bits of each other always share at least one band, so no pairwise scan is needed.
+    """
+    duplicate_of = [None] * len(comments)
+    exact = {}
+    bands = defaultdict(list)
+    for idx, comment in enumerate(comments):
+        normalized = " ".join(WORD.findall(_normalize(comment)))
+        if normalized in exact:
+            duplicate_of[idx] = exact[normalized]
+            continue
+        exact[normalized] = idx
+
+        fingerprint = simhash(comment)
+        keys = [(band, fingerprint >> (16 * band) & 0xFFFF) for band in range(4)]
+        for key in keys:
+            for other, other_fingerprint in bands[key]:
+                if bin(fingerprint ^ other_fingerprint).count("1") <= max_hamming:
+                    duplicate_of[idx] = other
+                    break
+            if duplicate_of[idx] is not None:
+                break
+        if duplicate_of[idx] is None:
+            for key in keys:
+                bands[key].append((idx, fingerprint))
+    return duplicate_of
+
+
+def tfidf_similarities(article, comments):
+    """Cosine similarity between the TF-IDF vector of the article and that of each comment."""
+    documents = [Counter(_terms(article))] + [Counter(_terms(comment)) for comment in comments]
+    document_frequency = Counter(term for document in documents for term in document)
+    total = len(documents)
+
+    def vector(document):
+        weights = {term: count * (math.log((total + 1) / (document_frequency[term] + 1)) + 1)
+                   for term, count in document.items()}
+        norm = math.sqrt(sum(weight * weight for weight in weights.values()))
+        return weights, norm
+
+    article_vector, article_norm = vector(documents[0])
+    similarities = []
+    for document in documents[1:]:
+        comment_vector, comment_norm = vector(document)
+        if not article_norm or not comment_norm:
+            similarities.append(0.0)
+            continue
+        dot = sum(weight * article_vector.get(term, 0.0) for term, weight in comment_vector.items())
+        similarities.append(dot / (article_norm * comment_norm))
+    return similarities
+
+
+def _is_text(comment, config):
+    characters = [ch for ch in str(comment) if not ch.isspace()]
+    letters = [ch for ch in characters if ch.isalpha()]
+    if not characters or len(letters) / len(characters) < config["min_letter_ratio"]:
+        return False
+    greek = sum(1 for ch in letters if "GREEK" in unicodedata.name(ch, ""))
+    return greek / len(letters) >= config["min_greek_ratio"]
+
+
+def prefilter_comments(article, comments, config=None):
+    """Classify comments as RELEVANT, IRRELEVANT or AMBIGUOUS without calling the model.
+
+    Returns (labels, duplicate_of, stats). Near-duplicates are labelled like the comment
+    they duplicate; only AMBIGUOUS comments need a relevance score from the model.
+    """
+    config = {**DEFAULT_CONFIG, **(config or {})}
+    duplicate_of = find_duplicates(comments, config["max_hamming"])
+    originals = [idx for idx, original in enumerate(duplicate_of) if original is None]
+    similarities = dict(zip(originals, tfidf_similarities(article, [comments[idx] for idx in originals])))
+
+    stats = Counter(total=len(comments))
+    labels = [None] * len(comments)
+    for idx in originals:
+        comment = comments[idx]
+        if not isinstance(comment, str) or len(comment.strip()) < config["min_chars"]:
+            labels[idx] = IRRELEVANT
+            stats["too_short"] += 1
+        elif not _is_text(comment, config):
+            labels[idx] = IRRELEVANT
+            stats["not_text"] += 1
+        elif similarities[idx] < config["drop_similarity"]:
+            labels[idx] = IRRELEVANT
+            stats["off_topic"] += 1
+        elif similarities[idx] >= config["keep_similarity"]:
+            labels[idx] = RELEVANT
+            stats["on_topic"] += 1
+        else:
+            labels[idx] = AMBIGUOUS
+            stats["ambiguous"] += 1
+
+    for idx, original in enumerate(duplicate_of):
+        if original is not None:
+            labels[idx] = labels[original]
+            stats["duplicates"] += 1
+
+    stats["llm_calls_skipped"] = len(comments) - stats["ambiguous"]
+    return labels, duplicate_of, dict(stats)
+
+
+def filter_relevant(article, comments, score_comments, threshold=50, config=None):
+    """Return the relevant comments, scoring only the ambiguous ones with `score_comments(article, comments)`.
+
+    A None score (a reply that could not be parsed) drops the comment like a score of 0.
+    """
+    labels, duplicate_of, stats = prefilter_comments(article, comments, config)
+    ambiguous = [idx for idx, label in enumerate(labels) if label == AMBIGUOUS and duplicate_of[idx] is None]
+    print(f"Prefilter: {stats}")
+
+    keep = [label == RELEVANT for label in labels]
+    if ambiguous:
+        scores = score_comments(article, [comments[idx] for idx in ambiguous])
+        for idx, score in zip(ambiguous, scores):
+            keep[idx] = score is not None and score >= threshold
+    for idx, original in enumerate(duplicate_of):
+        if original is not None:
+            keep[idx] = keep[original]
+
+    return [comment for comment, kept in zip(comments, keep) if kept]
@@ -1,94 +1,264 @@
 import json
-from botocore.exceptions import ClientError
+import re
 from credentials import get_bedrock_client
+from llm_cache import CacheMiss, get_cache
+from metrics import current_span, record_usage, span
+from rate_limit import call_model, settle_tokens
 
+# Set the model ID
+model_id = "arn:aws:bedrock:us-east-1:043309345392:inference-profile/us.anthropic.claude-3-5-sonnet-20240620-v1:0"
 
-def relevance_claude(article, comment):
-    # Create an Amazon Bedrock Runtime client.
-    brt = get_bedrock_client()
-
-    # Set the model ID
-    model_id = "arn:aws:bedrock:us-east-1:043309345392:inference-profile/us.anthropic.claude-3-5-sonnet-20240620-v1:0"
+# Bump when the prompts below change so cached scores are not reused
+PROMPT_VERSION = "relevance-v4"
+BATCH_PROMPT_VERSION = "relevance-batch-v2"
 
-    # Define the prompt for the model
-    prompt = f"""
-    Look at the relevance of the <comment>, given relative to the {article} that they are assigned to based on the parameters listed below, and provide a score out of 100 for not only 
-    how they progress deliberation on the matter but also relate to the topic and overall discussion of the article itself.
-
-    <comment>
-    {comment}
+# Output budgets: a single score is a short integer, a batch needs ~15 tokens of JSON per comment
+SCORE_MAX_TOKENS = 8
+BATCH_MAX_TOKENS_PER_COMMENT = 15
+BATCH_PREFILL = '{"scores": ['
+# A single score is prefilled with the opening tag and cut off at the closing one
+SCORE_PREFILL = "<score>"
+SCORE_STOP = "</score>"
 
-    You will be given:
-    1. Only the total score an int. Total score is the {{sum}} of the scores that will get for each category bellow.
+# Mark the fixed system prompt/rubric and the article as cacheable prefixes. Only enable
+# this for models and regions where Bedrock supports prompt caching.
+PROMPT_CACHING = False
 
-    You must produce, in order:
+SYSTEM_PROMPT = ("You are an assistant that is meant to act is a deliberation tool and moderate online forums and debates. You are associated with the AI4Deliberation group in the "
+                 "University of Macedonia with the sole purpose of analyzing the articles and comments that are given to you, providing ratings and summaries of debates and deliberations, "
+                 "and synthesizing reports")
 
-    **Α. Comment Evaluation & Scoring**  
+RUBRIC = """
+    **Α. Comment Evaluation & Scoring**
     For each comment, assign a **Relevance Score** out of 100 according to these parameters:
-    1. **Topical Focus (0–30)**  
-       - +points for precision and depth on the article’s topic.  
-       - +bonus if it introduces a related subtopic.  
+    1. **Topical Focus (0–30)**
+       - +points for precision and depth on the article’s topic.
+       - +bonus if it introduces a related subtopic.
        - –penalty if off-topic or irrelevant; mark “Remove” if completely unrelated.
-    2. **Evidence Introduction (0–25)**  
-       - +points if it brings new, relevant evidence.  
+    2. **Evidence Introduction (0–25)**
+       - +points if it brings new, relevant evidence.
        - +bonus for expanding discussion into novel areas.
-    3. **Evidence Validity (0–20)**  
-       - +points if factually correct.  
+    3. **Evidence Validity (0–20)**
+       - +points if factually correct.
        - –points if demonstrably false (cite a counter-source).
-    4. **Engagement Impact (0–15)**  
-       - +points if others reply or engage with the comment.  
+    4. **Engagement Impact (0–15)**
+       - +points if others reply or engage with the comment.
        - If no engagement, score 0 here but do not penalize overall.
-    5. **Originality (0–10)**  
-       - +points if the idea is unique in the thread.  
-       - –points if it repeats earlier arguments.
+    5. **Originality (0–10)**
+       - +points if the idea is unique in the thread.
+       - –points if it repeats earlier arguments."""
+
+SCORING_INSTRUCTIONS = f"""
+
+    Look at the relevance of each <comment>, given relative to the <article> that it is assigned to based on the parameters listed below, and provide a score out of 100 for not only
+    how it progresses deliberation on the matter but also relates to the topic and overall discussion of the article itself.
+
+    The total score of a comment is the {{sum}} of the scores that it will get for each category bellow.
+{RUBRIC}
+
+    If a comment is completely irelevant score it with 0."""
+
+
+def estimate_tokens(text):
+    """Rough token count for budgeting; Greek text averages about two characters per token."""
+    return len(text) // 2 + 1
+
+
+def relevance_claude(article, comment):
+    with span("relevance", comments=1):
+        return get_cache().cached(model_id, PROMPT_VERSION, {"article": article, "comment": comment},
+                                  lambda: _invoke_relevance(article, comment),
+                                  cacheable=lambda reply: parse_score(reply) is not None)
+
+
+def parse_score(response_text):
+    """Return the score in a single-comment reply as an int, or None if there is no valid score."""
+    match = re.search(r"\d+", response_text or "")
+    if not match:
+        return None
+    score = int(match.group(0))
+    return score if 0 <= score <= 100 else None
+
+
+def _article_block(article):
+    return _text_block(f"<article>\n{article}\n</article>", cache=PROMPT_CACHING)
+
+
+def _invoke_relevance(article, comment):
+    content = [
+        _article_block(article),
+        _text_block(f"""
+    <comment>
+    {comment}
+    </comment>
+
+    Return only the total score as an int inside <score></score> tags, without any comments or explanations.
+    """),
+    ]
+
+    # A bare integer needs a handful of tokens; the closing tag stops any explanation after it
+    reply = _invoke(content, max_tokens=SCORE_MAX_TOKENS, stop_sequences=[SCORE_STOP], prefill=SCORE_PREFILL)
+    return reply[len(SCORE_PREFILL):].replace(SCORE_STOP, "").strip()
+
 
-    return only the total score without any comments or explanations. If the comment is completely irelevant score it with 0. 
+def _batch_content(article, comments):
+    comment_blocks = "\n".join(
+        f'    <comment id="{idx + 1}">\n    {comment}\n    </comment>' for idx, comment in enumerate(comments)
+    )
+    return [
+        _article_block(article),
+        _text_block(f"""
+{comment_blocks}
 
-    1st Example of output:
-    0 
-    2nd Example of output:
-    29
+    Score every comment on its own. Return only a JSON object without any comments or explanations, with one entry per comment id.
+
+    Example of output for 2 comments:
+    {{"scores": [{{"id": 1, "score": 0}}, {{"id": 2, "score": 29}}]}}
+    """),
+    ]
+
+
+def _batch_prompt(article, comments):
+    return SYSTEM_PROMPT + SCORING_INSTRUCTIONS + "".join(block["text"] for block in _batch_content(article, comments))
+
+
+def parse_batch_scores(response_text, count):
+    """Return the scores of a batch response in comment order, or raise ValueError if it is malformed."""
+    match = re.search(r"\{.*\}", response_text, re.DOTALL)
+    if not match:
+        raise ValueError("No JSON object in batch response")
+    entries = json.loads(match.group(0))["scores"]
+    scores = {}
+    for entry in entries:
+        score = int(entry["score"])
+        if not 0 <= score <= 100:
+            raise ValueError(f"Score out of range: {score}")
+        scores[int(entry["id"])] = score
+    if sorted(scores) != list(range(1, count + 1)):
+        raise ValueError(f"Expected scores for ids 1..{count}, got {sorted(scores)}")
+    return [scores[idx + 1] for idx in range(count)]
+
+
+def make_batches(article, comments, token_budget=8000, max_batch_size=25):
+    """Split comment indexes into batches whose prompts fit in `token_budget` input tokens."""
+    fixed_tokens = estimate_tokens(_batch_prompt(article, []))
+    batches = []
+    batch = []
+    batch_tokens = fixed_tokens
+    for idx, comment in enumerate(comments):
+        # ~20 tokens of per-comment markup and JSON output
+        comment_tokens = estimate_tokens(comment) + 20
+        if batch and (batch_tokens + comment_tokens > token_budget or len(batch) >= max_batch_size):
+            batches.append(batch)
+            batch = []
+            batch_tokens = fixed_tokens
+        batch.append(idx)
+        batch_tokens += comment_tokens
+    if batch:
+        batches.append(batch)
+    return batches
+
+
+def relevance_claude_batch(article, comments, token_budget=8000, max_batch_size=25):
+    """Score many comments against one article, packing several comments into each Bedrock request.
+
+    Returns one int score per comment, in order. Batches are sized to `token_budget`
+    input tokens; a batch whose response cannot be parsed is re-scored one comment at a time.
+    A comment whose own reply cannot be parsed either gets None instead of a score, and
+    nothing is cached for it, so the next run scores it again.
     """
+    with span("relevance", comments=len(comments)):
+        return _relevance_batch(article, comments, token_budget, max_batch_size)
+
+
+def _relevance_batch(article, comments, token_budget, max_batch_size):
+    cache = get_cache()
+    scores = [None] * len(comments)
+    keys = [cache.key(model_id, BATCH_PROMPT_VERSION, {"article": article, "comment": comment}) for comment in comments]
+
+    pending = []
+    for idx, key in enumerate(keys):
+        found, score = cache.get(key)
+        if found:
+            scores[idx] = score
+        elif cache.cache_only:
+            raise CacheMiss(f"No cached relevance score for comment {idx + 1}")
+        else:
+            pending.append(idx)
 
-    # Format the request payload (back to simple text)
+    pending_comments = [comments[idx] for idx in pending]
+    current_span().set(scored=len(pending))
+    for batch in make_batches(article, pending_comments, token_budget, max_batch_size):
+        batch_comments = [pending_comments[idx] for idx in batch]
+        try:
+            # Prefilling the answer with the JSON prefix keeps the model in structured-output mode
+            response_text = _invoke(_batch_content(article, batch_comments),
+                                    max_tokens=BATCH_MAX_TOKENS_PER_COMMENT * len(batch_comments) + 20,
+                                    prefill=BATCH_PREFILL)
+            batch_scores = parse_batch_scores(response_text, len(batch_comments))
+        except (ValueError, KeyError, TypeError) as e:
+            print(f"Batch of {len(batch_comments)} comments could not be parsed ({e}), scoring individually")
+            batch_scores = [_single_score(article, comment) for comment in batch_comments]
+
+        for idx, score in zip(batch, batch_scores):
+            scores[pending[idx]] = score
+            if score is not None:
+                cache.set(keys[pending[idx]], score)
+
+    return scores
+
+
+def _single_score(article, comment):
+    """Score one comment; None for an empty or non-numeric reply instead of failing the article."""
+    reply = relevance_claude(article, comment)
+    score = parse_score(reply)
+    if score is None:
+        print(f"Relevance reply {reply!r} has no score")
+    return score
+
+
+def _text_block(text, cache=False):
+    block = {"type": "text", "text": text}
+    if cache:
+        block["cache_control"] = {"type": "ephemeral"}
+    return block
+
+
+def _invoke(content, max_tokens, stop_sequences=(), prefill=None):
+    # Create an Amazon Bedrock Runtime client.
+    brt = get_bedrock_client()
+
+    messages = [{"role": "user", "content": content}]
+    if prefill:
+        messages.append({"role": "assistant", "content": [_text_block(prefill)]})
+
+    # The system prompt and rubric are identical for every call, so they form the cached prefix
     native_request = {
         "anthropic_version": "bedrock-2023-05-31",
-        "max_tokens": 131072,
+        "max_tokens": max_tokens,
         "top_k": 250,
-        "stop_sequences": [],
+        "stop_sequences": list(stop_sequences),
         "temperature": 0,
         "top_p": 0.999,
-        "system": "You are an assistant that is meant to act is a deliberation tool and moderate online forums and debates. You are associated with the AI4Deliberation group in the "
-                  "University of Macedonia with the sole purpose of analyzing the articles and comments that are given to you, providing ratings and summaries of debates and deliberations, "
-                  "and synthesizing reports",
-        "messages": [
-            {
-                "role": "user",
-                "content": [
-                    {
-                        "type": "text",
-                        "text": prompt
-                    }
-                ]
-            }
-        ]
+        "system": [_text_block(SYSTEM_PROMPT + SCORING_INSTRUCTIONS, cache=PROMPT_CACHING)],
+        "messages": messages
     }
 
     # Convert the native request to JSON
     request = json.dumps(native_request)
 
-    try:
-        # Invoke the model with the request
-        response = brt.invoke_model(modelId=model_id, body=request)
-
-    except (ClientError, Exception) as e:
-        print(f"ERROR: Can't invoke '{model_id}'. Reason: {e}")
-        exit(1)
+    # Invoke the model within its rate budget; throttled calls are retried, and a call that
+    # keeps failing raises rate_limit.ModelCallFailed instead of ending the process
+    reserved = estimate_tokens(request) + max_tokens
+    response = call_model(model_id, brt.invoke_model, modelId=model_id, body=request, tokens=reserved, stage="relevance")
 
     # Decode the response body
     model_response = json.loads(response["body"].read())
+    usage = model_response.get("usage", {})
+    record_usage("relevance", usage)
+    settle_tokens(model_id, reserved, sum(usage.get(field) or 0 for field in ("input_tokens", "output_tokens")))
 
-    # Extract and print the response text
-    response_text = model_response['content'][0]['text']
+    # Extract the response text; a reply stopped before any text counts as an empty, unparsable one
+    response_text = "".join(block.get("text", "") for block in model_response.get("content") or [])
 
-    return response_text
\ No newline at end of file
+    return (prefill or "") + response_text
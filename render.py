@@ -0,0 +1,204 @@
+import json
+import math
+import re
+from collections import defaultdict
+
+NODE_COLORS = {
+    "Article": "#00F8FF",
+    "Issue": "#97C2FC",
+    "Position": "#FFCC00",
+    "Supported_arguments": "#7BE141",
+    "Object_arguments": "#FF9999",
+}
+DEFAULT_COLOR = "#DDDDDD"
+
+# Distance between the rings of the radial layout, and minimum arc length per leaf
+RING_SPACING = 400
+LEAF_SPACING = 60
+
+# pyvis templates load Bootstrap from a CDN even with in-line resources; the graph does not need it
+CDN_TAGS = re.compile(r'\s*<(link|script)\b[^>]*https?://cdn\.jsdelivr\.net/[^>]*>(\s*</script>)?')
+
+CLUSTER_SCRIPT = """
+<script type="text/javascript">
+  // Level of detail: collapse the Positions/Arguments of each large Issue into one node.
+  // Double-click a cluster to expand it.
+  (function () {
+    var clusters = %s;
+    clusters.forEach(function (cluster) {
+      network.cluster({
+        joinCondition: function (node) { return node.cid === cluster.cid; },
+        clusterNodeProperties: {
+          id: "cluster:" + cluster.cid, label: cluster.label, shape: "box",
+          color: "#FFE680", x: cluster.x, y: cluster.y, physics: false
+        }
+      });
+    });
+    network.on("doubleClick", function (params) {
+      if (params.nodes.length === 1 && network.isCluster(params.nodes[0])) {
+        network.openCluster(params.nodes[0]);
+      }
+    });
+  })();
+</script>
+"""
+
+
+def _tree(merged_graph):
+    """Children lists and roots of the graph, using the first incoming edge of each node as its parent."""
+    node_ids = [node.id for node in merged_graph['nodes']]
+    children = defaultdict(list)
+    parent = {}
+    for rel in merged_graph['relationships']:
+        source, target = rel['source_id'], rel['target_id']
+        if target not in parent and source != target:
+            parent[target] = source
+            children[source].append(target)
+    roots = [node_id for node_id in node_ids if node_id not in parent]
+    # Nodes only reachable through a cycle have a parent but no root; promote one per cycle
+    reachable = set()
+    stack = list(roots)
+    while stack:
+        node_id = stack.pop()
+        if node_id in reachable:
+            continue
+        reachable.add(node_id)
+        stack.extend(children[node_id])
+    for node_id in node_ids:
+        if node_id not in reachable:
+            roots.append(node_id)
+            stack = [node_id]
+            while stack:
+                current = stack.pop()
+                if current in reachable:
+                    continue
+                reachable.add(current)
+                stack.extend(children[current])
+    return children, roots
+
+
+def radial_layout(merged_graph):
+    """Deterministic radial tree layout: {node_id: (x, y)}.
+
+    Roots (Articles) sit on the inner ring, and every subtree gets an angular sector
+    proportional to its number of leaves, so the whole layout is computed in O(n)
+    without any force simulation.
+    """
+    children, roots = _tree(merged_graph)
+
+    # Post-order leaf counts, iteratively to stay clear of the recursion limit
+    leaves = {}
+    visited = set()
+    max_depth = 1
+    for root in roots:
+        stack = [(root, 0, False)]
+        while stack:
+            node_id, depth, expanded = stack.pop()
+            if expanded:
+                leaves[node_id] = sum(leaves.get(child, 0) for child in children[node_id]) or 1
+                continue
+            if node_id in visited:
+                continue
+            visited.add(node_id)
+            max_depth = max(max_depth, depth)
+            stack.append((node_id, depth, True))
+            stack.extend((child, depth + 1, False) for child in children[node_id] if child not in visited)
+
+    total = sum(leaves.get(root, 1) for root in roots) or 1
+    # Widen the rings until the outermost one has room for every leaf
+    ring_spacing = max(RING_SPACING, total * LEAF_SPACING / (2 * math.pi * max_depth))
+    offset = 0 if len(roots) == 1 else 1
+
+    positions = {}
+    start = 0.0
+    for root in roots:
+        sector = 2 * math.pi * leaves.get(root, 1) / total
+        stack = [(root, start, sector, 0)]
+        while stack:
+            node_id, angle, width, depth = stack.pop()
+            if node_id in positions:
+                continue
+            radius = (depth + offset) * ring_spacing
+            middle = angle + width / 2
+            positions[node_id] = (radius * math.cos(middle), radius * math.sin(middle))
+            child_angle = angle
+            for child in children[node_id]:
+                child_width = width * leaves.get(child, 1) / leaves.get(node_id, 1)
+                stack.append((child, child_angle, child_width, depth + 1))
+                child_angle += child_width
+        start += sector
+    return positions
+
+
+def issue_groups(merged_graph):
+    """Map every Position/Argument node to the Issue it hangs from (through its Position)."""
+    types = {node.id: node.type for node in merged_graph['nodes']}
+    children, _ = _tree(merged_graph)
+    groups = {}
+    for issue in (node_id for node_id, node_type in types.items() if node_type == "Issue"):
+        stack = list(children[issue])
+        while stack:
+            node_id = stack.pop()
+            if node_id in groups or types.get(node_id) in ("Issue", "Article"):
+                continue
+            groups[node_id] = issue
+            stack.extend(children[node_id])
+    return groups
+
+
+def render_static(merged_graph, path, cluster_threshold=25):
+    """Render a merged graph to a self-contained HTML file with a precomputed layout.
+
+    The layout is computed here instead of by the browser's physics engine, the
+    vis-network assets are inlined and pyvis' Bootstrap CDN tags stripped so the file
+    opens offline, and Issues with more than `cluster_threshold` Positions/Arguments
+    start collapsed into one cluster node.
+    """
+    from pyvis.network import Network
+
+    positions = radial_layout(merged_graph)
+    groups = issue_groups(merged_graph)
+    issue_ids = {issue: idx for idx, issue in enumerate(sorted(set(groups.values())))}
+    group_sizes = defaultdict(int)
+    for issue in groups.values():
+        group_sizes[issue] += 1
+
+    net = Network(cdn_resources="in_line", directed=True, height='100vh', width='100%')
+    for node in merged_graph['nodes']:
+        label = node.id[:40] + '...' if len(node.id) > 40 else node.id
+        x, y = positions.get(node.id, (0.0, 0.0))
+        options = {}
+        if node.id in groups:
+            options["cid"] = issue_ids[groups[node.id]]
+        net.add_node(node.id, label=label, title=node.id, color=NODE_COLORS.get(node.type, DEFAULT_COLOR),
+                     x=x, y=y, physics=False, **options)
+
+    for rel in merged_graph['relationships']:
+        net.add_edge(rel["source_id"], rel["target_id"], label=rel["type"], arrows='to')
+
+    net.set_options(json.dumps({
+        "nodes": {"shape": "box", "font": {"face": "arial", "size": 14}},
+        "edges": {"arrows": {"to": {"enabled": True}}, "smooth": False},
+        "physics": {"enabled": False},
+        "interaction": {"hideEdgesOnDrag": True, "hideEdgesOnZoom": True},
+    }))
+
+    # Each cluster node is placed at the centroid of the nodes it collapses
+    centroids = defaultdict(lambda: [0.0, 0.0])
+    for node_id, issue in groups.items():
+        x, y = positions.get(node_id, (0.0, 0.0))
+        centroids[issue][0] += x / group_sizes[issue]
+        centroids[issue][1] += y / group_sizes[issue]
+
+    clusters = []
+    for issue, cid in issue_ids.items():
+        if group_sizes[issue] > cluster_threshold:
+            x, y = centroids[issue]
+            clusters.append({"cid": cid, "label": f"{issue[:30]}: {group_sizes[issue]} κόμβοι", "x": x, "y": y})
+
+    html = CDN_TAGS.sub("", net.generate_html())
+    if clusters:
+        html = html.replace("</body>", CLUSTER_SCRIPT % json.dumps(clusters, ensure_ascii=False) + "</body>")
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(html)
+    return path
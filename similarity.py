@@ -0,0 +1,262 @@
+import unicodedata
+import numpy as np
+from scipy import sparse
+from scipy.sparse.csgraph import connected_components
+from graph_store import EDGE_PUNCTUATION, WHITESPACE
+
+NGRAM_SIZES = (3, 4, 5)
+# Hashed n-gram features; collisions only add a little noise to the cosine similarities
+N_FEATURES = 2 ** 18
+SIGNATURE_BITS = 128
+# Random bit orders the signatures are sorted by, and how many following rows each row is compared with
+PERMUTATIONS = 24
+WINDOW = 8
+# Rows per batch of sparse products, which bounds the memory of the temporaries
+BATCH_SIZE = 65536
+CLUSTER_THRESHOLD = 0.8
+
+_FNV_PRIME = np.uint64(1099511628211)
+_POPCOUNT = np.array([bin(byte).count("1") for byte in range(256)], dtype=np.uint8)
+_MIX = np.uint64(0x9E3779B97F4A7C15)
+
+
+def normalize_labels(labels):
+    """graph_store.normalize_label of every label, with one pass of each step over all of them."""
+    text = unicodedata.normalize("NFD", "\0".join(map(str, labels)).casefold())
+    text = text.translate({ord(ch): None for ch in set(text) if unicodedata.combining(ch)})
+    return [label.strip(EDGE_PUNCTUATION) for label in WHITESPACE.sub(" ", text).split("\0")] if labels else []
+
+
+def _ngram_features(labels, ngram_sizes, n_features):
+    """(row, feature) of every character n-gram of the normalized labels, hashed with numpy array ops."""
+    padded = [f" {label} " for label in normalize_labels(labels)]
+    lengths = np.fromiter(map(len, padded), dtype=np.int64, count=len(padded))
+    codes = np.frombuffer("".join(padded).encode("utf-32-le"), dtype=np.uint32).astype(np.uint64)
+    row_of_char = np.repeat(np.arange(len(padded)), lengths)
+    label_end = np.repeat(np.cumsum(lengths), lengths)
+
+    rows, features = [], []
+    for n in ngram_sizes:
+        count = len(codes) - n + 1
+        if count <= 0:
+            continue
+        hashes = np.full(count, n, dtype=np.uint64)
+        for offset in range(n):
+            hashes = hashes * _FNV_PRIME + codes[offset:offset + count]
+        hashes = (hashes ^ (hashes >> np.uint64(29))) * _MIX
+        # Drop the windows that run into the next label
+        valid = np.arange(count) + n <= label_end[:count]
+        rows.append(row_of_char[:count][valid])
+        features.append((hashes[valid] >> np.uint64(32)) % np.uint64(n_features))
+    if not rows:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+    return np.concatenate(rows), np.concatenate(features).astype(np.int64)
+
+
+def _max_hamming(threshold):
+    """Signature bits two labels with cosine similarity `threshold` differ in, plus three standard deviations."""
+    p = np.arccos(np.clip(threshold, -1, 1)) / np.pi
+    return SIGNATURE_BITS * p + 3 * np.sqrt(SIGNATURE_BITS * p * (1 - p))
+
+
+def _l2_normalize(matrix):
+    norms = np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=1)).ravel())
+    norms[norms == 0] = 1
+    normalized = sparse.diags(1 / norms).dot(matrix).tocsr()
+    # Canonical rows (sorted, unique indices) keep the element-wise products linear
+    normalized.sum_duplicates()
+    return normalized
+
+
+class LabelIndex:
+    """Character n-gram TF-IDF vectors of node labels with an approximate nearest-neighbour lookup.
+
+    Labels are normalized (graph_store.normalize_label) and turned into hashed 3-5
+    character n-grams, weighted by sublinear TF and IDF into L2-normalized sparse rows,
+    so the cosine similarity of two labels is the dot product of their rows. This is
+    robust to the inflections, word order and typos of paraphrased Greek positions.
+
+    Neighbour candidates come from random-hyperplane signatures instead of comparing
+    every pair: the rows are sorted by `permutations` random bit orders of their
+    128-bit signatures, and each row is compared with the `window` rows that follow it.
+    Similar labels have signatures that differ in few bits, so they sort close together
+    for some order. Labels of different `groups` (e.g. node types) are never compared.
+    """
+
+    def __init__(self, labels, groups=None, ngram_sizes=NGRAM_SIZES, n_features=N_FEATURES,
+                 permutations=PERMUTATIONS, window=WINDOW, seed=0):
+        self.labels = list(labels)
+        self.ngram_sizes = ngram_sizes
+        self.n_features = n_features
+        self.window = window
+        n = len(self.labels)
+        if groups is None:
+            self.group_names = [None]
+            self.groups = np.zeros(n, dtype=np.int64)
+        else:
+            self.group_names, self.groups = np.unique(np.asarray(list(groups), dtype=object).astype(str),
+                                                      return_inverse=True)
+            self.group_names = list(self.group_names)
+
+        tf = self._term_frequencies(self.labels)
+        document_frequency = np.bincount(tf.indices, minlength=n_features)
+        self.idf = (np.log((1 + n) / (1 + document_frequency)) + 1).astype(np.float32)
+        self.vectors = self._weigh(tf)
+
+        rng = np.random.default_rng(seed)
+        # Very sparse random projections (+-1 on ~1/16 of the features per bit)
+        self._planes = sparse.random(n_features, SIGNATURE_BITS, density=1 / 16, format="csr", dtype=np.float32,
+                                     random_state=rng, data_rvs=lambda size: rng.choice([-1.0, 1.0], size))
+        self._permutations = [rng.permutation(SIGNATURE_BITS) for _ in range(permutations)]
+        signatures = self._signatures(self.vectors)
+        self._packed = np.packbits(signatures, axis=1)
+        self._sort_keys = [self._sort_key(signatures, order, self.groups) for order in self._permutations]
+        self._sorted = [np.argsort(keys, kind="stable") for keys in self._sort_keys]
+        self._sorted_keys = [keys[order] for keys, order in zip(self._sort_keys, self._sorted)]
+
+    def __len__(self):
+        return len(self.labels)
+
+    def _term_frequencies(self, labels):
+        rows, features = _ngram_features(labels, self.ngram_sizes, self.n_features)
+        tf = sparse.csr_matrix((np.ones(len(rows), dtype=np.float32), (rows, features)),
+                               shape=(len(labels), self.n_features))
+        tf.sum_duplicates()
+        tf.data = 1 + np.log(tf.data)
+        return tf
+
+    def _weigh(self, tf):
+        return _l2_normalize(tf.multiply(self.idf).tocsr())
+
+    def _signatures(self, vectors):
+        """Sign bits (rows x SIGNATURE_BITS) of the random projections of `vectors`."""
+        bits = np.zeros((vectors.shape[0], SIGNATURE_BITS), dtype=bool)
+        for start in range(0, vectors.shape[0], BATCH_SIZE):
+            bits[start:start + BATCH_SIZE] = (vectors[start:start + BATCH_SIZE] @ self._planes).toarray() > 0
+        return bits
+
+    @staticmethod
+    def _sort_key(signatures, order, groups):
+        """Group in the top 16 bits, then the first 48 signature bits in permutation `order`."""
+        packed = np.ascontiguousarray(np.packbits(signatures[:, order[:64]], axis=1)).view(">u8").ravel()
+        packed = packed.astype(np.uint64)
+        return (groups.astype(np.uint64) << np.uint64(48)) | (packed >> np.uint64(16))
+
+    def similarity(self, rows, other_rows, other_vectors=None):
+        """Cosine similarity of each pair (rows[i], other_rows[i]), computed in batches."""
+        other_vectors = self.vectors if other_vectors is None else other_vectors
+        similarities = np.empty(len(rows), dtype=np.float32)
+        for start in range(0, len(rows), BATCH_SIZE):
+            end = start + BATCH_SIZE
+            products = self.vectors[rows[start:end]].multiply(other_vectors[other_rows[start:end]])
+            similarities[start:end] = np.asarray(products.sum(axis=1)).ravel()
+        return similarities
+
+    def hamming(self, rows, other_rows):
+        """Number of differing signature bits of each pair; about SIGNATURE_BITS * angle / pi."""
+        return _POPCOUNT[self._packed[rows] ^ self._packed[other_rows]].sum(axis=1)
+
+    def candidate_pairs(self, threshold=CLUSTER_THRESHOLD):
+        """Unique (i, j) row pairs, i < j, that sort within `window` rows of each other for some bit
+        order and whose signatures are close enough for a cosine similarity of `threshold`."""
+        n = len(self.labels)
+        max_bits = _max_hamming(threshold)
+        keys = np.zeros(0, dtype=np.int64)
+        for sort_keys, order in zip(self._sort_keys, self._sorted):
+            found = [keys]
+            for offset in range(1, self.window + 1):
+                first, second = order[:-offset], order[offset:]
+                keep = (sort_keys[first] >> np.uint64(48)) == (sort_keys[second] >> np.uint64(48))
+                first, second = first[keep], second[keep]
+                keep = self.hamming(first, second) <= max_bits
+                first, second = first[keep], second[keep]
+                found.append(np.minimum(first, second) * n + np.maximum(first, second))
+            # Deduplicated per bit order, so the same pair found by every order is kept once
+            keys = np.unique(np.concatenate(found))
+        return keys // n, keys % n
+
+    def similar_pairs(self, threshold=CLUSTER_THRESHOLD):
+        """(rows, other_rows, similarities) of the candidate pairs whose cosine similarity is >= `threshold`."""
+        rows, other_rows = self.candidate_pairs(threshold)
+        similarities = self.similarity(rows, other_rows)
+        keep = similarities >= threshold
+        return rows[keep], other_rows[keep], similarities[keep]
+
+    def clusters(self, threshold=CLUSTER_THRESHOLD):
+        """Cluster id of every label: the connected components of the similar pairs."""
+        n = len(self.labels)
+        rows, other_rows, _ = self.similar_pairs(threshold)
+        graph = sparse.csr_matrix((np.ones(len(rows), dtype=np.int8), (rows, other_rows)), shape=(n, n))
+        return connected_components(graph, directed=False)[1]
+
+    def canonical(self, clusters, weights=None):
+        """Row index, per cluster, of the label closest to the (weighted) centroid of its cluster."""
+        n = len(self.labels)
+        if not n:
+            return np.zeros(0, dtype=np.int64)
+        weights = np.ones(n, dtype=np.float32) if weights is None else np.asarray(weights, dtype=np.float32)
+        n_clusters = clusters.max() + 1
+        membership = sparse.csr_matrix((weights, (clusters, np.arange(n))), shape=(n_clusters, n))
+        centroids = membership @ self.vectors
+        similarities = self.similarity(np.arange(n), clusters, centroids)
+        # Most central member first within each cluster; ties keep the first label seen
+        order = np.lexsort((-similarities, clusters))
+        first = np.ones(n, dtype=bool)
+        first[1:] = clusters[order][1:] != clusters[order][:-1]
+        return order[first]
+
+    def nearest(self, labels, groups=None, k=5, threshold=0.0):
+        """The up to `k` indexed labels most similar to each of `labels`, as lists of (row, similarity).
+
+        Only rows that sort next to a query for some bit order are compared, so this is
+        approximate; `groups` must use the names the index was built with.
+        """
+        m = len(labels)
+        if groups is None:
+            query_groups = np.zeros(m, dtype=np.int64)
+        else:
+            lookup = {name: idx for idx, name in enumerate(self.group_names)}
+            # Unknown groups get an id no indexed row has
+            query_groups = np.array([lookup.get(str(group), len(lookup)) for group in groups], dtype=np.int64)
+        vectors = self._weigh(self._term_frequencies(list(labels)))
+        signatures = self._signatures(vectors)
+
+        queries, rows = [], []
+        offsets = np.arange(-self.window, self.window)
+        for sorted_keys, order, permutation in zip(self._sorted_keys, self._sorted, self._permutations):
+            query_keys = self._sort_key(signatures, permutation, query_groups)
+            positions = np.searchsorted(sorted_keys, query_keys)[:, None] + offsets
+            valid = (positions >= 0) & (positions < len(order))
+            candidates = order[np.clip(positions, 0, max(len(order) - 1, 0))]
+            valid &= self.groups[candidates] == query_groups[:, None]
+            queries.append(np.broadcast_to(np.arange(m)[:, None], positions.shape)[valid])
+            rows.append(candidates[valid])
+
+        neighbours = [[] for _ in range(m)]
+        if not rows or not len(self.labels):
+            return neighbours
+        n = len(self.labels)
+        keys = np.unique(np.concatenate(queries) * n + np.concatenate(rows))
+        queries, rows = keys // n, keys % n
+        similarities = np.asarray(vectors[queries].multiply(self.vectors[rows]).sum(axis=1)).ravel()
+        keep = similarities >= threshold
+        queries, rows, similarities = queries[keep], rows[keep], similarities[keep]
+        for position in np.lexsort((-similarities, queries)):
+            if len(neighbours[queries[position]]) < k:
+                neighbours[queries[position]].append((int(rows[position]), float(similarities[position])))
+        return neighbours
+
+
+def cluster_labels(labels, groups=None, weights=None, threshold=CLUSTER_THRESHOLD, **index_options):
+    """Cluster labels that say the same thing.
+
+    Returns (cluster of each label, index of the canonical label of each cluster,
+    support of each cluster), where the support is the sum of the `weights` (default 1)
+    of its labels. `index_options` are passed on to LabelIndex.
+    """
+    index = LabelIndex(labels, groups, **index_options)
+    clusters = index.clusters(threshold)
+    canonical = index.canonical(clusters, weights)
+    weights = np.ones(len(index)) if weights is None else np.asarray(weights, dtype=float)
+    support = np.bincount(clusters, weights=weights, minlength=len(canonical))
+    return clusters, canonical, support
@@ -0,0 +1,14 @@
+import os
+import sqlite3
+
+
+def connect(path):
+    """Open the SQLite database at `path` (creating its directory) for use from several threads and processes.
+
+    WAL mode lets readers run while another process writes; writers wait up to 30 s for the lock.
+    """
+    if os.path.dirname(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+    conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+    conn.execute("PRAGMA journal_mode=WAL")
+    return conn
@@ -0,0 +1,63 @@
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# The modules live at the repository root and the OpenGov fixture under benchmarks/
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, "benchmarks"))
+
+
+@pytest.fixture
+def opengov(tmp_path):
+    """Start local OpenGov fixtures (benchmarks/fake_opengov.py) with a fresh validator store and robots.txt cache."""
+    from ArticleExtraction import configure_validator_store, robots_cache
+    from fake_opengov import OpenGovFixture
+
+    configure_validator_store(str(tmp_path / "http_cache.sqlite"))
+    robots_cache.clear()
+    fixtures = []
+
+    def start(**kwargs):
+        fixture = OpenGovFixture(**kwargs).start()
+        fixtures.append(fixture)
+        return fixture
+
+    yield start
+    for fixture in fixtures:
+        fixture.stop()
+    robots_cache.clear()
+    configure_validator_store()
+
+
+@pytest.fixture
+def bedrock(tmp_path, monkeypatch):
+    """Route the model calls to fake Bedrock clients (benchmarks/fake_bedrock.py) with an empty LLM cache.
+
+    Call it with the FakeBedrockClient arguments; each call installs a new client.
+    """
+    pytest.importorskip("langchain_experimental")
+    pytest.importorskip("langchain_aws")
+    import credentials
+    import models
+    from fake_bedrock import FakeBedrockClient
+    from llm_cache import configure_cache
+
+    # ChatBedrock wants a region and credentials even when its client is replaced
+    monkeypatch.setenv("AWS_DEFAULT_REGION", "us-east-1")
+    monkeypatch.setenv("AWS_ACCESS_KEY_ID", "test")
+    monkeypatch.setenv("AWS_SECRET_ACCESS_KEY", "test")
+    # Stages write their output/ files relative to the working directory
+    monkeypatch.chdir(tmp_path)
+    configure_cache(path=str(tmp_path / "llm_cache.sqlite"))
+
+    def install(**kwargs):
+        client = FakeBedrockClient(latency=0, **kwargs)
+        models.refresh()
+        credentials.set_bedrock_client(client)
+        return client
+
+    yield install
+    models.refresh()
+    configure_cache()
@@ -0,0 +1,51 @@
+import os
+
+import pytest
+
+from batch import comments_for, job_name, read_jobs
+
+
+def test_job_name_and_comments_path():
+    url = "https://www.opengov.gr/ypepth/?p=6501"
+    assert job_name(url) == "ypepth_6501"
+    assert job_name("https://www.opengov.gr/minedu/") == "minedu"
+    assert comments_for(url, "exports/{ministry}/{p}.xlsx") == "exports/ypepth/6501.xlsx"
+    assert comments_for(url, "{name}.csv") == "ypepth_6501.csv"
+
+
+def test_read_jobs(tmp_path):
+    path = tmp_path / "jobs.txt"
+    path.write_text("# ministry of education\n"
+                    "https://www.opengov.gr/ypepth/?p=6501 comments/6501.xlsx\n"
+                    "\n"
+                    "https://www.opengov.gr/ypepth/?p=6502  # no export yet\n", encoding="utf-8")
+
+    assert read_jobs(str(path)) == [
+        {"url": "https://www.opengov.gr/ypepth/?p=6501", "comments": "comments/6501.xlsx"},
+        {"url": "https://www.opengov.gr/ypepth/?p=6502", "comments": None},
+    ]
+
+
+def test_single_worker_batch(opengov, bedrock, tmp_path):
+    pytest.importorskip("requests")
+    pytest.importorskip("bs4")
+    from batch import run_batch
+    from fake_opengov import write_comments_csv
+
+    fixture = opengov(consultations=2, articles=2, comments_per_article=2)
+    bedrock()
+    with_comments, without_comments = fixture.consultation_urls
+    jobs = [{"url": with_comments, "comments": write_comments_csv(str(tmp_path / "comments.csv"), 2, 2)},
+            # Falls back to the export linked from the consultation page
+            {"url": without_comments, "comments": None}]
+
+    summaries = list(run_batch(jobs, workers=1, output_root=str(tmp_path / "consultations"),
+                               cache_path=str(tmp_path / "llm_cache.sqlite"),
+                               graph_db_path=str(tmp_path / "graph.sqlite"),
+                               dead_letter_path=str(tmp_path / "dead_letters.sqlite"), min_interval=0.0))
+
+    assert [summary["url"] for summary in summaries] == [with_comments, without_comments]
+    for summary in summaries:
+        assert "error" not in summary
+        assert summary["nodes"] > 0 and summary["dead_letters"] == 0
+        assert os.path.exists(os.path.join(summary["output_dir"], "checkpoints.sqlite"))
@@ -0,0 +1,19 @@
+from comments import index_comments, join_comments
+
+
+def test_join_keeps_only_the_comments_of_scraped_articles():
+    posts = [{"Title": ["Άρθρο 1 - Σκοπός"], "Content": ["Κείμενο"]}, {"Title": [], "Content": []}]
+    rows = iter([("Άρθρο 1 – Σκοπός", "α"), ("Άρθρο 2", "β"), ("Άρθρο 1 Σκοπός", "γ"), ("Άρθρο 2", "δ")])
+
+    article_comment, unmatched = join_comments(posts, rows)
+
+    assert article_comment == [{"Title": "Άρθρο 1 - Σκοπός", "Content": "Κείμενο", "Comments": ["α", "γ"]}]
+    assert unmatched == {"Άρθρο 2": 2}
+
+
+def test_index_groups_comments_per_article():
+    index = index_comments(iter([("Άρθρο 1", "α"), ("Άρθρο 2", "β"), ("Άρθρο 1", "γ")]), keys={"Άρθρο 1"})
+
+    assert index.get("Άρθρο 1") == ["α", "γ"]
+    assert index.get("Άρθρο 2") is None
+    assert index.counts["Άρθρο 2"] == 1
@@ -0,0 +1,82 @@
+import asyncio
+
+import pytest
+
+pytest.importorskip("requests")
+pytest.importorskip("bs4")
+
+import ArticleExtraction
+from ArticleExtraction import HostRateLimiter, fetch_page, fetch_with_retries, robots_cache, scrape_consultation_posts
+from fake_opengov import article_title
+
+
+def test_crawl_returns_posts_in_consnav_order(opengov):
+    fixture = opengov(articles=5)
+    emitted = []
+
+    posts = scrape_consultation_posts(fixture.consultation_url, max_concurrency=4, min_interval=0.0,
+                                      on_post=emitted.append)
+
+    assert [post["Title"] for post in posts] == [[article_title(number)] for number in range(1, 6)]
+    assert all(post["Content"] for post in posts)
+    assert emitted == posts
+
+
+def test_robots_deny_skips_the_consultation(opengov):
+    fixture = opengov(articles=3, robots_txt="User-agent: *\nDisallow: /\n")
+
+    assert scrape_consultation_posts(fixture.consultation_url, min_interval=0.0) == []
+    # Only robots.txt was requested
+    assert fixture.requests == 1
+
+
+def test_not_found_is_not_retried(opengov):
+    fixture = opengov()
+    url = f"{fixture.base_url}/missing"
+    robots_cache.policy(url)
+    before = fixture.requests
+
+    with pytest.raises(ArticleExtraction.requests.HTTPError):
+        asyncio.run(fetch_with_retries(url, HostRateLimiter(0.0), retries=3, backoff=0.01))
+    assert fixture.requests - before == 1
+
+
+def test_unchanged_page_is_revalidated(opengov):
+    fixture = opengov(articles=2)
+
+    first = fetch_page(fixture.consultation_url)
+    second = fetch_page(fixture.consultation_url)
+
+    assert second == first
+    assert fixture.not_modified == 1
+
+
+def test_requests_to_a_host_are_spaced_by_default(opengov, monkeypatch):
+    fixture = opengov()
+    monkeypatch.setattr(ArticleExtraction, "MIN_INTERVAL", 0.2)
+    limiter = HostRateLimiter()
+    loop_time = []
+
+    async def wait_twice():
+        for _ in range(2):
+            await limiter.wait(fixture.consultation_url)
+            loop_time.append(asyncio.get_running_loop().time())
+
+    asyncio.run(wait_twice())
+    assert limiter.min_interval == 0.2
+    assert loop_time[1] - loop_time[0] >= 0.19
+
+
+def test_interrupted_download_leaves_no_part_file(opengov, tmp_path, monkeypatch):
+    from ArticleExtraction import download_comments
+
+    fixture = opengov(articles=2)
+    directory = tmp_path / "exports"
+
+    def interrupt(field, value=1):
+        raise KeyboardInterrupt
+
+    monkeypatch.setattr(ArticleExtraction, "count", interrupt)
+    with pytest.raises(KeyboardInterrupt):
+        download_comments(f"{fixture.base_url}/export?p=1", str(directory))
+    assert list(directory.iterdir()) == []
@@ -0,0 +1,60 @@
+import json
+
+from graph_db import GraphDB
+from graph_store import GraphNode
+
+
+def article_graph(article, issue, positions, support=None):
+    nodes = [GraphNode(article, "Article", {}), GraphNode(issue, "Issue", {})]
+    relationships = [{'source_id': article, 'target_id': issue, 'type': "HAS", 'properties': {}}]
+    for position in positions:
+        nodes.append(GraphNode(position, "Position", {"support": support} if support else {}))
+        relationships.append({'source_id': issue, 'target_id': position, 'type': "HAS_POSITION", 'properties': {}})
+    return {'nodes': nodes, 'relationships': relationships}
+
+
+def test_write_article_replaces_only_its_own_edges(tmp_path):
+    db = GraphDB(str(tmp_path / "graph.sqlite"))
+    db.write_article("https://a", "Άρθρο 1", article_graph("Άρθρο 1", "Θέμα 1", ["Θέση 1", "Θέση 2"]))
+    db.write_article("https://b", "Άρθρο 1", article_graph("Άρθρο 1", "Θέμα 1", ["Θέση 3"]))
+    db.write_article("https://a", "Άρθρο 1", article_graph("Άρθρο 1", "Θέμα 1", ["Θέση 1"]))
+
+    assert db.articles("https://a") == ["Άρθρο 1"]
+    assert db.issues_of_article("Άρθρο 1", "https://b") == ["Θέμα 1"]
+    assert sorted(db.positions_on_issue("Θέμα 1")) == ["Θέση 1", "Θέση 3"]
+    assert db.positions_on_issue("θέμα 1", "https://a") == ["Θέση 1"]
+    db.close()
+
+
+def test_export_and_import_round_trip(tmp_path):
+    source = GraphDB(str(tmp_path / "source.sqlite"))
+    source.write_article("https://a", "Άρθρο 1", article_graph("Άρθρο 1", "Θέμα 1", ["Θέση 1", "Θέση 2"]))
+    source.export_jsonl(str(tmp_path / "graph.jsonl"))
+
+    target = GraphDB(str(tmp_path / "target.sqlite"))
+    target.write_article("https://b", "Άρθρο 2", article_graph("Άρθρο 2", "Θέμα 2", ["Θέση 3"]))
+    target.import_jsonl(str(tmp_path / "graph.jsonl"))
+
+    assert sorted(target.articles()) == ["Άρθρο 1", "Άρθρο 2"]
+    assert sorted(target.positions_on_issue("Θέμα 1", "https://a")) == ["Θέση 1", "Θέση 2"]
+    assert target.positions_on_issue("Θέμα 2") == ["Θέση 3"]
+    source.close()
+    target.close()
+
+
+def node_properties(db, label):
+    row = db._conn.execute("SELECT properties FROM nodes WHERE label = ?", (label,)).fetchone()
+    return json.loads(row[0])
+
+
+def test_support_adds_up_across_articles(tmp_path):
+    db = GraphDB(str(tmp_path / "graph.sqlite"))
+    db.write_article("https://a", "Άρθρο 1", article_graph("Άρθρο 1", "Θέμα 1", ["Θέση 1"], support=2))
+    db.write_article("https://a", "Άρθρο 2", article_graph("Άρθρο 2", "Θέμα 1", ["θέση 1."], support=5))
+    assert node_properties(db, "Θέση 1")["support"] == 7
+    assert "support" not in node_properties(db, "Θέμα 1")
+
+    # Writing an article again replaces its share instead of adding it twice
+    db.write_article("https://a", "Άρθρο 1", article_graph("Άρθρο 1", "Θέμα 1", ["Θέση 1"], support=3))
+    assert node_properties(db, "Θέση 1")["support"] == 8
+    db.close()
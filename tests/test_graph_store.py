@@ -0,0 +1,58 @@
+import pytest
+
+from graph_store import GraphStore
+
+
+def test_edges_with_nested_properties_are_deduplicated():
+    store = GraphStore()
+    source, target = store.add_node("Θέμα 1", "Issue"), store.add_node("Θέση 1", "Position")
+
+    assert store.add_edge(source, target, "HAS_POSITION", {"comment_ids": [1, 2], "meta": {"b": [3], "a": 1}})
+    assert not store.add_edge(source, target, "HAS_POSITION", {"meta": {"a": 1, "b": [3]}, "comment_ids": [1, 2]})
+    assert store.add_edge(source, target, "HAS_POSITION", {"comment_ids": [2, 1]})
+    assert store.add_edge(source, target, "HAS_POSITION")
+    assert not store.add_edge(source, target, "HAS_POSITION", {})
+    assert len(store.edges) == 3
+
+
+def position_doc(*labels):
+    from langchain.docstore.document import Document
+    from langchain_community.graphs.graph_document import GraphDocument, Node, Relationship
+
+    issue = Node(id="Θέμα 1", type="Issue")
+    positions = [Node(id=label, type="Position") for label in labels]
+    return GraphDocument(nodes=[issue] + positions,
+                         relationships=[Relationship(source=issue, target=position, type="HAS_POSITION")
+                                        for position in positions],
+                         source=Document(page_content="Σχόλιο"))
+
+
+def support(store, node_id):
+    return store.node_properties[store.node_index(node_id)].get("support", 1)
+
+
+def test_support_counts_normalized_duplicates_and_other_articles():
+    pytest.importorskip("langchain_community")
+    store = GraphStore(normalize=True)
+    store.add_graph_documents([position_doc("Η πλατφόρμα είναι χρήσιμη"), position_doc("η πλατφόρμα είναι χρήσιμη.")])
+    assert support(store, "Η πλατφόρμα είναι χρήσιμη") == 2
+    assert "support" not in store.node_properties[store.node_index("Θέμα 1")]
+
+    consultation = GraphStore(normalize=True)
+    consultation.add_merged_graph(store.to_dict())
+    consultation.add_merged_graph(store.to_dict())
+    assert support(consultation, "Η πλατφόρμα είναι χρήσιμη") == 4
+
+
+def test_semantic_merge_adds_up_the_support_of_duplicates():
+    pytest.importorskip("langchain_community")
+    pytest.importorskip("scipy")
+    store = GraphStore(normalize=True)
+    store.add_graph_documents([position_doc("Η ψηφιακή πλατφόρμα των σχολείων είναι χρήσιμη"),
+                               position_doc("Η ψηφιακή πλατφόρμα των σχολείων είναι χρήσιμη"),
+                               position_doc("Η ψηφιακή πλατφόρμα για τα σχολεία είναι πολύ χρήσιμη")])
+
+    assert store.semantic_merge(0.5) == 1
+    positions = [idx for idx in store.live_nodes() if store.node_types[idx] == "Position"]
+    assert len(positions) == 1
+    assert store.node_properties[positions[0]]["support"] == 3
@@ -0,0 +1,18 @@
+import pytest
+
+from issue import issue_extraction
+from llm_cache import get_cache
+from rate_limit import ModelCallFailed
+
+
+def test_truncated_issue_replies_fail_and_are_not_cached(bedrock):
+    bedrock(truncated_issues=True)
+    with pytest.raises(ModelCallFailed):
+        issue_extraction("Άρθρο 1\nΗ ψηφιακή πλατφόρμα των σχολείων.")
+    assert get_cache().stats()["entries"] == 0
+
+    client = bedrock()
+    graph_documents = issue_extraction("Άρθρο 1\nΗ ψηφιακή πλατφόρμα των σχολείων.")
+    assert any(node.type == "Issue" for doc in graph_documents for node in doc.nodes)
+    assert client.calls == 1
+    assert get_cache().stats()["entries"] == 1
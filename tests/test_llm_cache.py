@@ -0,0 +1,20 @@
+from llm_cache import LLMCache
+
+
+def test_limits_hold_after_every_write(tmp_path):
+    cache = LLMCache(str(tmp_path / "cache.sqlite"), max_entries=3)
+    for number in range(10):
+        cache.set(LLMCache.key("model", "v1", number), "x" * 10)
+        assert cache.stats()["entries"] <= 3
+    # The most recently written entries are kept
+    assert cache.get(LLMCache.key("model", "v1", 9))[0]
+    assert not cache.get(LLMCache.key("model", "v1", 0))[0]
+    cache.close()
+
+
+def test_byte_limit(tmp_path):
+    cache = LLMCache(str(tmp_path / "cache.sqlite"), max_bytes=200)
+    for number in range(10):
+        cache.set(LLMCache.key("model", "v1", number), "x" * 50)
+        assert cache.stats()["bytes"] <= 200
+    cache.close()
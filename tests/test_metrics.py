@@ -0,0 +1,41 @@
+import json
+
+from metrics import configure_metrics, count, record_usage, reset_usage, span, usage_report
+
+
+def test_usage_report_starts_over_after_reset():
+    record_usage("issues", {"input_tokens": 100, "output_tokens": 10})
+    reset_usage()
+    record_usage("issues", {"input_tokens": 50, "output_tokens": 5})
+
+    assert usage_report()["issues"]["calls"] == 1
+    assert usage_report()["issues"]["input_tokens"] == 50
+
+
+def test_nested_span_counters_add_up_to_the_parent():
+    with span("consultation") as consultation:
+        with span("article"):
+            count("bytes", 3)
+            with span("llm"):
+                count("bytes", 4)
+        count("bytes", 5)
+
+    assert consultation.own["bytes"] == 5
+    assert consultation.totals["bytes"] == 12
+
+
+def test_jsonl_sink_writes_one_record_per_span(tmp_path):
+    path = tmp_path / "metrics.jsonl"
+    configure_metrics(str(path))
+    try:
+        with span("consultation") as consultation:
+            with span("article", title="Άρθρο 1"):
+                count("bytes", 3)
+    finally:
+        configure_metrics(None)
+
+    records = [json.loads(line) for line in path.read_text(encoding="utf-8").splitlines()]
+    assert [record["span"] for record in records] == ["article", "consultation"]
+    assert records[0]["parent"] == consultation.id
+    assert records[0]["attributes"] == {"title": "Άρθρο 1"}
+    assert records[1]["counters"] == {"bytes": 3}
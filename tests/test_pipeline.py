@@ -0,0 +1,113 @@
+import pytest
+
+pytest.importorskip("requests")
+pytest.importorskip("bs4")
+
+from ArticleExtraction import robots_cache
+from checkpoints import CheckpointStore
+from pipeline import scrape_stage
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = CheckpointStore(str(tmp_path / "checkpoints.sqlite"))
+    yield store
+    store.close()
+
+
+def test_failed_crawl_is_not_checkpointed(opengov, store):
+    fixture = opengov(articles=3, robots_txt="User-agent: *\nDisallow: /\n")
+
+    assert scrape_stage(store, fixture.consultation_url, min_interval=0.0) == []
+    assert store.get("scrape", fixture.consultation_url) == (False, None)
+
+    fixture.robots_txt = "User-agent: *\nAllow: /\n"
+    robots_cache.clear()
+    posts = scrape_stage(store, fixture.consultation_url, min_interval=0.0)
+    assert len(posts) == 3
+    assert store.get("scrape", fixture.consultation_url) == (True, posts)
+
+
+def test_checkpoint_with_a_failed_article_is_crawled_again(opengov, store):
+    fixture = opengov(articles=2)
+    store.put("scrape", fixture.consultation_url, None,
+              [{"Title": ["Άρθρο"], "Content": ["Κείμενο"]}, {"Title": [], "Content": []}])
+
+    posts = scrape_stage(store, fixture.consultation_url, min_interval=0.0)
+
+    assert all(post["Title"] and post["Content"] for post in posts)
+    assert store.get("scrape", fixture.consultation_url) == (True, posts)
+
+
+def test_streamed_failed_crawl_is_not_checkpointed(opengov, store, tmp_path, monkeypatch):
+    from fake_opengov import write_comments_csv
+    from pipeline import stream_articles_stage
+
+    # The comments export is cached under output/ when pyarrow is installed
+    monkeypatch.chdir(tmp_path)
+    fixture = opengov(articles=2, robots_txt="User-agent: *\nDisallow: /\n")
+    comments_path = write_comments_csv(str(tmp_path / "comments.csv"), 2, 3)
+    emitted = []
+
+    assert stream_articles_stage(store, fixture.consultation_url, comments_path, False, emitted.append, 0.0) == []
+    assert store.items("scrape") == [] and store.items("join") == []
+
+    fixture.robots_txt = "User-agent: *\nAllow: /\n"
+    robots_cache.clear()
+    articles = stream_articles_stage(store, fixture.consultation_url, comments_path, False, emitted.append, 0.0)
+    assert [len(article["Comments"]) for article in articles] == [3, 3]
+    assert emitted == articles
+    assert store.items("scrape") == [fixture.consultation_url]
+
+
+def test_prompt_version_bump_recomputes_the_model_stages(bedrock, store, monkeypatch):
+    import issue
+    import langwithpydantic
+    from pipeline import issues_stage, positions_stage
+
+    article = "Άρθρο 1\nΗ ψηφιακή πλατφόρμα των σχολείων."
+    comments = ["Συμφωνώ με την πλατφόρμα."]
+    client = bedrock()
+    issue_nodes = issues_stage(store, "Άρθρο 1", article)
+    positions_stage(store, "Άρθρο 1", issue_nodes, comments)
+    assert client.calls == 2
+
+    client = bedrock()
+    issues_stage(store, "Άρθρο 1", article)
+    positions_stage(store, "Άρθρο 1", issue_nodes, comments)
+    assert client.calls == 0
+
+    monkeypatch.setattr(issue, "PROMPT_VERSION", "issue-test")
+    monkeypatch.setattr(langwithpydantic, "PROMPT_VERSION", "position-test")
+    issues_stage(store, "Άρθρο 1", article)
+    positions_stage(store, "Άρθρο 1", issue_nodes, comments)
+    assert client.calls == 2
+
+
+def test_clustered_consultation_graph_is_rendered(opengov, bedrock, tmp_path, monkeypatch):
+    pytest.importorskip("scipy")
+    pytest.importorskip("pyvis")
+    import json
+
+    import pipeline
+    from fake_opengov import write_comments_csv
+    from graph_db import GraphDB
+    from rate_limit import DeadLetterQueue
+
+    monkeypatch.setattr(pipeline, "SEMANTIC_MERGE_THRESHOLD", 0.8)
+    fixture = opengov(articles=2)
+    bedrock()
+    output_dir = tmp_path / "consultation"
+    graph_db = GraphDB(str(tmp_path / "graph.sqlite"))
+    dead_letters = DeadLetterQueue(str(tmp_path / "dead_letters.sqlite"))
+
+    graph = pipeline.run(fixture.consultation_url, write_comments_csv(str(tmp_path / "comments.csv"), 2, 3),
+                         store=CheckpointStore(str(tmp_path / "checkpoints.sqlite")), graph_db=graph_db,
+                         dead_letters=dead_letters, output_dir=str(output_dir), min_interval=0.0)
+
+    html = (output_dir / pipeline.CONSULTATION_HTML).read_text(encoding="utf-8")
+    # pyvis embeds the node ids as ASCII-escaped JSON
+    assert len(graph) > 0
+    assert all(json.dumps(node.id)[1:-1] in html for node in graph.to_dict()['nodes'])
+    graph_db.close()
+    dead_letters.close()
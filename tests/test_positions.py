@@ -0,0 +1,46 @@
+import pytest
+
+from langwithpydantic import extract_positions
+from llm_cache import CacheMiss, get_cache
+
+
+def issue_nodes():
+    from langchain.docstore.document import Document
+    from langchain_community.graphs.graph_document import GraphDocument, Node
+
+    return [GraphDocument(nodes=[Node(id="Θέμα 1", type="Issue")], relationships=[],
+                          source=Document(page_content="Άρθρο"))]
+
+
+def positions(results):
+    return [[node.id for doc in docs for node in doc.nodes if node.type == "Position"] for docs in results]
+
+
+def test_comments_without_positions_are_cached(bedrock):
+    comments = ["Ευχαριστούμε για τη διαβούλευση.", "Καλή επιτυχία."]
+
+    client = bedrock(positions=False)
+    results = extract_positions(issue_nodes(), comments, serial=True)
+    assert client.calls == 1
+    assert positions(results) == [[], []]
+
+    client = bedrock(positions=False)
+    assert extract_positions(issue_nodes(), comments, serial=True) == results
+    assert client.calls == 0
+
+    get_cache().cache_only = True
+    assert extract_positions(issue_nodes(), comments, serial=True) == results
+
+
+def test_truncated_chunks_are_split_and_not_cached(bedrock):
+    comments = ["Συμφωνώ με το άρθρο.", "Διαφωνώ με το άρθρο."]
+
+    client = bedrock(max_output_comments=1)
+    results = extract_positions(issue_nodes(), comments, serial=True)
+    assert client.calls == 3
+    assert all(positions(results))
+
+    get_cache().cache_only = True
+    with pytest.raises(CacheMiss):
+        extract_positions(issue_nodes(), comments, serial=True)
+
@@ -0,0 +1,40 @@
+from relevance.prefilter import AMBIGUOUS, IRRELEVANT, RELEVANT, filter_relevant, find_duplicates, prefilter_comments
+
+ARTICLE = ("Άρθρο 5 Ψηφιακή πλατφόρμα σχολείων. Η ψηφιακή πλατφόρμα των σχολείων συγκεντρώνει τις εργασίες "
+           "των μαθητών και τους βαθμούς τους, και οι εκπαιδευτικοί την ενημερώνουν κάθε εβδομάδα.")
+ON_TOPIC = "Η ψηφιακή πλατφόρμα των σχολείων βοηθά τους εκπαιδευτικούς να ενημερώνουν τους βαθμούς των μαθητών."
+OFF_TOPIC = "Ο καιρός στη Θεσσαλονίκη ήταν υπέροχος σήμερα το απόγευμα στην παραλία."
+
+
+def test_find_duplicates_links_exact_and_near_copies_to_the_first():
+    comments = [ON_TOPIC, OFF_TOPIC, ON_TOPIC.upper(), ON_TOPIC + "!", "Κάτι εντελώς διαφορετικό για τα λεωφορεία."]
+
+    assert find_duplicates(comments) == [None, None, 0, 0, None]
+
+
+def test_prefilter_labels_short_spam_on_and_off_topic_comments():
+    comments = ["Συμφωνώ", "http://spam.example/1234 5678 9012", ON_TOPIC, OFF_TOPIC, ON_TOPIC.lower()]
+
+    labels, duplicate_of, stats = prefilter_comments(ARTICLE, comments)
+
+    assert labels == [IRRELEVANT, IRRELEVANT, RELEVANT, IRRELEVANT, RELEVANT]
+    assert duplicate_of == [None, None, None, None, 2]
+    assert stats["too_short"] == 1 and stats["not_text"] == 1 and stats["duplicates"] == 1
+    assert stats["llm_calls_skipped"] == 5
+
+
+def test_filter_relevant_scores_only_ambiguous_originals():
+    comments = [ON_TOPIC, OFF_TOPIC, "Οι μαθητές χρειάζονται περισσότερη υποστήριξη στο σπίτι.",
+                "Οι μαθητές χρειάζονται περισσότερη υποστήριξη στο σπίτι."]
+    config = {"drop_similarity": 0.0, "keep_similarity": 1.1}
+    labels, _, _ = prefilter_comments(ARTICLE, comments, config)
+    assert labels == [AMBIGUOUS] * 4
+    scored = []
+
+    def score_comments(article, batch):
+        scored.extend(batch)
+        return [80, 10, 60]
+
+    assert filter_relevant(ARTICLE, comments, score_comments, threshold=50, config=config) == [
+        comments[0], comments[2], comments[3]]
+    assert scored == comments[:3]
@@ -0,0 +1,25 @@
+import pytest
+
+import rate_limit
+from rate_limit import ModelCallFailed, ModelRateLimiter, RetryScheduler
+
+
+class ThrottlingError(Exception):
+    response = {"Error": {"Code": "ThrottlingException"}}
+
+
+def test_failed_attempts_refund_their_token_reservation(monkeypatch):
+    monkeypatch.setattr(rate_limit.time, "sleep", lambda seconds: None)
+    limiter = ModelRateLimiter(rpm=1000, tpm=100000)
+    scheduler = RetryScheduler(limiter, retries=3, base_delay=0)
+    attempts = []
+
+    def throttled():
+        attempts.append(1)
+        raise ThrottlingError("Rate exceeded")
+
+    with pytest.raises(ModelCallFailed):
+        scheduler.call(throttled, tokens=10000)
+    assert len(attempts) == 4
+    # Every reservation came back, so the bucket is still full at its throttled rate
+    assert limiter.tokens.tokens >= limiter.tokens.rate_per_minute
@@ -0,0 +1,61 @@
+from llm_cache import get_cache
+from relevance.prefilter import filter_relevant
+from relevance.relevance_claude import relevance_claude_batch
+
+ARTICLE = "Άρθρο 1\nΗ ψηφιακή πλατφόρμα των σχολείων."
+COMMENTS = ["Η πλατφόρμα χρειάζεται εκπαίδευση των εκπαιδευτικών.", "Τα σχολεία δεν έχουν εξοπλισμό."]
+
+
+def test_unparsable_scores_are_not_cached(bedrock):
+    client = bedrock(garbled_scores=True)
+    assert relevance_claude_batch(ARTICLE, COMMENTS) == [None, None]
+    # One batch call, then one call per comment
+    assert client.calls == 3
+    assert filter_relevant(ARTICLE, COMMENTS, lambda article, comments: [None, None],
+                           config={"drop_similarity": 0.0, "keep_similarity": 1.1}) == []
+
+    client = bedrock()
+    scores = relevance_claude_batch(ARTICLE, COMMENTS)
+    assert all(isinstance(score, int) for score in scores)
+    assert client.calls == 1
+
+    client = bedrock()
+    assert relevance_claude_batch(ARTICLE, COMMENTS) == scores
+    assert client.calls == 0
+    assert get_cache().stats()["entries"] == 2
+
+
+def test_relevance_stage_is_not_checkpointed_with_unparsable_scores(bedrock, tmp_path, monkeypatch):
+    import pipeline
+    from checkpoints import CheckpointStore
+
+    monkeypatch.setattr(pipeline, "PREFILTER_CONFIG", {"drop_similarity": 0.0, "keep_similarity": 1.1})
+    store = CheckpointStore(str(tmp_path / "checkpoints.sqlite"))
+    bedrock(garbled_scores=True)
+    assert pipeline.relevance_stage(store, "Άρθρο 1", ARTICLE, COMMENTS) == []
+    assert store.items("relevance") == []
+
+    bedrock()
+    pipeline.relevance_stage(store, "Άρθρο 1", ARTICLE, COMMENTS)
+    assert store.items("relevance") == ["Άρθρο 1"]
+    store.close()
+
+
+def test_relevance_stage_recomputes_when_the_prefilter_config_changes(tmp_path, monkeypatch):
+    import pipeline
+    from checkpoints import CheckpointStore
+
+    store = CheckpointStore(str(tmp_path / "checkpoints.sqlite"))
+    monkeypatch.setattr(pipeline, "PREFILTER_CONFIG", {"drop_similarity": -1.0, "keep_similarity": -1.0})
+    assert pipeline.relevance_stage(store, "Άρθρο 1", ARTICLE, COMMENTS) == COMMENTS
+
+    monkeypatch.setattr(pipeline, "PREFILTER_CONFIG", {"drop_similarity": 1.1, "keep_similarity": 1.1})
+    assert pipeline.relevance_stage(store, "Άρθρο 1", ARTICLE, COMMENTS) == []
+    store.close()
+
+
+def test_replies_without_content_are_unparsable(bedrock):
+    client = bedrock(empty_scores=True)
+    assert relevance_claude_batch(ARTICLE, COMMENTS) == [None, None]
+    assert client.calls == 3
+    assert get_cache().stats()["entries"] == 0